@@ -1,12 +1,101 @@
 # Copyright 2010-2012 RethinkDB, all rights reserved.
 from collections import namedtuple
-import struct
+import mmap, struct
+
+# Parsers take a block and an offset and return (value, offset after the value). The ones with a fixed layout are
+# `Parser` objects, which `make_struct` and `parse_array` compile into a single `struct.Struct`. Layouts use '='
+# (native byte order, no alignment) so that a compiled struct reads exactly what parsing field by field would.
+
+class Parser(object):
+    format = '' # struct format for this layout, without the byte order prefix
+    count = 0   # number of values unpacking `format` produces
+
+    def compile(self):
+        self.struct = struct.Struct('=' + self.format)
+        self.size = self.struct.size
+
+    def build(self, values, index):
+        '''Build this parser's value from the unpacked `values` starting at `index`, returning (value, next index)'''
+        raise NotImplementedError()
+
+    def __call__(self, block, offset = 0):
+        value, _ = self.build(self.struct.unpack_from(block, offset), 0)
+        return value, offset + self.size
+
+class Prim(Parser):
+    count = 1
+
+    def __init__(self, format):
+        self.format = format
+        self.compile()
+
+    def build(self, values, index):
+        return values[index], index + 1
+
+    def __call__(self, block, offset = 0):
+        return self.struct.unpack_from(block, offset)[0], offset + self.size
+
+class Padding(Parser):
+    count = 0
+
+    def __init__(self, size):
+        self.format = '%dx' % size
+        self.compile()
+
+    def build(self, values, index):
+        return None, index
+
+    def __call__(self, block, offset = 0):
+        return None, offset + self.size
+
+class Constant(Parser):
+    count = 1
+
+    def __init__(self, string):
+        self.string = string
+        self.format = '%ds' % len(string)
+        self.compile()
+
+    def build(self, values, index):
+        if values[index] != self.string:
+            raise ValueError("Expected %r, got %r." % (self.string, values[index]))
+        return None, index + 1
+
+    def __call__(self, block, offset = 0):
+        val = block[offset : offset + len(self.string)]
+        if val != self.string:
+            raise ValueError("Expected %r, got %r." % (self.string, val))
+        return None, offset + self.size
+
+class Struct(Parser):
+
+    def __init__(self, ty, names_and_parsers):
+        self.ty = ty
+        self.fields = names_and_parsers
+        self.format = ''.join(parser.format for name, parser in names_and_parsers)
+        self.count = sum(parser.count for name, parser in names_and_parsers)
+        # only numbers and padding: the unpacked values are the fields, in order
+        self.flat = all(isinstance(parser, (Prim, Padding)) for name, parser in names_and_parsers)
+        self.compile()
+
+    def build(self, values, index):
+        if self.flat:
+            return self.ty._make(values[index : index + self.count]), index + self.count
+        fields = []
+        for name, parser in self.fields:
+            value, index = parser.build(values, index)
+            if name is not None: fields.append(value)
+        return self.ty._make(fields), index
+
+    def __call__(self, block, offset = 0):
+        assert isinstance(block, (bytes, bytearray, memoryview, mmap.mmap))
+        assert isinstance(offset, int)
+        if self.flat:
+            return self.ty._make(self.struct.unpack_from(block, offset)), offset + self.size
+        return Parser.__call__(self, block, offset)
 
 def parse_prim(format):
-    def parse(block, offset = 0):
-        value, = struct.unpack_from(format, block, offset)
-        return (value, offset + struct.calcsize(format))
-    return parse
+    return Prim(format)
 
 parse_int = parse_prim('i')
 
@@ -19,8 +108,10 @@ parse_off64_t = parse_prim('q')
 
 def make_struct(name, names_and_parsers):
     ty = namedtuple(name, [x[0] for x in names_and_parsers if x[0] is not None])
+    if all(isinstance(parser, Parser) for _, parser in names_and_parsers):
+        return ty, Struct(ty, names_and_parsers)
     def parse(block, offset = 0):
-        assert isinstance(block, str)
+        assert isinstance(block, (bytes, bytearray, memoryview, mmap.mmap))
         assert isinstance(offset, int)
         values = []
         for name, parser in names_and_parsers:
@@ -30,23 +121,33 @@ def make_struct(name, names_and_parsers):
     return ty, parse
 
 def parse_padding(size):
-    def parse(block, offset = 0):
-        return None, offset + size
-    return parse
+    return Padding(size)
 
 def parse_constant(string):
-    def parse(block, offset = 0):
-        val = block[offset : offset + len(string)]
-        if val != string:
-            raise ValueError("Expected %r, got %r." % (string, val))
-        return None, offset + struct.calcsize("%ds" % len(string))
-    return parse
+    return Constant(string)
 
 def parse_array(parser, count):
-    def parse(block, offset = 0):
-        values = []
-        for i in range(count):
-            value, offset = parser(block, offset)
-            values.append(value)
-        return values, offset
+    '''Numbers are returned as a memoryview over the block, without copying. Other fixed layouts are unpacked
+    in one pass, anything else is parsed item by item.'''
+    if isinstance(parser, Prim):
+        def parse(block, offset = 0):
+            end = offset + parser.size * count
+            view = memoryview(block)[offset : end]
+            if len(view) != end - offset:
+                raise struct.error("array of %d %r needs %d bytes at offset %d, only %d are available" % (count, parser.format, end - offset, offset, len(view)))
+            return view.cast('B').cast(parser.format), end
+    elif isinstance(parser, Parser) and parser.size > 0:
+        def parse(block, offset = 0):
+            end = offset + parser.size * count
+            view = memoryview(block)[offset : end]
+            if len(view) != end - offset:
+                raise struct.error("array of %d items needs %d bytes at offset %d, only %d are available" % (count, end - offset, offset, len(view)))
+            return [parser.build(values, 0)[0] for values in parser.struct.iter_unpack(view)], end
+    else:
+        def parse(block, offset = 0):
+            values = []
+            for i in range(count):
+                value, offset = parser(block, offset)
+                values.append(value)
+            return values, offset
     return parse
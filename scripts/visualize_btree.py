@@ -1,12 +1,16 @@
 #!/usr/bin/env python
 # Copyright 2010-2012 RethinkDB, all rights reserved.
-from collections import namedtuple
+from collections import Counter, namedtuple
+from collections.abc import Mapping
 from parse_binary import *
-import sys, traceback
+import argparse, json, multiprocessing, sys, traceback
 
 def escape(string):
     return string.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
+def escape_bytes(string):
+    return escape(string.decode("latin-1").encode("unicode_escape").decode("ascii"))
+
 class Block(object):
     pass
 
@@ -54,14 +58,14 @@ class BlockGroup(object):
     def __init__(self, blocks):
         self.blocks = blocks
         self.values = {}
-    def try_parse(self, block_id, cls):
+    def try_parse(self, block_id, cls, *args):
         if block_id not in self.blocks:
             return BadBlockRef(block_id, "Not a real block.")
         elif block_id in self.values:
             return BadBlockRef(block_id, "Already used.")
         else:
             try:
-                value = cls.from_block(self, self.blocks[block_id])
+                value = cls.from_block(self, self.blocks[block_id], *args)
                 assert isinstance(value, cls)
             except Exception as e:
                 b = BadBlock(block_id, cls.name, traceback.format_exc())
@@ -107,22 +111,20 @@ class BtreeKey(object):
     
     def print_html(self):
         if len(self.name) < 15:
-            print("""<code>%s</code>""" % escape(self.name.encode("string-escape")))
+            print("""<code>%s</code>""" % escape_bytes(self.name))
         else:
             print("""<code>%s</code>...<code>%s</code>""" % \
-                (escape(self.name[:8].encode("string-escape")),
-                 escape(self.name[-8:].encode("string-escape"))))
+                (escape_bytes(self.name[:8]), escape_bytes(self.name[-8:])))
 
 class BtreeValue(object):
     
     @classmethod
-    def parse(cls, bgrp, block, offset = 0):
+    def parse_metadata(cls, block, offset = 0):
+        '''Returns (size, md_flags, flags, cas, exptime, offset of the contents).'''
         
         size, offset = parse_uint8_t(block, offset)
         md_flags, offset = parse_uint8_t(block, offset)
         
-        value_start_offset = offset
-        
         if md_flags & 0x01: flags, offset = parse_uint32_t(block, offset)
         else: flags = None
         
@@ -132,18 +134,32 @@ class BtreeValue(object):
         if md_flags & 0x04: exptime, offset = parse_uint32_t(block, offset)
         else: exptime = None
         
+        return (size, md_flags, flags, cas, exptime, offset)
+    
+    @classmethod
+    def parse_large_value_ref(cls, block, offset):
+        '''Returns (large value size, superblock id, offset after the value).'''
+        large_value_size, offset = parse_uint32_t(block, offset)
+        superblock_id, offset = parse_block_id(block, offset)
+        return large_value_size, superblock_id, offset
+    
+    @classmethod
+    def parse(cls, bgrp, block, offset = 0):
+        
+        value_start_offset = offset + 2
+        size, md_flags, flags, cas, exptime, offset = cls.parse_metadata(block, offset)
+        
         if md_flags & 0x08:
             # Large value
             assert size == 8
-            large_value_size, offset = parse_uint32_t(block, offset)
-            superblock_id, offset = parse_block_id(block, offset)
+            large_value_size, superblock_id, offset = cls.parse_large_value_ref(block, offset)
             superblock = bgrp.try_parse(superblock_id, BtreeLargeValueSuperblock, large_value_size)
-            return BtreeLargeValue(large_value_size, superblock, flags, cas, exptime)
+            return BtreeLargeValue(large_value_size, superblock, flags, cas, exptime), offset
         
         else:
             # Small value
             value, offset = block[offset: value_start_offset + size], value_start_offset + size
-            return BtreeSmallValue(value, cas, flags, exptime), offset
+            return BtreeSmallValue(value, flags, cas, exptime), offset
     
     def __init__(self, flags, cas, exptime):
         self.flags = flags
@@ -159,11 +175,10 @@ class BtreeSmallValue(BtreeValue):
     def print_html(self):
         # TODO: CAS, flags, and exptime.
         if len(self.contents) < 15:
-            print("""<code>%s</code>""" % escape(self.contents.encode("string-escape")))
+            print("""<code>%s</code>""" % escape_bytes(self.contents))
         else:
             print("""<code>%s</code>...<code>%s</code>""" % \
-                (escape(self.contents[:8].encode("string-escape")),
-                 escape(self.contents[-8:].encode("string-escape"))))
+                (escape_bytes(self.contents[:8]), escape_bytes(self.contents[-8:])))
 
 class BtreeLargeValue(BtreeValue):
     
@@ -190,7 +205,7 @@ class BtreeLargeValueSuperblock(object):
         
         num_segments, offset = parse_uint16_t(block, offset)
         first_block_offset, offset = parse_uint16_t(block, offset)
-        segment_ids, offset = parse_array(parse_block_id, num_segments)
+        segment_ids, offset = parse_array(parse_block_id, num_segments)(block, offset)
         
         next_block_offset = first_block_offset
         size_left = size
@@ -227,7 +242,7 @@ class BtreeLargeValueBlock(object):
         self.contents = contents
     
     def print_html(self):
-        print("""<code>%s</code>""" % escape(self.contents.encode("string-escape")))
+        print("""<code>%s</code>""" % escape_bytes(self.contents))
 
 class BtreeNode(object):
     
@@ -236,7 +251,7 @@ class BtreeNode(object):
     @classmethod
     def from_block(cls, bgrp, block):
         
-        type = ord(block[0])
+        type = block[0]
         if type == 1:
             return BtreeLeafNode.from_block(bgrp, block)
         elif type == 2:
@@ -310,7 +325,7 @@ class BtreeInternalNode(BtreeNode):
             key, offset = BtreeKey.parse(block, offset)
             pairs.append((key, subtree))
         
-        assert pairs[-1][0].name == ""   # Last pair is special
+        assert pairs[-1][0].name == b""   # Last pair is special
         pairs[-1] = (None, pairs[-1][1])
         
         return BtreeInternalNode(pairs)
@@ -335,6 +350,15 @@ class BtreeInternalNode(BtreeNode):
             print("""<td>%s</td></tr>""" % subtree.ref_as_html())
         print("""</table>""")
 
+btree_superblock_t, parse_superblock = make_struct(
+    "Superblock",
+    [
+        ("database_exists", parse_int),
+        (None, parse_padding(4)),
+        ("root_id", parse_block_id)
+    ]
+)
+
 class Superblock(object):
     
     name = "Superblock"
@@ -344,14 +368,6 @@ class Superblock(object):
         
         offset = 0
         
-        btree_superblock_t, parse_superblock = make_struct(
-            "Superblock",
-            [
-                ("database_exists", parse_int),
-                (None, parse_padding(4)),
-                ("root_id", parse_block_id)
-            ]
-        )
         sb = parse_superblock(block)[0]
         assert sb.database_exists == 1
         
@@ -366,6 +382,249 @@ class Superblock(object):
         print("""<p>Root: %s</p>""" % self.root.ref_as_html())
 
 
+# Offline consistency check. Unlike `blocks_to_btree`, which builds the whole tree in memory for rendering, the
+# check keeps only counters and block references per subtree, so subtrees can be checked in parallel and merged.
+
+node_header_t, parse_node_header = make_struct(
+    "NodeHeader",
+    [
+        ("type", parse_int),
+        ("npairs", parse_uint16_t),
+        ("frontmost_offset", parse_uint16_t)
+    ]
+)
+
+fill_buckets = 10
+
+class LazyBlocks(Mapping):
+    '''The live blocks of a lazy `Database`, read from the mapped file only when they are looked up.'''
+    
+    def __init__(self, db):
+        self.db = db
+    
+    def __getitem__(self, block_id):
+        data_block = self.db.data_block(block_id)
+        if data_block is None or not data_block.chunk_ok:
+            raise KeyError(block_id)
+        return data_block.chunk_obj.contents
+    
+    def __contains__(self, block_id):
+        return self.db.lba.get(block_id, "delete") != "delete"
+    
+    def __iter__(self):
+        return (block_id for block_id, offset in self.db.lba.items() if offset != "delete")
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+
+class CheckResult(object):
+    
+    def __init__(self):
+        self.references = Counter()  # block id -> number of references found to it
+        self.errors = []
+        self.depths = Counter()      # leaf depth -> number of leaves
+        self.fill = Counter()        # fill factor bucket -> number of nodes
+        self.leaves = 0
+        self.internal_nodes = 0
+        self.pairs = 0
+        self.large_values = 0
+        self.dangling_large_values = []
+    
+    def error(self, block_id, message):
+        self.errors.append({"block": block_id, "error": message})
+    
+    def merge(self, other):
+        '''Add the results for other subtrees. A node shared between them was checked in each (with different
+        bounds), so like check_subtrees only the problems from the first check of each block are kept.'''
+        self.references.update(other.references)
+        checked = set(x["block"] for x in self.errors)
+        self.errors.extend(x for x in other.errors if x["block"] not in checked)
+        self.depths.update(other.depths)
+        self.fill.update(other.fill)
+        self.leaves += other.leaves
+        self.internal_nodes += other.internal_nodes
+        self.pairs += other.pairs
+        self.large_values += other.large_values
+        dangling = set(x["block"] for x in self.dangling_large_values)
+        self.dangling_large_values.extend(x for x in other.dangling_large_values if x["block"] not in dangling)
+
+def check_large_value(blocks, block_id, size, result):
+    
+    result.large_values += 1
+    result.references[block_id] += 1
+    superblock = BlockGroup(blocks).try_parse(block_id, BtreeLargeValueSuperblock, size)
+    
+    problems = []
+    if not superblock.block_ok:
+        problems.append(superblock.msg.strip().splitlines()[-1])
+    else:
+        for segment in superblock.block_obj.segments:
+            result.references[segment.id] += 1
+            if isinstance(segment, BadBlockRef) or not segment.block_ok:
+                problems.append("Segment %d: %s" % (segment.id, segment.msg.strip().splitlines()[-1]))
+    if problems:
+        result.dangling_large_values.append({"block": block_id, "size": size, "errors": problems})
+
+def check_node(blocks, block_id, low, high, depth, result):
+    '''Check a single node, whose keys must be in (low, high]; a bound of None is open. Returns the children to
+    check next as (block id, low, high, depth) tuples.'''
+    
+    if block_id not in blocks:
+        result.error(block_id, "Referenced at depth %d, but not a real block." % depth)
+        return []
+    block = blocks[block_id]
+    
+    try:
+        header, offset = parse_node_header(block)
+        if header.type not in (1, 2):
+            raise ValueError("First byte should be 1 or 2, got %d." % header.type)
+        pair_offsets, offset = parse_array(parse_uint16_t, header.npairs)(block, offset)
+        
+        keys = []
+        children = []
+        large_values = []
+        for pair_offset in pair_offsets:
+            if pair_offset < header.frontmost_offset:
+                raise ValueError("Pair offset %d is before the frontmost offset %d." % (pair_offset, header.frontmost_offset))
+            if header.type == 1:
+                key, pair_offset = BtreeKey.parse(block, pair_offset)
+                size, md_flags, flags, cas, exptime, pair_offset = BtreeValue.parse_metadata(block, pair_offset)
+                if md_flags & 0x08:
+                    large_value_size, superblock_id, pair_offset = BtreeValue.parse_large_value_ref(block, pair_offset)
+                    large_values.append((superblock_id, large_value_size))
+            else:
+                child_id, pair_offset = parse_block_id(block, pair_offset)
+                key, pair_offset = BtreeKey.parse(block, pair_offset)
+                children.append(child_id)
+            keys.append(key.name)
+    except Exception as e:
+        result.error(block_id, "Unparseable node: %s" % e)
+        return []
+    
+    used = parse_node_header.size + 2 * header.npairs + len(block) - header.frontmost_offset
+    result.fill[min(fill_buckets - 1, used * fill_buckets // len(block))] += 1
+    
+    if header.type == 2:
+        result.internal_nodes += 1
+        if not keys or keys[-1] != b"":
+            result.error(block_id, "The last key of an internal node should be empty.")
+            return []
+        keys[-1] = high   # Last pair is special: it holds all other keys
+        bounded = keys[:-1]
+    else:
+        result.leaves += 1
+        result.pairs += len(keys)
+        result.depths[depth] += 1
+        bounded = keys
+    
+    for previous, key in zip(bounded, bounded[1:]):
+        if not previous < key:
+            result.error(block_id, "Keys out of order: %r is not before %r." % (previous, key))
+    if bounded and low is not None and not low < bounded[0]:
+        result.error(block_id, "Key %r is not after the parent's bound %r." % (bounded[0], low))
+    if bounded and high is not None and not bounded[-1] <= high:
+        result.error(block_id, "Key %r is after the parent's bound %r." % (bounded[-1], high))
+    
+    for superblock_id, size in large_values:
+        check_large_value(blocks, superblock_id, size, result)
+    
+    subtrees = []
+    for child_id, key in zip(children, keys):
+        result.references[child_id] += 1
+        subtrees.append((child_id, low, key, depth + 1))
+        low = key
+    return subtrees
+
+def check_subtrees(blocks, subtrees):
+    
+    result = CheckResult()
+    visited = set()
+    stack = list(reversed(subtrees))
+    while stack:
+        subtree = stack.pop()
+        if subtree[0] in visited:
+            continue # shared or cyclic, its extra references are already counted
+        visited.add(subtree[0])
+        stack.extend(reversed(check_node(blocks, *subtree, result=result)))
+    return result
+
+_check_blocks = None # set while the pool runs, forked workers inherit it instead of having the blocks pickled
+
+def _check_subtrees_job(subtrees):
+    return check_subtrees(_check_blocks, subtrees)
+
+def check_btree(blocks, jobs=None):
+    '''Check the tree under the superblock (block 0) and summarize it as a dict ready for JSON. The top of the
+    tree is checked here, level by level, until there are enough subtrees to keep `jobs` processes busy.'''
+    
+    global _check_blocks
+    jobs = jobs or multiprocessing.cpu_count()
+    result = CheckResult()
+    
+    root_id = None
+    frontier = []
+    if 0 not in blocks:
+        result.error(0, "There is no superblock.")
+    else:
+        try:
+            superblock = parse_superblock(blocks[0])[0]
+        except Exception as e:
+            superblock = None
+            result.error(0, "Unparseable superblock: %s" % e)
+        if superblock is None:
+            pass
+        elif superblock.database_exists != 1:
+            result.error(0, "The superblock says there is no database.")
+        else:
+            root_id = superblock.root_id
+            result.references[root_id] += 1
+            frontier = [(root_id, None, None, 0)]
+    
+    visited = set()
+    while frontier and jobs > 1 and len(frontier) < 4 * jobs:
+        level = []
+        for subtree in frontier:
+            if subtree[0] not in visited:
+                visited.add(subtree[0])
+                level.extend(check_node(blocks, *subtree, result=result))
+        frontier = level
+    frontier = [subtree for subtree in frontier if subtree[0] not in visited]
+    
+    if jobs > 1 and len(frontier) > 1:
+        chunks = [frontier[i::4 * jobs] for i in range(min(len(frontier), 4 * jobs))]
+        _check_blocks = blocks
+        try:
+            with multiprocessing.get_context("fork").Pool(jobs) as pool:
+                for chunk_result in pool.imap_unordered(_check_subtrees_job, chunks):
+                    result.merge(chunk_result)
+        finally:
+            _check_blocks = None
+    else:
+        result.merge(check_subtrees(blocks, frontier))
+    
+    if len(result.depths) > 1:
+        result.error(root_id, "Leaves are at different depths: %s." % ", ".join(str(x) for x in sorted(result.depths)))
+    
+    orphans = sorted(block_id for block_id in blocks if block_id != 0 and block_id not in result.references)
+    shared = sorted((block_id, count) for block_id, count in result.references.items() if count > 1)
+    
+    return {
+        "ok": not (result.errors or orphans or shared or result.dangling_large_values),
+        "blocks": len(blocks),
+        "root": root_id,
+        "leaves": result.leaves,
+        "internal_nodes": result.internal_nodes,
+        "pairs": result.pairs,
+        "large_values": result.large_values,
+        "depth_histogram": dict((str(depth), count) for depth, count in sorted(result.depths.items())),
+        "fill_histogram": dict(("%d-%d%%" % (100 * i // fill_buckets, 100 * (i + 1) // fill_buckets), result.fill[i]) for i in range(fill_buckets)),
+        "orphans": orphans,
+        "multiply_referenced": dict((str(block_id), count) for block_id, count in shared),
+        "dangling_large_values": sorted(dict((x["block"], x) for x in result.dangling_large_values).values(), key=lambda x: x["block"]),
+        "errors": result.errors
+    }
+
+
 
 def btree_to_html(btree, filename):
     
@@ -415,9 +674,31 @@ td, th {
 
 if __name__ == "__main__":
     
-    if len(sys.argv) == 3:
-        from visualize_log_serializer import file_to_database, database_to_blocks
-        btree_to_html(blocks_to_btree(database_to_blocks(file_to_database(sys.argv[1]))), sys.argv[2])
+    parser = argparse.ArgumentParser(description="Visualize or check the B-tree in a RethinkDB data file")
+    parser.add_argument("data_file")
+    parser.add_argument("output", nargs="?", help="write the whole tree as a single HTML page")
+    parser.add_argument("--check", action="store_true", help="check the tree's invariants and report statistics as JSON")
+    parser.add_argument("--json", metavar="FILE", default="-", help="with --check: write the report to FILE (default: stdout)")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="with --check: processes to check subtrees in (default: one per CPU)")
+    options = parser.parse_args()
+    
+    if (options.output is None) == (not options.check):
+        parser.error("exactly one of output or --check is required")
+    
+    from visualize_log_serializer import file_to_database, database_to_blocks
+    
+    if options.output is not None:
+        btree_to_html(blocks_to_btree(database_to_blocks(file_to_database(options.data_file))), options.output)
     
     else:
-        print("Usage: %s data_file output.html" % sys.argv[0])
+        db = file_to_database(options.data_file, lazy=True)
+        if not db.metablock or not db.metablock.chunk_ok:
+            sys.exit("No valid metablock in %s" % options.data_file)
+        report = check_btree(LazyBlocks(db), options.jobs)
+        if options.json == "-":
+            json.dump(report, sys.stdout, indent=4)
+            print("")
+        else:
+            with open(options.json, "w") as f:
+                json.dump(report, f, indent=4)
+        sys.exit(0 if report["ok"] else 1)
@@ -1,19 +1,50 @@
 #!/usr/bin/env python
 # Copyright 2010-2012 RethinkDB, all rights reserved.
 from collections import namedtuple
+from contextlib import redirect_stdout
 from parse_binary import *
-import sys, os, traceback
+import argparse, array, bisect, json, mmap, os, sys, traceback
 
 
 
 def escape(string):
         return string.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
-def print_anchor(obj):
-    print """<a name="obj-%d"/>""" % id(obj)
+def hexdump(contents):
+    return contents.hex(" ")
 
 parse_block_id = parse_uint64_t
 
+lba_superblock_entry, parse_lba_superblock_entry = make_struct(
+    "lba_superblock_entry",
+    [
+        ("offset", parse_off64_t),
+        ("how_many_pairs", parse_int),
+        (None, parse_padding(4))
+    ]
+)
+
+lba_pair, parse_lba_pair = make_struct(
+    "lba_pair",
+    [
+        ("block_id", parse_block_id),
+        ("block_offset", parse_off64_t)
+    ]
+)
+
+# Anchors are derived from the offset and name of a chunk, so a reference can be printed without
+# having parsed the chunk it points to. When the output is split over several pages,
+# database_to_html_pages sets page_for_offset so that references point into the right page.
+
+page_for_offset = None
+
+def chunk_anchor(offset, name):
+    return "chunk-%x-%s" % (offset, name.replace(" ", "_"))
+
+def chunk_href(offset, name):
+    page = page_for_offset(offset) if page_for_offset is not None and offset >= 0 else ""
+    return "%s#%s" % (page, chunk_anchor(offset, name))
+
 
 
 # This is sort of unintuitive, so pay attention.
@@ -53,36 +84,48 @@ class GoodChunk(Chunk):
         self.chunk_ok = True
     
     def ref_as_html(self):
-        return """<a href="#obj-%d">0x%x</a>""" % (id(self), self.offset)
+        return """<a href="%s">0x%x</a>""" % (chunk_href(self.offset, self.name), self.offset)
     
     def chunk_print_html(self):
-        print """<div class="block">"""
-        print """<a name="obj-%d"/>""" % id(self)
-        print """<h1>0x%x - 0x%x: %s</h1>""" % (self.offset, self.offset + self.length - 1, self.name)
+        print("""<div class="block">""")
+        print("""<a name="%s"/>""" % chunk_anchor(self.offset, self.name))
+        print("""<h1>0x%x - 0x%x: %s</h1>""" % (self.offset, self.offset + self.length - 1, self.name))
         self.chunk_obj.print_html()
-        print """</div>"""
+        print("""</div>""")
+    
+    def to_json(self):
+        description = {"offset": self.offset, "length": self.length, "name": self.name, "ok": True}
+        if hasattr(self.chunk_obj, "to_json"):
+            description.update(self.chunk_obj.to_json())
+        return description
 
 class BadChunk(Chunk):
     
-    def __init__(self, offset, length, name, contents, msg):
+    def __init__(self, offset, length, name, block, msg):
         self.offset = offset
         self.length = length
         self.name = name
         self.msg = msg
-        self.contents = contents
+        self.block = block # the whole file, the contents are only sliced out when needed
         self.chunk_ok = False
     
+    @property
+    def contents(self):
+        return self.block[self.offset: self.offset + self.length]
+    
     def ref_as_html(self):
-        return """<a href="#obj-%d">0x%x</a>""" % (id(self), self.offset)
+        return """<a href="%s">0x%x</a>""" % (chunk_href(self.offset, self.name), self.offset)
     
     def chunk_print_html(self):
-        print """<div class="block">"""
-        print """<a name="obj-%d"/>""" % id(self)
-        print """<h1>0x%x - 0x%x: %s</h1>""" % (self.offset, self.offset + self.length - 1, self.name)
-        print """<pre style="color: red">%s</pre>""" % escape(self.msg)
-        print """<div class="hexdump">%s</div>""" % \
-            " ".join(x.encode("hex") for x in self.contents)
-        print """</div>"""
+        print("""<div class="block">""")
+        print("""<a name="%s"/>""" % chunk_anchor(self.offset, self.name))
+        print("""<h1>0x%x - 0x%x: %s</h1>""" % (self.offset, self.offset + self.length - 1, self.name))
+        print("""<pre style="color: red">%s</pre>""" % escape(self.msg))
+        print("""<div class="hexdump">%s</div>""" % hexdump(self.contents))
+        print("""</div>""")
+    
+    def to_json(self):
+        return {"offset": self.offset, "length": self.length, "name": self.name, "ok": False, "error": self.msg}
 
 class BadChunkRef(Chunk):
     
@@ -98,8 +141,11 @@ class BadChunkRef(Chunk):
             (self.offset, escape(self.msg))
     
     def chunk_print_html(self):
-        print """<span style="color: red">Bad reference (but we're so screwed that we think it's
-inside of a block): %s</span>""" % self.msg
+        print("""<span style="color: red">Bad reference (but we're so screwed that we think it's
+inside of a block): %s</span>""" % self.msg)
+    
+    def to_json(self):
+        return {"offset": self.offset, "length": self.length, "name": self.name, "ok": False, "bad_reference": True, "error": self.msg}
 
 def try_parse(db, offset, length, name, cls, *args):
     
@@ -117,7 +163,7 @@ def try_parse(db, offset, length, name, cls, *args):
         x = cls.from_data(db, offset, *args)
         assert isinstance(x, cls)
     except Exception:
-        chunk = BadChunk(offset, length, name, db.block[offset: offset + length], traceback.format_exc())
+        chunk = BadChunk(offset, length, name, db.block, traceback.format_exc())
     else:
         chunk = GoodChunk(offset, length, name, x)
     
@@ -138,11 +184,25 @@ def try_store(chunk, fun, *args):
 
 
 class Database(object):
+    '''The log-serializer structure of a data file.
     
-    def __init__(self, block):
+    `block` can be anything that supports slicing and the buffer protocol, normally an mmap of the file.
+    A lazy Database only parses the metablocks and the LBA up front; data block extents are parsed when
+    they are asked for through extent_at() or iter_extents(), and not kept afterwards, so memory use is
+    bounded by the size of the LBA rather than by the size of the file.'''
+    
+    def __init__(self, block, lazy=False):
         
         self.block = block
+        self.lazy = lazy
         self.extents = {}
+        self.lba = {}
+        
+        # in lazy mode: the offsets of all live data blocks, sorted, and their ids in the same order, and the
+        # BadChunkRefs for the blocks that can not be data blocks, which would otherwise never be shown
+        self.data_block_offsets = array.array('q')
+        self.data_block_ids = array.array('Q')
+        self.bad_data_block_refs = []
         
         # Determine configuration info
         
@@ -187,9 +247,10 @@ class Database(object):
         
         # Fill in empty extents with placeholders
         
-        for offset in range(0, max(self.extents.keys()) + 1, self.extent_size):
-            if offset not in self.extents:
-                self.add_extent(GoodChunk(offset, self.extent_size, "Unused Extent", UnusedExtent()))
+        if not self.lazy:
+            for offset in range(0, max(self.extents.keys()) + 1, self.extent_size):
+                if offset not in self.extents:
+                    self.add_extent(GoodChunk(offset, self.extent_size, "Unused Extent", UnusedExtent()))
     
     def add_extent(self, extent):
         
@@ -229,7 +290,7 @@ class Database(object):
             lba_superblock = try_parse(self, lba_index_part.lba_superblock_offset, size, "LBA Superblock", LBASuperblock,
                 lba_index_part.lba_superblock_entries_count)
             lba_superblock = try_store(lba_superblock, LBASuperblockExtent.store_superblock, self)
-            
+        
         else:
             lba_superblock = None
         
@@ -241,15 +302,24 @@ class Database(object):
         if first_lba_extent:
             lba_extents.append(first_lba_extent)
         
-        lba = {}
-        data_blocks = {}
+        lba = self.lba
+        data_blocks = None if self.lazy else {}
         
         for extent in reversed(lba_extents):
             if extent.chunk_ok:
                 for pair in reversed(extent.chunk_obj.pairs):
                     if isinstance(pair, LBAPair) and pair.block_id not in lba:
                         lba[pair.block_id] = pair.block_offset
-                        data_blocks[pair.block_id] = self.use_lba_pair(pair)
+                        if self.lazy:
+                            self.check_lba_pair(pair)
+                        else:
+                            data_blocks[pair.block_id] = self.use_lba_pair(pair)
+        
+        if self.lazy:
+            bad = set(chunk.offset for chunk in self.bad_data_block_refs)
+            live = sorted((offset, block_id) for block_id, offset in lba.items() if offset != "delete" and offset not in bad)
+            self.data_block_offsets.extend(offset for offset, _ in live)
+            self.data_block_ids.extend(block_id for _, block_id in live)
         
         self.metablock.chunk_obj.was_used(first_lba_extent, lba_superblock, lba, data_blocks)
     
@@ -264,25 +334,101 @@ class Database(object):
         pair.was_used(data_block)
         return data_block
     
-    def print_html(self):
+    def check_lba_pair(self, pair):
+        '''The lazy version of use_lba_pair: the data block is not kept, but a pointer that is out of the file or
+        into a metablock or LBA extent gets the same BadChunkRef that use_lba_pair would give it'''
+        
+        data_block = None
+        if pair.block_offset != "delete":
+            name = "Data Block %d" % pair.block_id
+            data_block = try_parse(self, pair.block_offset, self.block_size, name, DataBlock)
+            extent_offset = pair.block_offset - pair.block_offset % self.extent_size
+            if data_block.chunk_ok and extent_offset in self.extents:
+                data_block = BadChunkRef(pair.block_offset, self.block_size, name,
+                    "Extent at 0x%x is a %r." % (extent_offset, self.extents[extent_offset].name))
+            if data_block.chunk_ok:
+                data_block = None
+            else:
+                self.bad_data_block_refs.append(data_block)
+        
+        pair.was_used(data_block)
+    
+    def data_block(self, block_id):
+        '''Parse the current version of a single block through the LBA. Returns None if the block was deleted,
+        raises KeyError if the LBA has no entry for it.'''
+        
+        offset = self.lba[block_id]
+        if offset == "delete":
+            return None
+        return try_parse(self, offset, self.block_size, "Data Block %d" % block_id, DataBlock)
+    
+    def extent_at(self, offset):
+        
+        assert offset % self.extent_size == 0, "Misaligned extent: 0x%x" % offset
+        if offset in self.extents:
+            return self.extents[offset]
+        
+        if self.lazy:
+            first = bisect.bisect_left(self.data_block_offsets, offset)
+            last = bisect.bisect_left(self.data_block_offsets, offset + self.extent_size)
+            if first < last:
+                extent = GoodChunk(offset, self.extent_size, "Data Block Extent", DataBlockExtent())
+                for i in range(first, last):
+                    block_id = self.data_block_ids[i]
+                    extent.chunk_obj.children.add(
+                        try_parse(self, self.data_block_offsets[i], self.block_size, "Data Block %d" % block_id, DataBlock))
+                return extent
         
-        print """<h1>Database</h1>"""
+        return GoodChunk(offset, self.extent_size, "Unused Extent", UnusedExtent())
+    
+    def iter_extents(self, start=0, end=None):
+        '''Generate every extent in the file between the start and end offsets'''
+        
+        end = len(self.block) if end is None else min(end, len(self.block))
+        for offset in range(start - start % self.extent_size, end, self.extent_size):
+            yield self.extent_at(offset)
+    
+    def print_summary_html(self):
         
-        print """<p>End of file is at 0x%x</p>""" % len(self.block)
+        print("""<h1>Database</h1>""")
+        
+        print("""<p>End of file is at 0x%x</p>""" % len(self.block))
         
         if self.metablock:
-            print """<p>Most recent metablock: %s</p>""" % self.metablock.ref_as_html()
+            print("""<p>Most recent metablock: %s</p>""" % self.metablock.ref_as_html())
         else:
-            print """<p>No valid metablocks found.</p>"""
+            print("""<p>No valid metablocks found.</p>""")
         
-        for i in sorted(self.extents.keys()):
-            self.extents[i].chunk_print_html()
+        for chunk in self.bad_data_block_refs:
+            print("""<p>%s: %s</p>""" % (chunk.name, chunk.ref_as_html()))
+    
+    def print_html(self):
+        
+        self.print_summary_html()
+        
+        if self.lazy:
+            for extent in self.iter_extents():
+                extent.chunk_print_html()
+        else:
+            for i in sorted(self.extents.keys()):
+                self.extents[i].chunk_print_html()
+    
+    def to_json(self):
+        return {
+            "name": "Database",
+            "end_of_file": len(self.block),
+            "extent_size": self.extent_size,
+            "block_size": self.block_size,
+            "metablock": self.metablock.offset if self.metablock else None,
+            "blocks": len(self.lba),
+            "bad_references": [x.to_json() for x in self.bad_data_block_refs]
+        }
 
 
 
 class UnusedExtent(object):
     def print_html(self):
-        print """<p>Nothing in this extent is reachable from the most recent metablock.</p>"""
+        print("""<p>Nothing in this extent is reachable from the most recent metablock.</p>""")
 
 
 
@@ -317,6 +463,12 @@ class MetablockExtent(object):
         for metablock in self.metablocks:
             if not self.found_a_valid_metablock or metablock.chunk_ok:
                 metablock.chunk_print_html()
+    
+    def to_json(self):
+        return {
+            "static_header": self.static_header.to_json(),
+            "metablocks": [x.to_json() for x in self.metablocks if not self.found_a_valid_metablock or x.chunk_ok]
+        }
 
 class StaticHeader(object):
     
@@ -326,11 +478,11 @@ class StaticHeader(object):
         static_header, parse_static_header = make_struct(
             "static_header",
             [
-                (None, parse_constant("RethinkDB\0")),
-                (None, parse_constant("0.0.0\0")),
-                (None, parse_constant("BTree Blocksize:\0")),
+                (None, parse_constant(b"RethinkDB\0")),
+                (None, parse_constant(b"0.0.0\0")),
+                (None, parse_constant(b"BTree Blocksize:\0")),
                 ("btree_block_size", parse_uint64_t),
-                (None, parse_constant("Extent Size:\0")),
+                (None, parse_constant(b"Extent Size:\0")),
                 ("extent_size", parse_uint64_t)
             ]
         )
@@ -342,8 +494,11 @@ class StaticHeader(object):
         self.sh = sh
     
     def print_html(self):
-        print """<p>Block size: %d</p>""" % self.sh.btree_block_size
-        print """<p>Extent size: %d</p>""" % self.sh.extent_size
+        print("""<p>Block size: %d</p>""" % self.sh.btree_block_size)
+        print("""<p>Extent size: %d</p>""" % self.sh.extent_size)
+    
+    def to_json(self):
+        return {"btree_block_size": self.sh.btree_block_size, "extent_size": self.sh.extent_size}
 
 class Metablock(object):
     
@@ -355,7 +510,7 @@ class Metablock(object):
     def make_parser(c, markers):
         
         if markers not in c.crc_metablock_parser_cache:
-        
+            
             def maybe(p):
                 if markers: return p
                 else: return parse_padding(0)
@@ -398,11 +553,11 @@ class Metablock(object):
             crc_metablock_t, parse_crc_metablock = make_struct(
                 "crc_metablock_t",
                 [
-                    (None, maybe(parse_constant("metablock\xbd"))),
-                    (None, maybe(parse_constant("crc:\xbd"))),
+                    (None, maybe(parse_constant(b"metablock\xbd"))),
+                    (None, maybe(parse_constant(b"crc:\xbd"))),
                     ("crc", parse_uint32_t),
                     (None, maybe(parse_padding(1))),
-                    (None, maybe(parse_constant("version:"))),
+                    (None, maybe(parse_constant(b"version:"))),
                     ("version", parse_int),
                     ("metablock", parse_metablock)
                 ]
@@ -420,17 +575,17 @@ class Metablock(object):
         try:
             mb = c.make_parser(True)(db.block, offset)[0]
             assert mb.version > 0
-        except Exception, e:
+        except Exception as e:
             error1 = traceback.format_exc()
             try:
                 mb = c.make_parser(False)(db.block, offset)[0]
                 assert mb.version > 0
-            except Exception, e:
+            except Exception as e:
                 error2 = traceback.format_exc()
                 raise ValueError(
                     "Invalid metablock.\n\n"
-                    "Problem when trying to parse with markers:\n\n" error1 "\n"
-                    "Problem when trying to parse without markers:\n\n" error2
+                    "Problem when trying to parse with markers:\n\n" + error1 + "\n"
+                    "Problem when trying to parse without markers:\n\n" + error2
                 )
         
         return Metablock(mb)
@@ -448,40 +603,55 @@ class Metablock(object):
     
     def print_html(self):
         
-        print """<table>"""
+        print("""<table>""")
         
-        print """<tr><td>CRC</td><td>0x%.8x</td></tr>""" % self.mb.crc
-        print """<tr><td>Version</td><td>%d</td></tr>""" % self.mb.version
+        print("""<tr><td>CRC</td><td>0x%.8x</td></tr>""" % self.mb.crc)
+        print("""<tr><td>Version</td><td>%d</td></tr>""" % self.mb.version)
         
-        print """<tr><td>Last extent</td><td>0x%x</td></tr>""" % \
-            self.mb.metablock.extent_manager_part.last_extent
+        print("""<tr><td>Last extent</td><td>0x%x</td></tr>""" % \
+            self.mb.metablock.extent_manager_part.last_extent)
         
-        print """<tr><td>Last LBA extent offset</td>"""
+        print("""<tr><td>Last LBA extent offset</td>""")
         if self.chosen and self.first_lba_extent:
-            print """<td>%s</td>""" % self.first_lba_extent.ref_as_html()
+            print("""<td>%s</td>""" % self.first_lba_extent.ref_as_html())
         else:
-            print """<td>0x%x</td>""" % self.mb.metablock.lba_index_part.last_lba_extent_offset
-        print """</tr>"""
+            print("""<td>0x%x</td>""" % self.mb.metablock.lba_index_part.last_lba_extent_offset)
+        print("""</tr>""")
         
-        print """<tr><td>Last LBA extent entries count</td><td>%d</td></tr>""" % \
-            self.mb.metablock.lba_index_part.last_lba_extent_entries_count
+        print("""<tr><td>Last LBA extent entries count</td><td>%d</td></tr>""" % \
+            self.mb.metablock.lba_index_part.last_lba_extent_entries_count)
         
-        print """<tr><td>LBA superblock offset</td>"""
+        print("""<tr><td>LBA superblock offset</td>""")
         if self.chosen and self.lba_superblock:
-            print """<td>%s</td>""" % self.lba_superblock.ref_as_html()
+            print("""<td>%s</td>""" % self.lba_superblock.ref_as_html())
         else:
-            print """<td>0x%x</td>""" % self.mb.metablock.lba_index_part.lba_superblock_offset
-        print """</tr>"""
+            print("""<td>0x%x</td>""" % self.mb.metablock.lba_index_part.lba_superblock_offset)
+        print("""</tr>""")
         
-        print """<tr><td>LBA superblock entries count</td><td>%d</td></tr>""" % \
-            self.mb.metablock.lba_index_part.lba_superblock_entries_count
+        print("""<tr><td>LBA superblock entries count</td><td>%d</td></tr>""" % \
+            self.mb.metablock.lba_index_part.lba_superblock_entries_count)
         
-        print """<tr><td>Last data extent</td><td>0x%x</td></tr>""" % \
-            self.mb.metablock.data_block_manager_part.last_data_extent
-        print """<tr><td>Blocks in last data extent</td><td>%d</td></tr>""" % \
-            self.mb.metablock.data_block_manager_part.blocks_in_last_data_extent
+        print("""<tr><td>Last data extent</td><td>0x%x</td></tr>""" % \
+            self.mb.metablock.data_block_manager_part.last_data_extent)
+        print("""<tr><td>Blocks in last data extent</td><td>%d</td></tr>""" % \
+            self.mb.metablock.data_block_manager_part.blocks_in_last_data_extent)
         
-        print """</table>"""
+        print("""</table>""")
+    
+    def to_json(self):
+        metablock = self.mb.metablock
+        return {
+            "crc": self.mb.crc,
+            "version": self.mb.version,
+            "chosen": self.chosen,
+            "last_extent": metablock.extent_manager_part.last_extent,
+            "last_lba_extent_offset": metablock.lba_index_part.last_lba_extent_offset,
+            "last_lba_extent_entries_count": metablock.lba_index_part.last_lba_extent_entries_count,
+            "lba_superblock_offset": metablock.lba_index_part.lba_superblock_offset,
+            "lba_superblock_entries_count": metablock.lba_index_part.lba_superblock_entries_count,
+            "last_data_extent": metablock.data_block_manager_part.last_data_extent,
+            "blocks_in_last_data_extent": metablock.data_block_manager_part.blocks_in_last_data_extent
+        }
 
 
 
@@ -508,8 +678,11 @@ class LBASuperblockExtent(object):
     
     def print_html(self):
         
-        for child in sorted(self.children, lambda x,y: cmp(x.offset, y.offset)):
+        for child in sorted(self.children, key=lambda x: x.offset):
             child.chunk_print_html()
+    
+    def to_json(self):
+        return {"children": [x.to_json() for x in sorted(self.children, key=lambda x: x.offset)]}
 
 class LBASuperblock(object):
     
@@ -519,14 +692,11 @@ class LBASuperblock(object):
         lba_extents = []
         start_offset = offset
         
-        _, offset = parse_constant("lbasuper")(db.block, offset)
+        _, offset = parse_constant(b"lbasuper")(db.block, offset)
         while offset % 16 != 0: offset += 1
         
-        for i in range(how_many_lba_extents):
-        
-            lba_extent_offset, offset = parse_off64_t(db.block, offset)
-            how_many_pairs, offset = parse_int(db.block, offset)
-            offset += 4   # Padding after the int
+        entries, offset = parse_array(parse_lba_superblock_entry, how_many_lba_extents)(db.block, offset)
+        for lba_extent_offset, how_many_pairs in entries:
             
             lba_extent = try_parse(db, lba_extent_offset, db.extent_size, "LBA Extent", LBAExtent, how_many_pairs)
             lba_extent = try_store(lba_extent, db.add_extent)
@@ -543,22 +713,23 @@ class LBASuperblock(object):
     
     def print_html(self):
         for extent in self.lba_extents:
-            print """<p>Extent: %s</p>""" % extent.ref_as_html()
+            print("""<p>Extent: %s</p>""" % extent.ref_as_html())
+    
+    def to_json(self):
+        return {"lba_extents": [x.offset for x in self.lba_extents]}
 
 class LBAExtent(object):
     
     @classmethod
     def from_data(cls, db, offset, count):
         
-        _, offset = parse_constant("lbamagic")(db.block, offset);
+        _, offset = parse_constant(b"lbamagic")(db.block, offset);
         while offset % 16 != 0: offset += 1
         
         pairs = []
         
-        for i in range(count):
-            
-            block_id, offset = parse_block_id(db.block, offset)
-            block_offset, offset = parse_off64_t(db.block, offset)
+        raw_pairs, offset = parse_array(parse_lba_pair, count)(db.block, offset)
+        for block_id, block_offset in raw_pairs:
             
             if block_id == 0xFFFFFFFFFFFFFFFF:
                 assert block_offset == -1
@@ -575,18 +746,21 @@ class LBAExtent(object):
         self.pairs = pairs
     
     def print_html(self):
-        print """<div style="-webkit-column-width: 310px">"""
-        print """<table>"""
-        print """<tr><th>Block ID</th><th>Offset</th></tr>"""
+        print("""<div style="-webkit-column-width: 310px">""")
+        print("""<table>""")
+        print("""<tr><th>Block ID</th><th>Offset</th></tr>""")
         for entry in self.pairs:
             entry.print_html()
-        print """</table>"""
-        print """</div>"""
+        print("""</table>""")
+        print("""</div>""")
+    
+    def to_json(self):
+        return {"pairs": [[x.block_id, x.block_offset, x.chosen] for x in self.pairs if isinstance(x, LBAPair)]}
 
 class LBAPaddingPair(object):
     
     def print_html(self):
-        print """<tr><td colspan=2><i>(padding)</i></td></tr>"""
+        print("""<tr><td colspan=2><i>(padding)</i></td></tr>""")
 
 class LBAPair(object):
     
@@ -595,25 +769,29 @@ class LBAPair(object):
         self.block_id = block_id
         self.block_offset = block_offset
         self.chosen = False
+        self.data_block = None
     
     def was_used(self, data_block):
         self.chosen = True
         self.data_block = data_block
     
     def print_html(self):
-        print """<tr>"""
-        print """<td>%d</td>""" % self.block_id
+        print("""<tr>""")
+        print("""<td>%d</td>""" % self.block_id)
         if self.chosen:
             if self.block_offset == "delete":
-                print """<td>delete</td>"""
+                print("""<td>delete</td>""")
+            elif self.data_block is not None:
+                print("""<td>%s</td>""" % self.data_block.ref_as_html())
             else:
-                print """<td>%s</td>""" % self.data_block.ref_as_html()
+                # lazy database: the data block has not been parsed, but its anchor is known
+                print("""<td><a href="%s">0x%x</a></td>""" % (chunk_href(self.block_offset, "Data Block %d" % self.block_id), self.block_offset))
         else:
             if self.block_offset == "delete":
-                print """<td><i>delete</i></td>"""
+                print("""<td><i>delete</i></td>""")
             else:
-                print """<td><i>0x%x</i></td>""" % self.block_offset
-        print """</tr>"""
+                print("""<td><i>0x%x</i></td>""" % self.block_offset)
+        print("""</tr>""")
 
 
 
@@ -639,41 +817,42 @@ class DataBlockExtent(object):
         self.children = set()
     
     def print_html(self):
-        for child in sorted(self.children, lambda x,y: cmp(x.offset, y.offset)):
+        for child in sorted(self.children, key=lambda x: x.offset):
             child.chunk_print_html()
+    
+    def to_json(self):
+        return {"children": [x.to_json() for x in sorted(self.children, key=lambda x: x.offset)]}
 
 class DataBlock(object):
     
     @classmethod
     def from_data(cls, db, offset):
-        contents = db.block[offset: offset + db.block_size]
-        return DataBlock(contents)
+        return DataBlock(db.block, offset, db.block_size)
+    
+    def __init__(self, block, offset, length):
+        self.block = block # the whole file, the contents are only sliced out when needed
+        self.offset = offset
+        self.length = length
     
-    def __init__(self, contents):
-        self.contents = contents
+    @property
+    def contents(self):
+        return self.block[self.offset: self.offset + self.length]
     
     def print_html(self):
-        print """<div class="hexdump">%s</div>""" % \
-            " ".join(x.encode("hex") for x in self.contents)
+        print("""<div class="hexdump">%s</div>""" % hexdump(self.contents))
 
 
 
-def file_to_database(filename):
+def file_to_database(filename, lazy=False):
+    '''Memory-map the data file and read its structure. The map is read-only and shared with the page cache,
+    so only the parts of the file that are looked at are ever read.'''
     
-    with open(filename) as f:
-        text = f.read()
+    with open(filename, "rb") as f:
+        block = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
     
-    return Database(text)
+    return Database(block, lazy=lazy)
 
-def database_to_html(db, filename):
-    
-    with open(filename, "w") as f:
-        
-        sys.stdout = f
-        
-        try:
-        
-            print """
+html_header = """
 <html>
     <head>
         <style type="text/css">
@@ -700,26 +879,113 @@ td, th {
         </style>
     </head>
     <body>
-            """
+"""
 
-            db.print_html()
-            
-            print """
+html_footer = """
     </body>
 </html>
-            """
-            
-        finally:
-            sys.stdout = sys.__stdout__
+"""
+
+def database_to_html(db, filename):
+    
+    with open(filename, "w") as f:
+        with redirect_stdout(f):
+            print(html_header)
+            db.print_html()
+            print(html_footer)
+
+def database_to_html_pages(db, folder, extents_per_page=256):
+    '''Write the database as an index.html and one page per `extents_per_page` extents, one page at a time'''
+    
+    global page_for_offset
+    
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    
+    extent_count = len(db.block) // db.extent_size
+    page_count = max(1, (extent_count + extents_per_page - 1) // extents_per_page)
+    page_name = lambda page: "extents-%06d.html" % page
+    
+    previous_page_for_offset = page_for_offset
+    page_for_offset = lambda offset: page_name(offset // db.extent_size // extents_per_page)
+    try:
+        with open(os.path.join(folder, "index.html"), "w") as f:
+            with redirect_stdout(f):
+                print(html_header)
+                db.print_summary_html()
+                print("""<ul>""")
+                for page in range(page_count):
+                    first = page * extents_per_page * db.extent_size
+                    last = min((page + 1) * extents_per_page, extent_count) * db.extent_size - 1
+                    print("""<li><a href="%s">0x%x - 0x%x</a></li>""" % (page_name(page), first, last))
+                print("""</ul>""")
+                print(html_footer)
+        
+        for page in range(page_count):
+            with open(os.path.join(folder, page_name(page)), "w") as f:
+                with redirect_stdout(f):
+                    print(html_header)
+                    print("""<p><a href="index.html">Index</a>""")
+                    if page > 0:
+                        print(""" | <a href="%s">Previous</a>""" % page_name(page - 1))
+                    if page + 1 < page_count:
+                        print(""" | <a href="%s">Next</a>""" % page_name(page + 1))
+                    print("""</p>""")
+                    start = page * extents_per_page * db.extent_size
+                    for extent in db.iter_extents(start, start + extents_per_page * db.extent_size):
+                        extent.chunk_print_html()
+                    print(html_footer)
+    finally:
+        page_for_offset = previous_page_for_offset
+
+def database_to_json_lines(db, output):
+    '''Write a line with the database summary, then one JSON object per extent'''
+    
+    output.write(json.dumps(db.to_json()) + "\n")
+    for extent in db.iter_extents():
+        output.write(json.dumps(extent.to_json()) + "\n")
+
+def print_data_block(db, block_id, raw=False):
+    '''Print a single block, found through the LBA, as a hexdump or as its raw bytes'''
+    
+    try:
+        chunk = db.data_block(block_id)
+    except KeyError:
+        sys.exit("Block %d is not in the LBA" % block_id)
+    if chunk is None:
+        sys.exit("Block %d is deleted" % block_id)
+    if not chunk.chunk_ok:
+        sys.exit("Block %d: %s" % (block_id, chunk.msg))
+    
+    contents = chunk.chunk_obj.contents
+    if raw:
+        sys.stdout.buffer.write(contents)
+        return
+    
+    extent_offset = chunk.offset - chunk.offset % db.extent_size
+    if extent_offset in db.extents:
+        print("Warning: block %d is inside of a %s" % (block_id, db.extents[extent_offset].name))
+    print("Block %d at 0x%x (extent 0x%x), %d bytes" % (block_id, chunk.offset, extent_offset, len(contents)))
+    for line in range(0, len(contents), 16):
+        row = contents[line: line + 16]
+        print("%08x  %-47s  %s" % (line, row.hex(" "), "".join(chr(x) if 32 <= x < 127 else "." for x in row)))
 
 def database_to_blocks(db):
     
     if not db.metablock or not db.metablock.chunk_ok:
         return {}
     
+    elif db.lazy:
+        blocks = {}
+        for block_id in db.lba:
+            data_block = db.data_block(block_id)
+            if data_block is not None and data_block.chunk_ok:
+                blocks[block_id] = data_block.chunk_obj.contents
+        return blocks
+    
     else:
         blocks = {}
-        for (block_id, data_block) in db.metablock.chunk_obj.data_blocks.iteritems():
+        for (block_id, data_block) in db.metablock.chunk_obj.data_blocks.items():
             if data_block is not None:
                 if data_block.chunk_ok:
                     blocks[block_id] = data_block.chunk_obj.contents
@@ -727,7 +993,31 @@ def database_to_blocks(db):
 
 if __name__ == "__main__":
     
-    if len(sys.argv) == 3:
-        database_to_html(file_to_database(sys.argv[1]), sys.argv[2])
+    parser = argparse.ArgumentParser(description="Visualize the log-serializer structure of a RethinkDB data file")
+    parser.add_argument("data_file")
+    parser.add_argument("output", nargs="?", help="write a single HTML page, parsing the whole file up front")
+    parser.add_argument("--pages", metavar="FOLDER", help="stream paginated HTML into FOLDER")
+    parser.add_argument("--extents-per-page", type=int, default=256, help="extents on each page with --pages (default: %(default)s)")
+    parser.add_argument("--json", metavar="FILE", help="stream one JSON object per extent to FILE, - for stdout")
+    parser.add_argument("--block", type=int, metavar="ID", help="print a single block, found through the LBA")
+    parser.add_argument("--raw", action="store_true", help="with --block: write the raw block contents")
+    options = parser.parse_args()
+    
+    modes = [x for x in (options.output, options.pages, options.json, options.block) if x is not None]
+    if len(modes) != 1:
+        parser.error("exactly one of output, --pages, --json or --block is required")
+    
+    if options.output is not None:
+        database_to_html(file_to_database(options.data_file), options.output)
     else:
-        print "Usage: %s data_file output.html" % sys.argv[0]
+        db = file_to_database(options.data_file, lazy=True)
+        if options.pages is not None:
+            database_to_html_pages(db, options.pages, extents_per_page=options.extents_per_page)
+        elif options.json is not None:
+            if options.json == "-":
+                database_to_json_lines(db, sys.stdout)
+            else:
+                with open(options.json, "w") as f:
+                    database_to_json_lines(db, f)
+        else:
+            print_data_block(db, options.block, raw=options.raw)
@@ -0,0 +1,100 @@
+# Copyright 2010-2016 RethinkDB, all rights reserved.
+
+'''Per-operation records from continuous workloads, and how available the database was around reconfigurations.
+
+A workload started by `workload_runner.ContinuousWorkload` finds a file in the WORKLOAD_EVENTS environment variable
+and appends a fixed-size record to it for every operation: when the operation started, how long it took, and whether
+it succeeded. Workloads that do not know about it simply leave the file empty.
+
+`analyze` lines these records up with the windows in which a scenario was reconfiguring the cluster, and reports for
+each window how long no operation succeeded, how many operations failed, and how much the 99th percentile latency
+grew compared to the operations before the first window.'''
+
+import struct
+
+events_env = 'WORKLOAD_EVENTS'
+
+record = struct.Struct('=ddB') # start time, latency in seconds, 1 if the operation succeeded
+
+settle_time = 5.0 # seconds after a window that errors and latencies are still blamed on it
+
+class EventWriter(object):
+
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+
+    def write(self, start, latency, ok):
+        self.file.write(record.pack(start, latency, 1 if ok else 0))
+
+    def write_packed(self, data):
+        '''Write records that were already packed with `record`, e.g. by another process'''
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+def read_events(path):
+    '''All the complete records in a file, as (start, latency, ok) sorted by start time'''
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return []
+    data = data[:len(data) - len(data) % record.size] # the workload may have been killed mid-write
+    return sorted((start, latency, bool(ok)) for start, latency, ok in record.iter_unpack(data))
+
+def percentile(latencies, p):
+    if not latencies:
+        return None
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.))]
+
+def analyze(events, windows, settle=settle_time):
+    '''`windows` is a list of (label, start, end). Returns a summary dict for each window.'''
+
+    completions = [start + latency for start, latency, ok in events if ok]
+    completions.sort()
+    last_event = max(start + latency for start, latency, ok in events) if events else 0.0
+    first_window = min(start for _, start, _ in windows) if windows else None
+    baseline = [latency for start, latency, ok in events if ok and (first_window is None or start + latency < first_window)]
+    baseline_p99 = percentile(baseline, 99)
+
+    results = []
+    for label, window_start, window_end in windows:
+        until = window_end + settle
+
+        # - the longest time between two successful operations, from the last one before the window to the first
+        #   one after the outage, however long after the window that is
+        before = [t for t in completions if t < window_start]
+        during = [t for t in completions if window_start <= t <= until]
+        after = [t for t in completions if t > until]
+        points = [before[-1] if before else window_start] + during + [after[0] if after else max(window_start, min(until, last_event))]
+        gaps = [b - a for a, b in zip(points, points[1:])]
+        longest = max(gaps) if gaps else 0.0
+        gap_start = points[gaps.index(longest)] if gaps else window_start
+
+        in_window = [(latency, ok) for start, latency, ok in events if window_start <= start <= until]
+        window_p99 = percentile([latency for latency, ok in in_window if ok], 99)
+
+        results.append({
+            'label': label,
+            'start': window_start,
+            'duration': window_end - window_start,
+            'unavailable': longest,
+            'unavailable_from': gap_start - window_start,
+            'operations': len(in_window),
+            'errors': sum(1 for latency, ok in in_window if not ok),
+            'p99': window_p99,
+            'baseline_p99': baseline_p99,
+            'p99_inflation': window_p99 / baseline_p99 if window_p99 is not None and baseline_p99 else None
+        })
+    return results
+
+def format_result(result):
+    line = '%s: unavailable for %.3fs (starting %+.3fs into the %.3fs window), %d of %d operations failed' % (
+        result['label'], result['unavailable'], result['unavailable_from'], result['duration'], result['errors'], result['operations'])
+    if result['p99'] is not None:
+        line += ', p99 %.1fms' % (result['p99'] * 1000)
+        if result['p99_inflation'] is not None:
+            line += ' (x%.2f)' % result['p99_inflation']
+    return line
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# Copyright 2010-2016 RethinkDB, all rights reserved.
+
+'''Batched, seedable generation of the random parts of test documents.
+
+Load generators that build documents one random call at a time (a `random.choice`
+per character, a `uuid.uuid1()` per string) saturate the client CPU long before
+the server. A DocGenerator instead draws a whole batch worth of random bytes in
+a single call and maps them onto the needed alphabet with `bytes.translate`, and
+serves uuid-like strings from a pre-generated pool. The output is a function of
+the seed only, so a run can be reproduced exactly.'''
+
+import array, random, string
+
+alphanumeric = string.ascii_letters + string.digits
+
+__translations = {}
+def _translation(alphabet):
+    '''A (table, delete) pair for `bytes.translate` mapping random bytes evenly onto `alphabet`: the table maps the
+    largest multiple of len(alphabet) byte values onto it, and the remaining values are deleted (rejected)'''
+    if alphabet not in __translations:
+        if not 0 < len(alphabet) <= 256:
+            raise ValueError('alphabet must have between 1 and 256 characters, not %d' % len(alphabet))
+        limit = 256 - 256 % len(alphabet)
+        table = bytes(bytearray(ord(alphabet[value % len(alphabet)]) if value < limit else 0 for value in range(256)))
+        __translations[alphabet] = (table, bytes(bytearray(range(limit, 256))))
+    return __translations[alphabet]
+
+class DocGenerator(object):
+
+    def __init__(self, seed=None, pool_size=65536):
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.pool_size = pool_size
+        self.__uuid_pool = None
+
+    def random_bytes(self, count):
+        if count <= 0:
+            return b''
+        return self.random.getrandbits(8 * count).to_bytes(count, 'little')
+
+    def text(self, length, alphabet=alphanumeric):
+        '''A single random string of `length` characters from `alphabet`'''
+        table, delete = _translation(alphabet)
+        text = b''
+        while len(text) < length:
+            text += self.random_bytes(length - len(text)).translate(table, delete)
+        return text.decode('ascii')
+
+    def strings(self, count, length, alphabet=alphanumeric):
+        '''`count` random strings of `length` characters each, generated as one block'''
+        text = self.text(count * length, alphabet)
+        return [text[i:i + length] for i in range(0, count * length, length)]
+
+    def ints(self, count, low, high):
+        '''`count` random integers between `low` and `high` inclusive, like `random.randint`'''
+        values = array.array('I')
+        values.frombytes(self.random_bytes(count * values.itemsize))
+        span = high - low + 1
+        if span <= 0:
+            raise ValueError('empty range for ints: %d - %d' % (low, high))
+        return [low + value % span for value in values]
+
+    def booleans(self, count):
+        return [value % 2 == 1 for value in bytearray(self.random_bytes(count))]
+
+    def uuid_pool(self):
+        '''The pool of uuid-formatted strings that `uuids` draws from, generated on first use'''
+        if self.__uuid_pool is None:
+            digits = self.random_bytes(16 * self.pool_size).hex()
+            self.__uuid_pool = [
+                '%s-%s-%s-%s-%s' % (digits[i:i + 8], digits[i + 8:i + 12], digits[i + 12:i + 16], digits[i + 16:i + 20], digits[i + 20:i + 32])
+                for i in range(0, len(digits), 32)
+            ]
+        return self.__uuid_pool
+
+    def uuids(self, count):
+        '''`count` uuid-formatted strings. These are drawn from a pool, so they are not unique and must not be used as keys.'''
+        pool = self.uuid_pool()
+        return [pool[i] for i in self.ints(count, 0, len(pool) - 1)]
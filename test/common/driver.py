@@ -5,8 +5,8 @@
 This is designed to simulate normal operations, so does not include support
 for things like `--join`ing to an invalid port."""
 
-import atexit, copy, datetime, os, platform, random, re, shutil, signal
-import socket, string, subprocess, sys, tempfile, time, traceback, warnings
+import atexit, contextlib, copy, datetime, os, platform, random, re, selectors, shutil, signal
+import socket, string, subprocess, sys, tempfile, threading, time, traceback, warnings
 
 import utils, resunder
 
@@ -18,46 +18,80 @@ except ImportError:
 # == resunder support
 
 class Resunder(object):
+    '''Client for the resunder daemon, over one connection that is kept open. Operations made inside `batch()` are
+    sent together and applied as a single transaction.'''
     
     blockedPaths = set()
     
+    client = None
+    lock = threading.RLock()
+    pending = None # operations waiting for the outermost batch to end
+    
     @classmethod
     def unblockAll(cls):
-        for source, dest in cls.blockedPaths:
-            cls.unblock_path(source, dest)
+        with cls.batch():
+            for source, dest in list(cls.blockedPaths):
+                cls.unblock_path(source, dest)
+    
+    @classmethod
+    @contextlib.contextmanager
+    def batch(cls):
+        with cls.lock:
+            outermost = cls.pending is None
+            if outermost:
+                cls.pending = []
+            try:
+                yield
+            finally:
+                if outermost:
+                    operations, cls.pending = cls.pending, None
+                    if operations:
+                        cls.send(operations)
     
     @classmethod
-    def send(cls, operation, source, dest):
+    def send(cls, operations):
         # - fail on MacOS
         if os.uname()[0] == 'Darwin':
             raise Exception('Resunder does not currently run on MacOS, see https://github.com/rethinkdb/rethinkdb/issues/3476')
         
-        # - check that resunder is running
-        # ToDo: fix this to use the pid file and flock
-        psProcess = subprocess.Popen(["ps", "-A", "-www", "-o", "command"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        output, _ = psProcess.communicate()
-        if psProcess.returncode != 0:
-            raise Exception('Unable to use `ps` command! Code: %s, Output: %s' % (psProcess.returncode, output))
-        elif "resunder" not in output:
-            raise Exception('Resunder is not running, please start it as root: `sudo %s/resunder.py start`' % os.path.realpath(os.path.dirname(__file__)))
-        
-        # - send to resunder
-        # ToDo: re-write resunder.py so we can send multiple messages across the same socket
-        resunderSocket = socket.create_connection(("localhost", resunder.resunderPort))
-        resunderSocket.sendall("%s %s %s\n" % (str(operation), str(source), str(dest)))
-        resunderSocket.close()
+        with cls.lock:
+            for attempt in (1, 2):
+                # - connect to resunder
+                if cls.client is None:
+                    try:
+                        cls.client = resunder.ResunderClient()
+                    except socket.error:
+                        raise Exception('Resunder is not running, please start it as root: `sudo %s/resunder.py start`' % os.path.realpath(os.path.dirname(__file__)))
+                
+                # - send, reconnecting once if the connection was lost (e.g.: resunder was restarted)
+                try:
+                    return cls.client.apply(operations)
+                except (IOError, OSError):
+                    cls.client.close()
+                    cls.client = None
+                    if attempt == 2:
+                        raise
+    
+    @classmethod
+    def rules(cls):
+        '''The port pairs resunder currently has blocked'''
+        with cls.lock:
+            cls.send([])
+            return cls.client.rules()
     
     @classmethod
     def block_path(cls, source_port, dest_port):
         cls.blockedPaths.add(tuple([source_port, dest_port]))
-        cls.send('block', source_port, dest_port)
+        with cls.batch():
+            cls.pending.append(('block', source_port, dest_port))
     
     @classmethod
     def unblock_path(cls, source_port, dest_port):
         ports = tuple([source_port, dest_port])
         if ports in cls.blockedPaths:
             cls.blockedPaths.remove(ports)
-        cls.send('unblock', source_port, dest_port)
+        with cls.batch():
+            cls.pending.append(('unblock', source_port, dest_port))
 atexit.register(Resunder.unblockAll)
 
 # == cleanup
@@ -72,6 +106,180 @@ def endRunningServers():
             sys.stderr.flush()
 atexit.register(endRunningServers)
 
+# == log watching
+
+class _FollowedLog(object):
+    '''State for one starting process being followed by a LogWatcher'''
+    
+    def __init__(self, process, timeout):
+        self.process = process
+        self.offset = process._existing_log_len
+        self.partial = b''
+        self.file = None
+        self.folder = None # watched with inotify
+        self.pidfd = None
+        self.deadline = time.time() + timeout
+    
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+
+class LogWatcher(object):
+    '''Follows the log files of all of the starting processes in a Metacluster from a single thread.
+    
+    The thread sleeps on a selector over an inotify descriptor for the log folders and a pidfd for each
+    process, so it wakes as soon as a log line is written or a process exits. Where inotify or pidfds are
+    not available it falls back to polling every `pollInterval` seconds. Anyone waiting on a value from
+    the log waits on `condition`, which is notified after every batch of new lines.'''
+    
+    pollInterval = 0.05
+    idleInterval = 1.0 # safety net even when everything is event-driven
+    
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.__logs = {} # Process => _FollowedLog
+        self.__thread = None
+        self.__selector = None
+        self.__inotify = None
+        self.__wakeFds = None
+    
+    def follow(self, process, timeout=30):
+        '''Start following the log of a just-launched process, until it is ready, exits, or timeout expires'''
+        with self.condition:
+            self.__forget(process)
+            if self.__thread is None:
+                self.__start()
+            log = _FollowedLog(process, timeout)
+            if self.__inotify is not None:
+                try:
+                    folder = os.path.dirname(os.path.realpath(process.logfile_path))
+                    self.__inotify.watch(folder)
+                    log.folder = folder
+                except OSError: pass
+            if hasattr(os, 'pidfd_open'):
+                try:
+                    log.pidfd = os.pidfd_open(process.process.pid)
+                    self.__selector.register(log.pidfd, selectors.EVENT_READ, log)
+                except OSError:
+                    log.pidfd = None
+            self.__logs[process] = log
+        self.__wake()
+    
+    def forget(self, process):
+        '''Stop following a process, e.g.: because it was stopped'''
+        with self.condition:
+            self.__forget(process)
+            self.condition.notify_all()
+    
+    # -- internals, called with the condition held
+    
+    def __start(self):
+        self.__selector = selectors.DefaultSelector()
+        self.__wakeFds = os.pipe()
+        for fd in self.__wakeFds:
+            os.set_blocking(fd, False)
+        self.__selector.register(self.__wakeFds[0], selectors.EVENT_READ)
+        self.__inotify = None
+        if platform.system() == 'Linux':
+            try:
+                self.__inotify = utils.Inotify()
+                self.__selector.register(self.__inotify.fd, selectors.EVENT_READ)
+            except Exception:
+                self.__inotify = None
+        self.__thread = threading.Thread(target=self.__run, name='LogWatcher')
+        self.__thread.daemon = True
+        self.__thread.start()
+    
+    def __stop(self):
+        self.__selector.close()
+        for fd in self.__wakeFds:
+            os.close(fd)
+        if self.__inotify is not None:
+            self.__inotify.close()
+        self.__selector = self.__inotify = self.__wakeFds = self.__thread = None
+    
+    def __forget(self, process):
+        log = self.__logs.pop(process, None)
+        if log is None:
+            return
+        if log.pidfd is not None:
+            self.__selector.unregister(log.pidfd)
+        if log.folder is not None:
+            self.__inotify.unwatch(log.folder)
+        log.close()
+        
+        # - release the start lock if this process was the one holding it
+        if process.cluster._hasStartLock is process:
+            process.cluster._hasStartLock = None
+            process.cluster._startLock.release()
+    
+    def __scan(self, log):
+        '''Read any new lines from the log, returning True once there is nothing more to wait for'''
+        process = log.process
+        if log.file is None and os.path.isfile(process.logfile_path):
+            log.file = open(process.logfile_path, 'rb')
+            log.file.seek(log.offset)
+            process._record_startup('log')
+        if log.file is not None:
+            chunk = log.file.read()
+            if chunk:
+                lines = (log.partial + chunk).split(b'\n')
+                log.partial = lines.pop()
+                for line in lines:
+                    process._parse_log_line(line.rstrip(b'\r').decode('utf-8', 'replace'))
+        return process.ready or process.process is None or process.process.poll() is not None or time.time() > log.deadline
+    
+    # --
+    
+    def __wake(self):
+        with self.condition:
+            if self.__wakeFds is not None:
+                try:
+                    os.write(self.__wakeFds[1], b'x')
+                except OSError: pass # the pipe is full, so a wakeup is already pending
+    
+    def __run(self):
+        while True:
+            with self.condition:
+                if not self.__logs:
+                    self.__stop()
+                    return
+                selector = self.__selector
+                polling = self.__inotify is None or any(log.folder is None or log.pidfd is None for log in self.__logs.values())
+            
+            selector.select(self.pollInterval if polling else self.idleInterval)
+            
+            finished = []
+            with self.condition:
+                if self.__wakeFds is None:
+                    return
+                try:
+                    while os.read(self.__wakeFds[0], 4096):
+                        pass
+                except OSError: pass
+                if self.__inotify is not None:
+                    self.__inotify.drain()
+                
+                for process, log in list(self.__logs.items()):
+                    try:
+                        done = self.__scan(log)
+                    except Exception as e:
+                        warnings.warn('Error while reading the log of %s: %s' % (process._desired_name, str(e)))
+                        done = True
+                    if done:
+                        finished.append((process, time.time() <= log.deadline))
+                        self.__forget(process)
+                self.condition.notify_all()
+            
+            # - piggyback on this to setup Resunder blocking
+            for process, inTime in finished:
+                if inTime:
+                    process.update_routing()
+
 # ==
 
 class Metacluster(object):
@@ -82,8 +290,11 @@ class Metacluster(object):
     __unique_id_counters = None
     _had_multiple_clusters = False
     
+    logWatcher = None # follows the logs of starting processes
+    
     def __init__(self, output_folder=None):
         self.clusters = set()
+        self.logWatcher = LogWatcher()
         self.__unique_id_counters = { 'server':0, 'proxy':0 }
         
         if output_folder is None:
@@ -157,6 +368,7 @@ class Cluster(object):
     
     _startLock = _thread.allocate_lock()
     _hasStartLock = None # the Process that has it
+    _seedAddress = None # (host, cluster port) of the seed server while add_servers is launching a new cluster
     
     def __init__(self, metacluster=None, initial_servers=0, output_folder=None, console_output=True, executable_path=None, server_tags=None, command_prefix=None, extra_options=None, wait_until_ready=True, tls=False):
         
@@ -212,11 +424,7 @@ class Cluster(object):
         
         self.processes = []
         if initial_servers:
-            # start all of the servers, and let the _startLock do its work
-            for name in initial_servers:
-                # The constructor will insert itself into `self.processes`
-                p = Process(cluster=self, name=name, console_output=console_output, executable_path=executable_path, command_prefix=command_prefix, extra_options=extra_options, wait_until_ready=False)
-                assert p in self.processes
+            self.add_servers(initial_servers, console_output=console_output, executable_path=executable_path, command_prefix=command_prefix, extra_options=extra_options, wait_until_ready=False)
         
         # -- wait for all servers to be ready if asked
         
@@ -244,10 +452,59 @@ class Cluster(object):
         for proc in self.processes:
             proc.check()
     
-    def wait_until_ready(self, timeout=30):
+    def add_servers(self, servers, console_output=True, executable_path=None, command_prefix=None, extra_options=None, wait_until_ready=True):
+        '''Launch a number of servers (or a list of names/paths, None for a default name) all at once, returning the new Processes.
+        If no server in the cluster is running the first one becomes the seed: it is started on a pre-chosen cluster port so
+        that the rest can `--join` it right away rather than waiting for it to be ready.'''
+        
+        if isinstance(servers, int):
+            servers = [None for _ in range(servers)]
+        servers = list(servers)
+        
+        launched = []
+        try:
+            if len(servers) > 1 and not any(server.running for server in self.processes):
+                seedOptions = [str(x) for x in extra_options or []]
+                seedPort = None
+                for i, option in enumerate(seedOptions):
+                    if option == '--cluster-port' and i + 1 < len(seedOptions):
+                        seedPort = int(seedOptions[i + 1])
+                    elif option.startswith('--cluster-port='):
+                        seedPort = int(option[len('--cluster-port='):])
+                if not seedPort: # None, or 0 for a random port
+                    seedOptions = [x for x in seedOptions if not x.startswith('--cluster-port=')]
+                    if '--cluster-port' in seedOptions:
+                        del seedOptions[seedOptions.index('--cluster-port'):seedOptions.index('--cluster-port') + 2]
+                    seedPort = utils.get_avalible_port()
+                    seedOptions += ['--cluster-port', str(seedPort)]
+                seed = Process(cluster=self, name=servers.pop(0), console_output=console_output, executable_path=executable_path, command_prefix=command_prefix, extra_options=seedOptions, wait_until_ready=False)
+                launched.append(seed)
+                self._seedAddress = (seed.host, seedPort)
+            for name in servers:
+                # The constructor will insert itself into `self.processes`
+                launched.append(Process(cluster=self, name=name, console_output=console_output, executable_path=executable_path, command_prefix=command_prefix, extra_options=extra_options, wait_until_ready=False))
+        finally:
+            self._seedAddress = None
+        
+        if wait_until_ready:
+            self.wait_until_ready(servers=launched)
+        return launched
+    
+    def wait_until_ready(self, timeout=30, servers=None):
+        '''Wait for all of the servers (by default all in the cluster) to be ready, with a shared deadline'''
+        deadline = time.time() + timeout
+        for server in (self.processes if servers is None else servers):
+            server.wait_until_ready(timeout=max(0, deadline - time.time()))
+    
+    def startup_report(self):
+        '''A table of how long each server took to get to each startup stage, as seconds from launch'''
+        lines = ['%-20s %8s %8s %8s %8s' % ('server', 'exec', 'log', 'ports', 'ready')]
         for server in self.processes:
-            server.wait_until_ready(timeout=timeout)
-        # ToDo: try all of them in parallel to handle the timeout correctly
+            times = server.startupTimes or {}
+            lines.append('%-20s %s' % (server._name or server._desired_name, ' '.join(
+                '%8.3f' % times[stage] if stage in times else '%8s' % '-' for stage in Process.startupStages
+            )))
+        return '\n'.join(lines)
     
     def check_and_stop(self):
         '''Check that all servers are running as expected, then stop them all. Throws an error on unexpected exit codes'''
@@ -327,38 +584,39 @@ class Cluster(object):
             assert isinstance(target, Process)
             servers = [target]
         
-        # - update blocking for all servers
+        # - update blocking for all servers, as one resunder transaction
         allServers = sum([cluster.processes for cluster in self.metacluster.clusters], [])
-        for server in servers:
-            if not all([server._cluster_port, server._local_cluster_port]):
-                continue # not much we can do here
-                
-            for otherServer in allServers:
-                if not otherServer.ready or otherServer is server:
-                    continue # nothing to do here
-                
-                if server.cluster is not otherServer.cluster and server.ready: # active server, block from server outside cluster
-                    # outgoing paths
-                    Resunder.block_path(server.cluster_port,            otherServer.local_cluster_port)
-                    Resunder.block_path(server.cluster_port,            otherServer.cluster_port)
-                    Resunder.block_path(server.local_cluster_port,      otherServer.cluster_port)
-                    Resunder.block_path(server.local_cluster_port,      otherServer.local_cluster_port)
-                    # incoming paths
-                    Resunder.block_path(otherServer.cluster_port,       server.local_cluster_port)
-                    Resunder.block_path(otherServer.cluster_port,       server.cluster_port)
-                    Resunder.block_path(otherServer.local_cluster_port, server.cluster_port)
-                    Resunder.block_path(otherServer.local_cluster_port, server.local_cluster_port)
-                else:
-                    # outgoing paths
-                    Resunder.unblock_path(server.cluster_port,            otherServer.local_cluster_port)
-                    Resunder.unblock_path(server.cluster_port,            otherServer.cluster_port)
-                    Resunder.unblock_path(server.local_cluster_port,      otherServer.cluster_port)
-                    Resunder.unblock_path(server.local_cluster_port,      otherServer.local_cluster_port)
-                    # incoming paths
-                    Resunder.unblock_path(otherServer.cluster_port,       server.local_cluster_port)
-                    Resunder.unblock_path(otherServer.cluster_port,       server.cluster_port)
-                    Resunder.unblock_path(otherServer.local_cluster_port, server.cluster_port)
-                    Resunder.unblock_path(otherServer.local_cluster_port, server.local_cluster_port)
+        with Resunder.batch():
+            for server in servers:
+                if not all([server._cluster_port, server._local_cluster_port]):
+                    continue # not much we can do here
+                    
+                for otherServer in allServers:
+                    if not otherServer.ready or otherServer is server:
+                        continue # nothing to do here
+                    
+                    if server.cluster is not otherServer.cluster and server.ready: # active server, block from server outside cluster
+                        # outgoing paths
+                        Resunder.block_path(server.cluster_port,            otherServer.local_cluster_port)
+                        Resunder.block_path(server.cluster_port,            otherServer.cluster_port)
+                        Resunder.block_path(server.local_cluster_port,      otherServer.cluster_port)
+                        Resunder.block_path(server.local_cluster_port,      otherServer.local_cluster_port)
+                        # incoming paths
+                        Resunder.block_path(otherServer.cluster_port,       server.local_cluster_port)
+                        Resunder.block_path(otherServer.cluster_port,       server.cluster_port)
+                        Resunder.block_path(otherServer.local_cluster_port, server.cluster_port)
+                        Resunder.block_path(otherServer.local_cluster_port, server.local_cluster_port)
+                    else:
+                        # outgoing paths
+                        Resunder.unblock_path(server.cluster_port,            otherServer.local_cluster_port)
+                        Resunder.unblock_path(server.cluster_port,            otherServer.cluster_port)
+                        Resunder.unblock_path(server.local_cluster_port,      otherServer.cluster_port)
+                        Resunder.unblock_path(server.local_cluster_port,      otherServer.local_cluster_port)
+                        # incoming paths
+                        Resunder.unblock_path(otherServer.cluster_port,       server.local_cluster_port)
+                        Resunder.unblock_path(otherServer.cluster_port,       server.cluster_port)
+                        Resunder.unblock_path(otherServer.local_cluster_port, server.cluster_port)
+                        Resunder.unblock_path(otherServer.local_cluster_port, server.local_cluster_port)
     
     def __getitem__(self, pos):
         if isinstance(pos, slice):
@@ -408,6 +666,10 @@ class Process(object):
     returncode = None
     killed = False # True is self.kill() was used
     
+    startupStages = ('exec', 'log', 'ports', 'ready')
+    startupTimes = None # stage => seconds from launch, for the latest start
+    _launchTime = None
+    
     _name = None # cache for actual name 
     _desired_name = None # name to try and run with
     _uuid = None
@@ -661,18 +923,22 @@ class Process(object):
         
         # -- set to join the cluster
         
-        try:
-            self.cluster._startLock.acquire()
-            self.cluster._hasStartLock = self
-            for peer in self.cluster.processes:
-                if peer != self and peer.ready:
-                    options += ["--join", peer.host + ":" + str(peer.cluster_port)]
-                    break
-        finally:
-            # release the lock if we are joining a running cluster
-            if "--join" in options and self.cluster._hasStartLock is self:
-                self.cluster._hasStartLock = None
-                self.cluster._startLock.release()
+        if self.cluster._seedAddress is not None:
+            # the cluster is being launched all at once, join the seed even though it might not be up yet
+            options += ["--join", "%s:%d" % self.cluster._seedAddress]
+        else:
+            try:
+                self.cluster._startLock.acquire()
+                self.cluster._hasStartLock = self
+                for peer in self.cluster.processes:
+                    if peer != self and peer.ready:
+                        options += ["--join", peer.host + ":" + str(peer.cluster_port)]
+                        break
+            finally:
+                # release the lock if we are joining a running cluster
+                if "--join" in options and self.cluster._hasStartLock is self:
+                    self.cluster._hasStartLock = None
+                    self.cluster._startLock.release()
         
         # -- allow subclasses to modify the options array
         
@@ -683,13 +949,16 @@ class Process(object):
         try:
             self._console_file.write("Launching at %s:\n\t%s\n" % (datetime.datetime.now().isoformat(), " ".join(options)))
             self._console_file.flush()
+            self._launchTime = time.time()
+            self.startupTimes = {}
             self.process = subprocess.Popen(options, stdout=self._console_file, stderr=subprocess.STDOUT, preexec_fn=os.setpgrp)
+            self._record_startup('exec')
             
             if not self in runningServers:
                 runningServers.append(self)
             
-            # - start thread to tail output for needed info
-            _thread.start_new_thread(self.read_ports_from_log, ())
+            # - follow the log for the needed info
+            self.cluster.metacluster.logWatcher.follow(self, timeout=self.startupTimeout)
 
         except Exception:
             self.stop()
@@ -715,14 +984,16 @@ class Process(object):
     def __wait_for_value(self, valueName):
         
         deadline = time.time() + self.startupTimeout
-        while deadline > time.time():
-            value = getattr(self, str(valueName))
-            if value is not None:
-                return value
-            self.check()
-            time.sleep(.1)
-        else:
-            raise RuntimeError('Timed out waiting for %s value' % valueName.lstrip('_').replace('_', ' '))
+        condition = self.cluster.metacluster.logWatcher.condition
+        with condition:
+            while deadline > time.time():
+                value = getattr(self, str(valueName))
+                if value is not None:
+                    return value
+                self.check()
+                condition.wait(deadline - time.time())
+            else:
+                raise RuntimeError('Timed out waiting for %s value' % valueName.lstrip('_').replace('_', ' '))
     
     @property
     def cluster_port(self):
@@ -788,73 +1059,46 @@ class Process(object):
     
     def wait_until_ready(self, timeout=30):
         deadline = time.time() + timeout
-        while deadline > time.time():
-            self.check()
-            if self.ready:
-                return
-            else:
-                time.sleep(0.05)
-        else:
-            raise RuntimeError("Timed out after waiting %d seconds for startup of %s." % (timeout, self._desired_name))
+        condition = self.cluster.metacluster.logWatcher.condition
+        with condition:
+            while True:
+                # - check before the deadline, so a server that is already up passes even with no time left
+                self.check()
+                if self.ready:
+                    return
+                if deadline <= time.time():
+                    raise RuntimeError("Timed out after waiting %d seconds for startup of %s." % (timeout, self._desired_name))
+                condition.wait(deadline - time.time())
     
-    def read_ports_from_log(self, timeout=30):
-        deadline = time.time() + timeout
-        
-        # -- wait for the log file to appear
-        
-        while time.time() < deadline:
-            self.check()
-            if os.path.isfile(self.logfile_path):
-                break
+    def _parse_log_line(self, logLine):
+        '''Record any ports, server id, or ready status from a line of the server log'''
+        
+        parsedLine = self.logfilePortRegex.search(logLine)
+        if parsedLine:
+            if parsedLine.group('type') == 'intracluster':
+                self._cluster_port = int(parsedLine.group('port'))
+            elif parsedLine.group('type') == 'client driver':
+                self._driver_port = int(parsedLine.group('port'))
             else:
-                time.sleep(0.1)
-        else:
-            raise RuntimeError("Timed out after %d seconds waiting for the log file to appear at: %s" % (timeout, self.logfile_path))
-        
-        # -- monitor the logfile for the given lines
-        
-        try:
-            for logLine in utils.nonblocking_readline(self.logfile_path, self._existing_log_len):
-                if time.time() > deadline:
-                    raise RuntimeError("Timeout while trying to read ports from log file")
-                if logLine is None:
-                    # - bail out if we are done, or the process is dead
-                    if self.process is None or self.process.poll() is not None or self.ready:
-                        return
-                    time.sleep(0.05)
-                    continue
-                
-                # - see if it matches one we are looking for
-                try:
-                    parsedLine = self.logfilePortRegex.search(logLine)
-                except Exception as e:
-                    warnings.warn('Got unexpected logLine: %s' % repr(logLine))
-                if parsedLine:
-                    if parsedLine.group('type') == 'intracluster':
-                        self._cluster_port = int(parsedLine.group('port'))
-                    elif parsedLine.group('type') == 'client driver':
-                        self._driver_port = int(parsedLine.group('port'))
-                    else:
-                        self._http_port = int(parsedLine.group('port'))
-                    continue
-                
-                parsedLine = self.logfileServerIDRegex.search(logLine)
-                if parsedLine:
-                    self._uuid = parsedLine.group('uuid')
-                
-                parsedLine = self.logfileReadyRegex.search(logLine)
-                if parsedLine:
-                    self._ready_line = True
-                    self._name = parsedLine.group('name')
-                    self._uuid = parsedLine.group('uuid')
-        finally:
-            if self.cluster._hasStartLock is self:
-                self.cluster._hasStartLock = None
-                self.cluster._startLock.release()
+                self._http_port = int(parsedLine.group('port'))
+            if all([self._cluster_port, self._driver_port, self._http_port]):
+                self._record_startup('ports')
+            return
         
-        # -- piggyback on this to setup Resunder blocking
+        parsedLine = self.logfileServerIDRegex.search(logLine)
+        if parsedLine:
+            self._uuid = parsedLine.group('uuid')
         
-        self.update_routing()
+        parsedLine = self.logfileReadyRegex.search(logLine)
+        if parsedLine:
+            self._ready_line = True
+            self._name = parsedLine.group('name')
+            self._uuid = parsedLine.group('uuid')
+            self._record_startup('ready')
+    
+    def _record_startup(self, stage):
+        if self._launchTime is not None and stage not in self.startupTimes:
+            self.startupTimes[stage] = time.time() - self._launchTime
     
     def check(self):
         """Throws an exception if the process has crashed or stopped. """
@@ -916,6 +1160,10 @@ class Process(object):
         if self in runningServers:
             runningServers.remove(self)
         
+        # - stop following the log
+        
+        self.cluster.metacluster.logWatcher.forget(self)
+        
         # - reset Resunder blocking for these ports
         
         self.update_routing()
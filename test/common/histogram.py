@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# Copyright 2010-2016 RethinkDB, all rights reserved.
+
+'''Fixed-memory, mergeable latency histograms.
+
+Values are recorded in seconds and stored as integer microseconds in HDR-style
+log-linear buckets: every power-of-two range is split into the same number of
+linear sub-buckets, so the relative error of any reported value is bounded by
+the number of significant figures regardless of its magnitude. Two histograms
+with the same layout can be merged by adding their counts, which lets many
+processes record independently and ship compact snapshots to one collector.'''
+
+import math
+
+class LatencyHistogram(object):
+
+    unit = 1e-6 # seconds per recorded unit
+
+    def __init__(self, significant_figures=2, highest_trackable=3600.0):
+        if not 1 <= significant_figures <= 5:
+            raise ValueError('significant_figures must be between 1 and 5, got: %r' % significant_figures)
+        self.significant_figures = significant_figures
+        self.highest_trackable = highest_trackable
+
+        largest_single_unit = 2 * 10 ** significant_figures
+        self.sub_bucket_count = 2 ** int(math.ceil(math.log(largest_single_unit, 2)))
+        self.sub_bucket_half_count = self.sub_bucket_count // 2
+        self.sub_bucket_half_count_magnitude = int(math.log(self.sub_bucket_half_count, 2))
+        self.sub_bucket_mask = self.sub_bucket_count - 1
+
+        highest_value = int(highest_trackable / self.unit)
+        smallest_untrackable = self.sub_bucket_count
+        bucket_count = 1
+        while smallest_untrackable <= highest_value:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+        self.highest_value = highest_value
+        self.counts_len = (bucket_count + 1) * self.sub_bucket_half_count
+
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * self.counts_len
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def layout(self):
+        return (self.significant_figures, self.highest_trackable)
+
+    # -- index math
+
+    def _index_for(self, value):
+        bucket_index = (value | self.sub_bucket_mask).bit_length() - (self.sub_bucket_half_count_magnitude + 1)
+        sub_bucket_index = value >> bucket_index
+        return ((bucket_index + 1) << self.sub_bucket_half_count_magnitude) + (sub_bucket_index - self.sub_bucket_half_count)
+
+    def _highest_equivalent(self, index):
+        bucket_index = (index >> self.sub_bucket_half_count_magnitude) - 1
+        sub_bucket_index = (index & (self.sub_bucket_half_count - 1)) + self.sub_bucket_half_count
+        if bucket_index < 0:
+            sub_bucket_index -= self.sub_bucket_half_count
+            bucket_index = 0
+        return ((sub_bucket_index + 1) << bucket_index) - 1
+
+    # -- recording
+
+    def record(self, seconds, count=1):
+        value = max(0, min(int(seconds / self.unit), self.highest_value))
+        self.counts[self._index_for(value)] += count
+        self.count += count
+        self.total += seconds * count
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        self.merge_snapshot(other.snapshot())
+
+    def snapshot(self):
+        '''Return a compact, picklable representation: only non-zero buckets are included.'''
+        return {
+            'layout': self.layout(),
+            'buckets': [(i, c) for i, c in enumerate(self.counts) if c],
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max
+        }
+
+    def merge_snapshot(self, snapshot):
+        if tuple(snapshot['layout']) != self.layout():
+            raise ValueError('Cannot merge histograms with different layouts: %r vs. %r' % (tuple(snapshot['layout']), self.layout()))
+        counts = self.counts
+        for index, count in snapshot['buckets']:
+            counts[index] += count
+        self.count += snapshot['count']
+        self.total += snapshot['total']
+        if snapshot['min'] is not None and (self.min is None or snapshot['min'] < self.min):
+            self.min = snapshot['min']
+        if snapshot['max'] is not None and (self.max is None or snapshot['max'] > self.max):
+            self.max = snapshot['max']
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        significant_figures, highest_trackable = snapshot['layout']
+        histogram = cls(significant_figures=significant_figures, highest_trackable=highest_trackable)
+        histogram.merge_snapshot(snapshot)
+        return histogram
+
+    # -- reporting
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def value_at_percentile(self, percentile):
+        '''Return the latency (in seconds) at or below which `percentile` percent of the samples fall.'''
+        if not self.count:
+            return 0.0
+        target = max(1, int(math.ceil(self.count * min(percentile, 100.0) / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                value = self._highest_equivalent(index) * self.unit
+                return max(self.min, min(value, self.max))
+        return self.max
+
+    def percentiles(self, percentiles=(50, 90, 99, 99.9)):
+        return dict((p, self.value_at_percentile(p)) for p in percentiles)
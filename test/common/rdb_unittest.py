@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # Copyright 2015-2016 RethinkDB, all rights reserved.
 
-import itertools, os, random, re, shutil, sys, traceback, unittest, warnings
+import hashlib, itertools, os, random, re, shutil, sys, traceback, unittest, warnings
 
 try:
     int
@@ -83,6 +83,32 @@ class TestCaseCompatible(unittest.TestCase):
     def replacement_skipTest(self, message):
         sys.stderr.write("%s " % message)
 
+class ServerPool(object):
+    '''Clusters that are done serving one test class, kept running so the next class with the same server settings can lease them'''
+    
+    def __init__(self):
+        self.idle = {} # key => [cluster, ...]
+    
+    def lease(self, key):
+        '''Return a healthy idle cluster for key, or None'''
+        idle = self.idle.get(key) or []
+        while idle:
+            cluster = idle.pop()
+            try:
+                cluster.check()
+                return cluster
+            except Exception:
+                try:
+                    cluster.check_and_stop()
+                except Exception: pass
+        return None
+    
+    def release(self, key, cluster):
+        if cluster.running:
+            self.idle.setdefault(key, []).append(cluster)
+
+serverPool = ServerPool()
+
 class RdbTestCase(TestCaseCompatible):
     
     # -- settings
@@ -99,6 +125,9 @@ class RdbTestCase(TestCaseCompatible):
     cleanTables       = True # set to False if the nothing will be modified in the table
     destructiveTest   = False # if true the cluster should be restarted after this test
     
+    useServerPool     = True # lease an idle cluster left by a previous test class with the same server settings
+    useSnapshots      = True # restore the tables from a data directory snapshot when RDB_SNAPSHOT_DIR is set
+    
     fieldName         = 'id'
     recordsToGenerate = 0
     samplesPerShard   = 5 # when making changes the number of changes to make per shard
@@ -110,6 +139,7 @@ class RdbTestCase(TestCaseCompatible):
     tableNames        = None
     
     __cluster         = None
+    __poolKey         = None # the serverPool key the cluster was created or leased with
     __conn            = None
     __db              = None # r.db(dbName)
     __table           = None # r.db(dbName).table(tableName)
@@ -246,6 +276,88 @@ class RdbTestCase(TestCaseCompatible):
         res = list(self.r.db('rethinkdb').table('current_issues').filter(self.r.row["type"] != "memory_error").run(self.conn))
         assert res == [], 'There were unexpected issues: \n%s' % utils.RePrint.pformat(res)
     
+    # -- server pool and snapshots
+    
+    def serverCount(self):
+        return max(self.shards * self.replicas, len(self.servers) if hasattr(self.servers, '__iter__') else self.servers or 0)
+    
+    def serverPoolKey(self):
+        '''Classes with the same key can run on clusters left over by each other'''
+        return repr((self.use_tls, self.server_command_prefix, self.server_extra_options, self.serverCount(), self.servers if hasattr(self.servers, '__iter__') else None))
+    
+    def snapshotPath(self):
+        '''The folder holding the data snapshot for the table settings of this class, or None if snapshots are not in use.
+        The key includes the server executable, so a rebuild invalidates old snapshots.'''
+        
+        snapshotDir = os.environ.get('RDB_SNAPSHOT_DIR')
+        if not snapshotDir or not self.useSnapshots or self.use_tls: # tls certificates are created for each cluster
+            return None
+        
+        executable = utils.find_rethinkdb_executable()
+        executableStat = os.stat(executable)
+        populateTable = self.__class__.populateTable
+        settings = repr((
+            executable, executableStat.st_size, int(executableStat.st_mtime),
+            self.serverPoolKey(), self.shards, self.replicas,
+            self.dbName, self.tableNames, self.recordsToGenerate, self.fieldName,
+            populateTable.__module__, getattr(populateTable, '__qualname__', populateTable.__name__)
+        ))
+        return os.path.join(os.path.realpath(snapshotDir), hashlib.sha1(settings.encode('utf-8')).hexdigest())
+    
+    def saveSnapshot(self, snapshotPath):
+        '''Cleanly stop the cluster, copy the server data folders to snapshotPath, and bring the cluster back up'''
+        
+        self.cluster.check_and_stop()
+        try:
+            # - copy into a temporary folder then rename, so concurrent runs never see a partial snapshot
+            parentDir = os.path.dirname(snapshotPath)
+            if not os.path.isdir(parentDir):
+                os.makedirs(parentDir)
+            workingPath = '%s.%d.tmp' % (snapshotPath, os.getpid())
+            os.mkdir(workingPath)
+            try:
+                serverNames = []
+                for server in self.cluster:
+                    serverNames.append(os.path.basename(server.data_path))
+                    shutil.copytree(server.data_path, os.path.join(workingPath, serverNames[-1]), ignore=shutil.ignore_patterns(driver.Process._console_file_name))
+                with open(os.path.join(workingPath, 'servers'), 'w') as manifest:
+                    manifest.write('\n'.join(serverNames) + '\n')
+                os.rename(workingPath, snapshotPath)
+            except Exception as e:
+                shutil.rmtree(workingPath, ignore_errors=True)
+                if not os.path.isdir(snapshotPath): # another run may have beaten us to it
+                    warnings.warn('Unable to save the table snapshot at %s: %s' % (snapshotPath, str(e)))
+        finally:
+            for server in self.cluster:
+                server.start(wait_until_ready=False)
+            self.cluster.wait_until_ready()
+            self.__class__.__conn = None
+        
+        for tableName in self.tableNames or []:
+            self.db.table(tableName).wait().run(self.conn)
+    
+    def restoreSnapshot(self, snapshotPath):
+        '''Start a new cluster on clones of the server data folders in snapshotPath'''
+        
+        cluster = driver.Cluster(tls=self.use_tls)
+        with open(os.path.join(snapshotPath, 'servers')) as manifest:
+            serverNames = [x.strip() for x in manifest if x.strip()]
+        dataPaths = [os.path.join(cluster.output_folder, name) for name in serverNames]
+        for name, dataPath in zip(serverNames, dataPaths):
+            utils.clone_tree(os.path.join(snapshotPath, name), dataPath)
+        cluster.add_servers(dataPaths, console_output=True, command_prefix=self.server_command_prefix, extra_options=self.server_extra_options, wait_until_ready=False)
+        return cluster
+    
+    @classmethod
+    def tearDownClass(cls):
+        '''Return a healthy cluster to the pool for the next class'''
+        cluster = cls.__cluster
+        if cluster is not None and cls.useServerPool and not cls.destructiveTest:
+            serverPool.release(cls.__poolKey, cluster)
+            cls.__cluster = None
+            cls.__conn    = None
+            cls.__table   = None
+    
     def setUp(self):
         
         # -- start the servers
@@ -265,23 +377,33 @@ class RdbTestCase(TestCaseCompatible):
         
         # - ensure we have a cluster
         
+        restored = False # the tables were restored from a snapshot
+        leased = False # the tables were left by another class
+        newCluster = False
+        snapshotPath = self.snapshotPath()
         if self.cluster is None:
-            self.__class__.__cluster = driver.Cluster(tls=self.use_tls)
-        
-        # - make sure we have any named servers
+            poolKey = self.serverPoolKey()
+            if snapshotPath and os.path.isdir(snapshotPath):
+                self.__class__.__cluster = self.restoreSnapshot(snapshotPath)
+                restored = True
+            elif self.useServerPool:
+                self.__class__.__cluster = serverPool.lease(poolKey)
+                leased = self.cluster is not None
+            if self.cluster is None:
+                self.__class__.__cluster = driver.Cluster(tls=self.use_tls)
+                newCluster = True
+            self.__class__.__poolKey = poolKey
+        
+        # - make sure we have any named servers, and the proper number of servers
+        # note: we start up enough servers to make sure they each have only one role
         
+        newServers = []
         if hasattr(self.servers, '__iter__'):
-            for name in self.servers:
-                firstServer = len(self.cluster) == 0
-                if not name in self.cluster:
-                    driver.Process(cluster=self.cluster, name=name, console_output=True, command_prefix=self.server_command_prefix, extra_options=self.server_extra_options, wait_until_ready=firstServer)
-        
-        # - ensure we have the proper number of servers
-        # note: we start up enough servers to make sure they each have only one role
-        serverCount = max(self.shards * self.replicas, len(self.servers) if hasattr(self.servers, '__iter__') else self.servers or 0)
-        for _ in range(serverCount - len(self.cluster)):
-            firstServer = len(self.cluster) == 0
-            driver.Process(cluster=self.cluster, console_output=True, command_prefix=self.server_command_prefix, extra_options=self.server_extra_options, wait_until_ready=firstServer)
+            existingNames = [server.name for server in self.cluster]
+            newServers += [name for name in self.servers if not name in existingNames]
+        newServers += [None for _ in range(self.serverCount() - len(self.cluster) - len(newServers))]
+        if newServers:
+            self.cluster.add_servers(newServers, console_output=True, command_prefix=self.server_command_prefix, extra_options=self.server_extra_options, wait_until_ready=False)
         
         self.cluster.wait_until_ready()
         
@@ -291,28 +413,36 @@ class RdbTestCase(TestCaseCompatible):
         
         # -- setup test tables
         
-        # - drop all tables unless cleanTables is set to False
-        if self.cleanTables:
-            self.r.db('rethinkdb').table('table_config').filter({'db':self.dbName}).delete().run(self.conn)
-        
-        for tableName in (x for x in (self.tableNames or []) if x not in self.r.db(self.dbName).table_list().run(self.conn)):
-            # - create the table
-            self.r.db(self.dbName).table_create(tableName).run(self.conn)
-            table = self.db.table(tableName)
-            
-            # - add initial records
-            self.populateTable(conn=self.conn, table=table, records=self.recordsToGenerate, fieldName=self.fieldName)
+        if restored:
+            for tableName in self.tableNames or []:
+                self.db.table(tableName).wait().run(self.conn)
+        else:
+            # - drop all tables unless cleanTables is set to False
+            if self.cleanTables or leased:
+                self.r.db('rethinkdb').table('table_config').filter({'db':self.dbName}).delete().run(self.conn)
             
-            # - shard and replicate the table
-            primaries = iter(self.cluster[:self.shards])
-            replicas = iter(self.cluster[self.shards:])
+            for tableName in (x for x in (self.tableNames or []) if x not in self.r.db(self.dbName).table_list().run(self.conn)):
+                # - create the table
+                self.r.db(self.dbName).table_create(tableName).run(self.conn)
+                table = self.db.table(tableName)
+                
+                # - add initial records
+                self.populateTable(conn=self.conn, table=table, records=self.recordsToGenerate, fieldName=self.fieldName)
+                
+                # - shard and replicate the table
+                primaries = iter(self.cluster[:self.shards])
+                replicas = iter(self.cluster[self.shards:])
+                
+                shardPlan = []
+                for primary in primaries:
+                    chosenReplicas = [next(replicas).name for _ in range(0, self.replicas - 1)]
+                    shardPlan.append({'primary_replica':primary.name, 'replicas':[primary.name] + chosenReplicas})
+                assert (table.config().update({'shards':shardPlan}).run(self.conn))['errors'] == 0
+                table.wait().run(self.conn)
             
-            shardPlan = []
-            for primary in primaries:
-                chosenReplicas = [next(replicas).name for _ in range(0, self.replicas - 1)]
-                shardPlan.append({'primary_replica':primary.name, 'replicas':[primary.name] + chosenReplicas})
-            assert (table.config().update({'shards':shardPlan}).run(self.conn))['errors'] == 0
-            table.wait().run(self.conn)
+            # - save the tables for the next run with the same settings
+            if newCluster and snapshotPath and self.tableNames:
+                self.saveSnapshot(snapshotPath)
         
         # -- run setUpClass if not run otherwise
         
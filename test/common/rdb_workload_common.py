@@ -21,9 +21,12 @@ def make_table_and_connection(opts):
         db, table = opts['table'].split('.')
         yield (r.db(db).table(table), conn)
 
-def insert_many(host="localhost", port=28015, database="test", table=None, count=10000, conn=None):
+def insert_many(host="localhost", port=28015, database="test", table=None, count=10000, conn=None, workers=4, connect=None):
+    '''`connect` makes the connections of the extra workers, by default copies of `conn` (see utils.cloneConnection)'''
     if not conn:
         conn = r.connect(host, port)
+    if connect is None:
+        connect = lambda: utils.cloneConnection(conn)
 
     def gen(i):
         return {'val': "X" * (i % 100)}
@@ -31,12 +34,7 @@ def insert_many(host="localhost", port=28015, database="test", table=None, count
     if isinstance(table, str) or isinstance(table, str):
         table = r.db(database).table(table)
 
-    batch_size = 1000
-    for start in range(0, count, batch_size):
-        end = min(start + batch_size, count)
-        res = table.insert([gen(i) for i in range(start, end)]).run(conn)
-        if res.get('first_error'):
-            raise Exception("Insert failed: " + res.get('first_error'))
-        assert res['inserted'] == end - start
+    utils.BulkLoader(table, count, connect, document=gen, conn=conn, workers=workers,
+                     durability='hard', quiet=True).load()
 
     print("inserted %d documents into %s" % (count, table))
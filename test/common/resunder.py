@@ -2,7 +2,7 @@
 # Copyright 2010-2015 RethinkDB, all rights reserved.
 
 
-import atexit, copy, logging, os, re, socket, subprocess, sys, time
+import atexit, copy, json, logging, os, re, selectors, shutil, socket, subprocess, sys, time
 from signal import SIGTERM
 
 pidFilePath = '/tmp/resunder-daemon.pid'
@@ -116,7 +116,7 @@ class Daemon:
         try:
             # first attempt to shutdown the daemon by issuing a shutdown command
             conn = socket.create_connection(("localhost", resunderPort))
-            conn.sendall("shutdown\n")
+            conn.sendall(b"shutdown\n")
             conn.close()
             time.sleep(0.2)
             while 1:
@@ -144,89 +144,298 @@ class Daemon:
         daemonized by start() or restart().
         """
 
+# == packet filtering backends, each applies a batch of (source_port, dest_port) changes as one step
+
+def check_output(command, input=None):
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate(input)[0]
+    if process.returncode != 0:
+        raise Exception('%s failed (%d): %s' % (' '.join(command), process.returncode, output.decode('utf-8', 'replace').strip()))
+    return output
+
+class NftablesBackend(object):
+    '''Keeps the blocked port pairs in an nftables set, matched by one rule in each direction for both IPv4 and IPv6.
+    Each batch is a single `nft` transaction.'''
+    
+    name = 'nft'
+    table = 'inet resunder'
+    
+    def setup(self):
+        # add-then-delete clears out any table left over by an earlier run
+        check_output(['nft', '-f', '-'], input=('''
+add table %(table)s
+delete table %(table)s
+table %(table)s {
+    set blocked {
+        type inet_service . inet_service
+    }
+    chain output {
+        type filter hook output priority 0; policy accept;
+        tcp sport . tcp dport @blocked drop
+    }
+    chain input {
+        type filter hook input priority 0; policy accept;
+        tcp dport . tcp sport @blocked drop
+    }
+}
+''' % {'table': self.table}).encode('utf-8'))
+    
+    def apply(self, block, unblock):
+        script = ''
+        if block:
+            script += 'add element %s blocked { %s }\n' % (self.table, ', '.join('%d . %d' % ports for ports in block))
+        if unblock:
+            script += 'delete element %s blocked { %s }\n' % (self.table, ', '.join('%d . %d' % ports for ports in unblock))
+        if script:
+            check_output(['nft', '-f', '-'], input=script.encode('utf-8'))
+    
+    def cleanup(self):
+        check_output(['nft', 'delete', 'table'] + self.table.split())
+
+class IptablesBackend(object):
+    '''One iptables and ip6tables rule per direction for each blocked port pair, for machines without nftables'''
+    
+    name = 'iptables'
+    
+    def setup(self):
+        pass
+    
+    def rules(self, action, source_port, dest_port):
+        args_out = ["-%sOUTPUT" % action, "-ptcp", "--sport", str(source_port), "--dport", str(dest_port), "-jDROP", "-m", "comment", "--comment", "resunder"]
+        args_in = ["-%sINPUT" % action, "-ptcp", "--sport", str(dest_port), "--dport", str(source_port), "-jDROP", "-m", "comment", "--comment", "resunder"]
+        return [["iptables"] + args_out, ["iptables"] + args_in, ["ip6tables"] + args_out, ["ip6tables"] + args_in]
+    
+    def apply(self, block, unblock):
+        for source_port, dest_port in block:
+            for command in self.rules("A", source_port, dest_port):
+                check_output(command)
+        for source_port, dest_port in unblock:
+            for command in self.rules("D", source_port, dest_port):
+                check_output(command)
+    
+    def cleanup(self):
+        pass
+
+class MemoryBackend(object):
+    '''Only records the port pairs, so the daemon and its protocol can be run without root'''
+    
+    name = 'memory'
+    
+    def __init__(self):
+        self.blocked = set()
+        self.transactions = 0
+    
+    def setup(self):
+        self.blocked = set()
+    
+    def apply(self, block, unblock):
+        self.blocked.update(block)
+        self.blocked.difference_update(unblock)
+        self.transactions += 1
+    
+    def cleanup(self):
+        self.blocked = set()
+
+backends = {backend.name: backend for backend in (NftablesBackend, IptablesBackend, MemoryBackend)}
+
+def default_backend():
+    return NftablesBackend() if shutil.which('nft') else IptablesBackend()
+
+# == daemon
+
 class ResunderDaemon(Daemon):
+    '''Blocks traffic between pairs of ports. Clients keep a connection open and send newline-terminated JSON requests:
+    
+        {"operations": [["block", source_port, dest_port], ["unblock", source_port, dest_port], ...]}
+        {"query": "rules"}
+        {"shutdown": true}
+    
+    and get back one line per request: {"ok": true, "blocked": [[source_port, dest_port], ...]} or {"ok": false, "error": ...}
+    A batch of operations is applied all together or not at all. The older one-shot "block|unblock source dest" lines
+    are still accepted, without a response.'''
     
-    blocked_ports = None
+    blocked_ports = None # (source_port, dest_port) => time blocked
+    backend = None
+    port = resunderPort
+    
+    expiry = 60 * 60 * 24 # rules older than this are removed
+    
+    def __init__(self, pidfile, backend=None, port=resunderPort, **kwargs):
+        Daemon.__init__(self, pidfile, **kwargs)
+        self.backend = backend
+        self.port = port
     
     def run(self):
         logger.info('Starting resunder')
-        # TODO: keep a dict of blocked sockets and unblock them on shutdown
-        listener = socket.socket()
-        listener.bind(("localhost", 46594))
-        listener.listen(3)
-        listener.settimeout(3600) # Wake up every hour to clear out old rules
+        if self.backend is None:
+            self.backend = default_backend()
+        self.backend.setup()
         self.blocked_ports = {}
-        while True:
+        
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(("localhost", self.port))
+        listener.listen(16)
+        selector = selectors.DefaultSelector()
+        selector.register(listener, selectors.EVENT_READ)
+        buffers = {} # client socket => unprocessed input
+        try:
+            while True:
+                events = selector.select(timeout=3600) # Wake up every hour to clear out old rules
+                if not events:
+                    self.expire()
+                    continue
+                for key, _ in events:
+                    if key.fileobj is listener:
+                        client, addr = listener.accept()
+                        selector.register(client, selectors.EVENT_READ)
+                        buffers[client] = b''
+                        continue
+                    client = key.fileobj
+                    try:
+                        data = client.recv(65536)
+                    except socket.error:
+                        data = b''
+                    if not data:
+                        selector.unregister(client)
+                        del buffers[client]
+                        client.close()
+                        continue
+                    buffers[client] += data
+                    while b'\n' in buffers[client]:
+                        line, buffers[client] = buffers[client].split(b'\n', 1)
+                        response = self.handle(line.decode('utf-8', 'replace').strip())
+                        if response is False:
+                            logger.info('Shutting down resunder')
+                            return # atexit handler will take care of cleanup
+                        if response is not None:
+                            try:
+                                client.sendall(json.dumps(response).encode('utf-8') + b'\n')
+                            except socket.error as e:
+                                logger.warning('unable to respond to a client: %s' % str(e))
+        finally:
+            for client in buffers:
+                client.close()
+            listener.close()
+            selector.close()
+    
+    def handle(self, line):
+        '''Process one request, returning the response, None for no response, or False to shut down'''
+        legacy = re.match(r"(block|unblock) (\d+) (\d+)$", line)
+        if legacy is not None:
             try:
-                client, addr = listener.accept()
-                data = str(client.recv(1024))
-                matches = re.match(r"(block|unblock) (\d+) (\d+)$", data)
-                if matches is not None:
-                    operation = matches.group(1)
-                    source_port = matches.group(2)
-                    dest_port = matches.group(3)
-                    if int(source_port) < 10000 or int(source_port) > 65535 or int(dest_port) < 10000 or int(dest_port) > 65535:
-                        logger.warning("invalid port specified: %r" % data)
-                    elif operation == "block":
-                        self.block_port(source_port, dest_port)
-                    elif operation == "unblock":
-                        self.unblock_port(source_port, dest_port)
-                elif data.strip() == "shutdown":
-                    logger.info('Shutting down resunder')
-                    return # atexit handler will take care of cleanup
-                else:
-                    logger.warning('got bad input: %r' % data)
-            except socket.timeout:
-                unblock = []
-                for ports, creation_time in self.blocked_ports:
-                    if creation_time < time.time() - (60 * 60 * 24): # find and remove rules older than 1 day
-                        unblock.append(ports)
-                for source_port, dest_port in unblock:
-                    self.unblock_port(source_port, dest_port)
-                    
+                self.apply([legacy.groups()])
             except Exception as e:
                 logger.error(str(e))
-
-    def block_port(self, source_port, dest_port):
-        if (source_port, dest_port) in self.blocked_ports:
-            logger.debug('asked to block ports that were already on the blocked list: %s <-> %s' % (source_port, dest_port))
-            return
-
-        self.blocked_ports[tuple([source_port, dest_port])] = time.time()
-        args_out = ["-AOUTPUT", "-ptcp", "--sport", source_port, "--dport", dest_port, "-jDROP", "-m", "comment", "--comment", "resunder"]
-        args_in = ["-AINPUT", "-ptcp", "--sport", dest_port, "--dport", source_port, "-jDROP", "-m", "comment", "--comment", "resunder"]
-        subprocess.check_call(["iptables"] + args_out, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
-        subprocess.check_call(["iptables"] + args_in, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
-        subprocess.check_call(["ip6tables"] + args_out, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
-        subprocess.check_call(["ip6tables"] + args_in, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
-        logger.info('blocked %s <-> %s' % (source_port, dest_port))
-
-    def unblock_port(self, source_port, dest_port):
-        if not (source_port, dest_port) in self.blocked_ports:
-            logger.debug('asked to unblock ports that were not on the blocked list: %s <-> %s' % (source_port, dest_port))
-            return
+            return None
+        elif line == "shutdown":
+            return False
         
-        args_out = ["-DOUTPUT", "-ptcp", "--sport", source_port, "--dport", dest_port, "-jDROP", "-m", "comment", "--comment", "resunder"]
-        args_in = ["-DINPUT", "-ptcp", "--sport", dest_port, "--dport", source_port, "-jDROP", "-m", "comment", "--comment", "resunder"]
-        subprocess.check_call(["iptables"] + args_out, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
-        subprocess.check_call(["iptables"] + args_in, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
-        subprocess.check_call(["ip6tables"] + args_out, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
-        subprocess.check_call(["ip6tables"] + args_in, stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('requests must be JSON objects')
+            if request.get('shutdown'):
+                return False
+            if 'operations' in request:
+                self.apply(request['operations'])
+            elif request.get('query') != 'rules':
+                raise ValueError('unknown request')
+            return {'ok': True, 'blocked': sorted(self.blocked_ports)}
+        except Exception as e:
+            logger.warning('got bad input: %r (%s)' % (line, str(e)))
+            return {'ok': False, 'error': str(e)}
+    
+    def apply(self, operations):
+        '''Apply a list of (block|unblock, source_port, dest_port) as one transaction'''
         
-        del self.blocked_ports[tuple([source_port, dest_port])]
-        logger.info('unblocked %s <-> %s' % (source_port, dest_port))
+        # - validate everything before changing anything
+        changes = []
+        for operation in operations:
+            try:
+                action, source_port, dest_port = operation
+                ports = (int(source_port), int(dest_port))
+            except (TypeError, ValueError):
+                raise ValueError('invalid operation: %r' % (operation,))
+            if action not in ('block', 'unblock'):
+                raise ValueError('invalid operation: %r' % (operation,))
+            if not all(10000 <= port <= 65535 for port in ports):
+                raise ValueError('invalid port specified: %r' % (operation,))
+            changes.append((action, ports))
+        
+        # - work out the net change, so later operations in the batch win
+        final = {}
+        for action, ports in changes:
+            final[ports] = action
+        block = sorted(ports for ports, action in final.items() if action == 'block' and ports not in self.blocked_ports)
+        unblock = sorted(ports for ports, action in final.items() if action == 'unblock' and ports in self.blocked_ports)
+        
+        # - apply
+        self.backend.apply(block, unblock)
+        now = time.time()
+        for ports in block:
+            self.blocked_ports[ports] = now
+        for ports in unblock:
+            del self.blocked_ports[ports]
+        if block or unblock:
+            logger.info('blocked %d and unblocked %d port pairs: %s' % (len(block), len(unblock), ', '.join(
+                ['%d <-> %d' % ports for ports in block] + ['%d <-/-> %d' % ports for ports in unblock])))
+    
+    def block_port(self, source_port, dest_port):
+        self.apply([('block', source_port, dest_port)])
+    
+    def unblock_port(self, source_port, dest_port):
+        self.apply([('unblock', source_port, dest_port)])
+    
+    def expire(self):
+        cutoff = time.time() - self.expiry
+        self.apply([('unblock',) + ports for ports, creation_time in self.blocked_ports.items() if creation_time < cutoff])
     
     def unblock_all(self):
-        # ToDo: unblock all of the iptables entries with the comment "resunder"
-        if not self.blocked_ports:
-            return
-        for source_port, dest_port in list(self.blocked_ports.keys()):
-            self.unblock_port(source_port, dest_port)
+        if self.blocked_ports:
+            self.apply([('unblock',) + ports for ports in self.blocked_ports])
+        if self.backend is not None:
+            self.backend.cleanup()
+
+# == client
+
+class ResunderClient(object):
+    '''A persistent connection to the resunder daemon'''
+    
+    def __init__(self, port=resunderPort, host='localhost', timeout=30):
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.reader = self.socket.makefile('rb')
+    
+    def request(self, **request):
+        self.socket.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        line = self.reader.readline()
+        if not line:
+            raise IOError('resunder closed the connection')
+        response = json.loads(line.decode('utf-8'))
+        if not response.get('ok'):
+            raise Exception('resunder rejected the request: %s' % response.get('error'))
+        return response
+    
+    def apply(self, operations):
+        '''Send a batch of (block|unblock, source_port, dest_port), returning the port pairs now blocked'''
+        return [tuple(ports) for ports in self.request(operations=[list(operation) for operation in operations])['blocked']]
+    
+    def rules(self):
+        return [tuple(ports) for ports in self.request(query='rules')['blocked']]
+    
+    def close(self):
+        try:
+            self.reader.close()
+            self.socket.close()
+        except Exception: pass
 
 if __name__ == "__main__":
     
     # connect the logger to the log file
-    fileLogger = logging.FileHandler('/var/log/resunder.log')
+    try:
+        fileLogger = logging.FileHandler('/var/log/resunder.log')
+    except IOError: # not root, e.g. `inline memory`
+        fileLogger = logging.StreamHandler()
     fileLogger.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
     fileLogger.setLevel(logging.INFO)
     logger.addHandler(fileLogger) 
@@ -234,7 +443,11 @@ if __name__ == "__main__":
     daemon = ResunderDaemon(pidFilePath)
     atexit.register(daemon.unblock_all) # ensure cleanup
     
-    if len(sys.argv) == 2:
+    if len(sys.argv) == 3 and sys.argv[1] == 'inline' and sys.argv[2] in backends:
+        daemon.backend = backends[sys.argv[2]]()
+        daemon.run()
+        sys.exit(0)
+    elif len(sys.argv) == 2:
         if 'start' == sys.argv[1]:
             if os.geteuid() != 0:
                 print("Cannot start daemon without root access")
@@ -246,10 +459,13 @@ if __name__ == "__main__":
             daemon.restart()
         elif 'inline' == sys.argv[1]:
             daemon.run()
+        elif 'rules' == sys.argv[1]:
+            for source_port, dest_port in ResunderClient().rules():
+                print('%d <-> %d' % (source_port, dest_port))
         else:
             print("Unknown command")
             sys.exit(2)
         sys.exit(0)
     else:
-        print("usage: %s start|stop|restart" % sys.argv[0])
+        print("usage: %s start|stop|restart|rules|inline [%s]" % (sys.argv[0], '|'.join(sorted(backends))))
         sys.exit(2)
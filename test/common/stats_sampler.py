@@ -0,0 +1,230 @@
+# Copyright 2010-2016 RethinkDB, all rights reserved.
+
+'''Records server side counters while a workload runs.
+
+A `StatsSampler` polls `rethinkdb.stats`, `table_status` and `current_issues` from a background thread, on its own
+connection, and keeps them as columns of numbers sharing one list of sample times:
+
+    {"start": 1460000000.0, "interval": 1.0, "time": [0.0, 1.0, ...],
+     "columns": {"server:grey/query_engine.read_docs_per_sec": [0, 1510, ...], ...},
+     "issues": [{"time": 12.0, "issues": [...]}, ...], "errors": [...]}
+
+Columns are named `<row>/<field path>`, where the row is `cluster`, `server:<name>`, `table:<db>.<table>`,
+`table_server:<db>.<table>@<server>` or `status:<db>.<table>`. A column that only appears part way through the run
+is padded with nulls, so every column lines up with `time`. Issues are only recorded when they change.
+
+The file is rewritten every `flushInterval` seconds, so a test that dies still leaves most of its samples behind.
+Setting RDB_STATS_INTERVAL to 0 turns off the samplers that are attached automatically.'''
+
+import json, os, threading, time, warnings
+
+import utils
+
+default_interval = float(os.environ.get('RDB_STATS_INTERVAL', 1.0))
+
+def unique_path(path):
+    '''`path`, or the first of path.2, path.3... (before the extension) that does not exist yet'''
+    base, extension = os.path.splitext(path)
+    i = 1
+    while os.path.exists(path):
+        i += 1
+        path = '%s.%d%s' % (base, i, extension)
+    return path
+
+def flatten(value, prefix, into):
+    '''Add the numbers (and booleans, as 0 or 1) in a nested dict to `into`, keyed by their dotted path'''
+    if isinstance(value, dict):
+        for key, child in value.items():
+            flatten(child, prefix + '.' + key if prefix else key, into)
+    elif isinstance(value, bool):
+        into[prefix] = int(value)
+    elif isinstance(value, (int, float)):
+        into[prefix] = value
+
+def stats_row_name(row):
+    kind = row['id'][0]
+    if kind == 'cluster':
+        return 'cluster'
+    elif kind == 'server':
+        return 'server:%s' % row['server']
+    elif kind == 'table':
+        return 'table:%s.%s' % (row['db'], row['table'])
+    elif kind == 'table_server':
+        return 'table_server:%s.%s@%s' % (row['db'], row['table'], row['server'])
+    else:
+        return ':'.join(str(x) for x in row['id'])
+
+class StatsSampler(object):
+
+    flushInterval = 10.0
+    connectTimeout = 5
+
+    def __init__(self, targets, output_path, interval=None):
+        '''`targets` is a list of (host, port) to connect to, or a function returning one, tried in order whenever a
+        connection is needed'''
+        self.targets = targets
+        self.output_path = output_path
+        self.interval = default_interval if interval is None else interval
+
+        self.start_time = None
+        self.times = []
+        self.columns = {}
+        self.issues = []
+        self.errors = []
+
+        self.__lastIssues = None
+        self.__thread = None
+        self.__stopEvent = threading.Event()
+        self.__conn = None
+        self.__r = None
+
+    @classmethod
+    def for_cluster(cls, cluster, output_path=None, interval=None):
+        '''Sample through whichever servers of `cluster` are running, writing to its output folder by default'''
+        if output_path is None:
+            output_path = unique_path(os.path.join(cluster.output_folder, 'stats.json'))
+        return cls(lambda: [(server.host, server.driver_port) for server in cluster if server.running], output_path, interval=interval)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exitType, value, traceback):
+        self.stop()
+
+    def start(self):
+        if not self.interval or self.__thread is not None:
+            return
+        try:
+            self.__r = utils.import_python_driver()
+        except Exception as e:
+            warnings.warn('Not sampling server stats, the Python driver is not available: %s' % str(e))
+            return
+        self.start_time = time.time()
+        self.__stopEvent.clear()
+        self.__thread = threading.Thread(target=self.__run, name='StatsSampler')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is None:
+            return
+        self.__stopEvent.set()
+        self.__thread.join()
+        self.__thread = None
+        self.write()
+
+    def write(self):
+        data = {
+            'start': self.start_time,
+            'interval': self.interval,
+            'time': self.times,
+            'columns': self.columns,
+            'issues': self.issues,
+            'errors': self.errors
+        }
+        try:
+            with open(self.output_path + '.tmp', 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.rename(self.output_path + '.tmp', self.output_path)
+        except (IOError, OSError) as e:
+            warnings.warn('Unable to write server stats to %s: %s' % (self.output_path, str(e)))
+
+    def sample(self):
+        '''Take one sample, returns False if no server could be reached'''
+        r = self.__r
+        conn = self.__connection()
+        if conn is None:
+            return False
+        sampled = time.time()
+        try:
+            result = r.expr({
+                'stats': r.db('rethinkdb').table('stats').coerce_to('array'),
+                'status': r.db('rethinkdb').table('table_status').pluck('db', 'name', 'status').coerce_to('array'),
+                'issues': r.db('rethinkdb').table('current_issues').pluck('type', 'critical', 'description').coerce_to('array')
+            }).run(conn)
+        except Exception as e:
+            self.__error(sampled, e)
+            try:
+                conn.close(noreply_wait=False)
+            except Exception: pass
+            self.__conn = None
+            return False
+
+        values = {}
+        for row in result['stats']:
+            if 'error' in row: # a server that did not respond in time
+                continue
+            fields = {}
+            flatten(dict((k, v) for k, v in row.items() if k not in ('id', 'server', 'db', 'table')), '', fields)
+            name = stats_row_name(row)
+            for key, value in fields.items():
+                values[name + '/' + key] = value
+        for row in result['status']:
+            fields = {}
+            flatten(row['status'], '', fields)
+            for key, value in fields.items():
+                values['status:%s.%s/%s' % (row['db'], row['name'], key)] = value
+        values['issues/count'] = len(result['issues'])
+        values['issues/critical'] = sum(1 for issue in result['issues'] if issue.get('critical'))
+
+        self.__add(sampled, values)
+        issues = sorted(result['issues'], key=lambda issue: (issue['type'], issue['description']))
+        if issues != self.__lastIssues:
+            self.issues.append({'time': round(sampled - self.start_time, 3), 'issues': issues})
+            self.__lastIssues = issues
+        return True
+
+    # --
+
+    def __add(self, sampled, values):
+        count = len(self.times)
+        self.times.append(round(sampled - self.start_time, 3))
+        for key, value in values.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[key] = [None] * count
+            column.append(value)
+        for key, column in self.columns.items():
+            if len(column) == count: # not in this sample
+                column.append(None)
+
+    def __error(self, when, error):
+        message = str(error).split('\n')[0]
+        if self.errors and self.errors[-1]['error'] == message:
+            self.errors[-1]['count'] += 1
+        else:
+            self.errors.append({'time': round(when - self.start_time, 3), 'error': message, 'count': 1})
+
+    def __connection(self):
+        if self.__conn is not None:
+            return self.__conn
+        targets = self.targets() if callable(self.targets) else self.targets
+        for host, port in targets:
+            try:
+                self.__conn = self.__r.connect(host=host, port=port, timeout=self.connectTimeout)
+                return self.__conn
+            except Exception as e:
+                self.__error(time.time(), e)
+        return None
+
+    def __run(self):
+        lastFlush = time.time()
+        nextSample = time.time()
+        try:
+            while not self.__stopEvent.is_set():
+                try:
+                    self.sample()
+                except Exception as e:
+                    self.__error(time.time(), e)
+                if time.time() - lastFlush > self.flushInterval:
+                    self.write()
+                    lastFlush = time.time()
+                nextSample = max(nextSample + self.interval, time.time())
+                self.__stopEvent.wait(nextSample - time.time())
+        finally:
+            if self.__conn is not None:
+                try:
+                    self.__conn.close(noreply_wait=False)
+                except Exception: pass
+                self.__conn = None
@@ -31,6 +31,7 @@ except ImportError:
 import test_report, utils
 
 default_test_results_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir, 'results'))
+default_durations_path = os.path.join(default_test_results_dir, 'durations.json')
 
 argparser = ArgumentParser(description='Run RethinkDB tests', add_help=False)
 argparser.add_argument('-j', '--jobs', type=int, default=1,
@@ -69,6 +70,12 @@ argparser.add_argument('-C', '--print-config', action='store_true',
                        help='Show the detected configuration')
 argparser.add_argument('-n', '--dry-run', action='store_true',
                        help='Do not run any tests')
+argparser.add_argument('--shard', type=utils.parseShard, metavar='I/N',
+                       help='Only run the I-th of N shards of the matching tests, balanced by past durations (Default: all)')
+argparser.add_argument('--durations', default=default_durations_path, metavar='FILE',
+                       help='The test duration history used for scheduling and sharding (Default: %s)' % default_durations_path)
+argparser.add_argument('--merge', nargs='+', metavar='DIR',
+                       help='Combine the results directories of several shards into the output directory')
 
 
 def run(all_tests, all_groups, configure, args):
@@ -81,6 +88,8 @@ def run(all_tests, all_groups, configure, args):
     if args.groups and not args.list:
         list_groups_mode(all_groups, args.filter, args.verbose)
         return
+    if args.merge:
+        return merge_results_mode(args.merge, args.output_dir, args.html_report)
     filter = TestFilter.parse(args.filter, all_groups)
     if args.load or args.tree or args.examine:
         old_tests_mode(all_tests, args.load, filter, args.verbose, args.list, args.only_failed, args.tree, args.examine, args.html_report)
@@ -93,6 +102,8 @@ def run(all_tests, all_groups, configure, args):
             print(k, '=', conf[k])
     tests = tests.configure(conf)
     filter.check_use()
+    if args.shard:
+        tests = shard_tests(tests, args.shard, utils.TestDurations(args.durations))
     if args.list:
         list_tests_mode(tests, args.verbose, args.groups and all_groups)
         return
@@ -106,10 +117,12 @@ def run(all_tests, all_groups, configure, args):
             verbose=args.verbose,
             repeat=args.repeat,
             kontinue=args.kontinue,
-            abort_fast=args.abort_fast)
+            abort_fast=args.abort_fast,
+            durations_path=args.durations,
+            html_report=args.html_report)
         testrunner.run()
-        if args.html_report:
-            test_report.gen_report(testrunner.dir, load_test_results_as_tests(testrunner.dir))
+        if testrunner.report:
+            testrunner.report.finish(load_test_results_as_tests(testrunner.dir))
         if testrunner.failed():
             return 'FAILED'
 
@@ -145,6 +158,55 @@ def list_groups_mode(groups, filters, verbose):
             for pattern in patterns:
                 print(' ', pattern)
 
+# Select one shard of the tests, so that several machines can split a run
+def shard_tests(tests, shard, durations):
+    index, count = shard
+    all_tests = list(tests)
+    selected = durations.shard(all_tests, index, count, key=lambda item: item[0])
+    estimate = durations.estimate([name for name, test in selected])
+    print("Shard %d/%d: %d of %d tests%s" % (index, count, len(selected), len(all_tests),
+        ", about %s serially" % TermView.format_duration(estimate) if estimate is not None else ''))
+    return TestTree(selected)
+
+# This mode combines the results directories of several shards
+def merge_results_mode(sources, output_dir, html_report):
+    if output_dir:
+        target = output_dir
+        try:
+            os.makedirs(target)
+        except OSError as e:
+            if not os.path.isdir(target):
+                sys.exit("Could not create output directory (%s): %s" % (target, str(e)))
+    else:
+        try:
+            os.makedirs(default_test_results_dir)
+        except OSError:
+            pass
+        target = tempfile.mkdtemp('', time.strftime('%Y-%m-%dT%H:%M:%S.'), default_test_results_dir)
+    for source in sources:
+        if not os.path.isdir(source):
+            sys.exit("Not a results directory: %s" % source)
+        for name in sorted(os.listdir(source)):
+            if not os.path.isdir(join(source, name)) or name == test_report.report_dir_name:
+                continue
+            if os.path.exists(join(target, name)):
+                sys.exit("Test %s is in more than one results directory (found again in %s)" % (name, source))
+            utils.clone_tree(join(source, name), join(target, name))
+    tests = load_test_results_as_tests(target)
+    failed = [name for name, test in tests if not test.passed()]
+    total = len(tests)
+    if failed:
+        print("%d of %d tests failed:" % (len(failed), total))
+        for name in failed:
+            print("  " + name)
+    else:
+        print("All %d tests passed successfully" % total)
+    print("Merged %d results directories into %s" % (len(sources), target))
+    if html_report:
+        test_report.gen_report(target, tests)
+    if failed:
+        return 'FAILED'
+
 # This mode loads previously run tests instead of running any tests
 def old_tests_mode(all_tests, load, filter, verbose, list_tests, only_failed, tree, examine, html_report):
     if isinstance(load, "".__class__):
@@ -201,9 +263,11 @@ class TestRunner(object):
     STARTED   = 'STARTED'
     KILLED    = 'KILLED'
 
-    def __init__(self, tests, conf, tasks=1, timeout=600, output_dir=None, verbose=False, repeat=1, kontinue=False, abort_fast = False, run_dir=None):
+    def __init__(self, tests, conf, tasks=1, timeout=600, output_dir=None, verbose=False, repeat=1, kontinue=False, abort_fast = False, run_dir=None, durations_path=default_durations_path, html_report=False):
         self.tests = tests
+        self.tasks = tasks
         self.semaphore = multiprocessing.Semaphore(tasks)
+        self.durations = utils.TestDurations(durations_path)
         self.processes = []
         self.timeout = timeout
         self.conf = conf
@@ -214,6 +278,7 @@ class TestRunner(object):
         self.aborting = False
         self.abort_fast = abort_fast
         self.all_passed = False
+        self.logs = utils.LogTail(lines=TestProcess.tail_length) # the output of the running tests
 
         timestamp = time.strftime('%Y-%m-%dT%H:%M:%S.')
 
@@ -236,10 +301,19 @@ class TestRunner(object):
         else:
             self.run_dir = None
 
+        # fragments of the report are written as tests finish, the index when the run is over
+        self.report = test_report.Report(self.dir) if html_report else None
+
+
+        # longest expected tests first, so a slow test does not start last and hold up the run
+        self.schedule = self.durations.schedule(list(self.tests), key=lambda item: item[0])
+        self.estimate = self.durations.estimate([name for name, test in self.schedule], tasks)
+        if self.estimate is not None:
+            self.estimate *= self.repeat
 
         self.running = Locked({})
         if sys.stdout.isatty() and not verbose:
-            self.view = TermView(total = len(self.tests) * self.repeat)
+            self.view = TermView(total = len(self.tests) * self.repeat, estimate=self.estimate, logs=self.logs)
         else:
             self.view = TextView()
 
@@ -249,11 +323,13 @@ class TestRunner(object):
         tests_killed = set()
         try:
             print("Running %d tests (output_dir: %s)" % (tests_count, self.dir))
+            if self.estimate is not None:
+                print("Estimated time with %d jobs: %s" % (self.tasks, TermView.format_duration(self.estimate)))
 
             for i in range(0, self.repeat):
                 if len(self.failed_set) == tests_count:
                     break
-                for name, test in self.tests:
+                for name, test in self.schedule:
                     if self.aborting:
                         break
                     self.semaphore.acquire()
@@ -293,6 +369,11 @@ class TestRunner(object):
             for id, process in list(running.items()):
                 process.join()
 
+        try:
+            self.durations.save()
+        except (IOError, OSError) as e:
+            print("Unable to save test durations to %s: %s" % (self.durations.path, str(e)))
+
         self.view.close()
         if len(tests_launched) != tests_count or tests_killed:
             if len(self.failed_set):
@@ -333,12 +414,20 @@ class TestRunner(object):
             if self.abort_fast:
                 self.aborting = True
         if status != 'STARTED':
+            testprocess.forget_output()
+            if status in ['SUCCESS', 'TIMED_OUT']:
+                self.durations.record(name, time.time() - testprocess.start_time, testprocess.peak_servers)
             with self.running as running:
                 del(running[id])
             if status not in ['SUCCESS', 'KILLED']:
                 self.view.tell('CANCEL', self.repeat - id[1] - 1)
                 self.failed_set.add(name)
             self.semaphore.release()
+            if self.report:
+                try:
+                    self.report.add_test(os.path.basename(testprocess.dir), OldTest(testprocess.dir))
+                except Exception as e:
+                    print("Unable to add %s to the report: %s" % (name, str(e)), file=sys.stderr)
         self.view.tell(status, name, **args)
 
     def count_running(self):
@@ -403,13 +492,15 @@ class TermView(TextView):
     columns = 80
     clear_line = '\n'
 
-    def __init__(self, total):
+    def __init__(self, total, estimate=None, logs=None):
         super(TermView, self).__init__()
         self.running_list = []
         self.buffer = ''
         self.passed = 0
         self.failed = 0
         self.total = total
+        self.estimate = estimate
+        self.logs = logs # to show the latest line of output from the running tests
         self.start_time = time.time()
         self.printingQueue = queue.Queue()
 
@@ -477,6 +568,8 @@ class TermView(TextView):
             
             remaining = self.total - self.passed - self.failed - running
             duration = self.format_duration(time.time() - self.start_time)
+            if self.estimate is not None:
+                duration += '/~' + self.format_duration(self.estimate)
             
             def format(names, useColor=self.use_color):
                 strPassed = str(self.passed)
@@ -501,8 +594,17 @@ class TermView(TextView):
                 testsToList += 1
             
             self.buffer += format(names)
+            
+            latest = self.logs and self.logs.latest
+            charsAvailable -= len(names) + 1
+            if latest and charsAvailable > 20:
+                line = latest[1].strip()
+                if len(line) > charsAvailable:
+                    line = line[:charsAvailable - 3] + '...'
+                self.buffer += ' ' + line
 
-    def format_duration(self, elapsed):
+    @staticmethod
+    def format_duration(elapsed):
         elapsed = math.floor(elapsed)
         seconds = elapsed % 60
         elapsed = math.floor(elapsed / 60)
@@ -556,6 +658,9 @@ class Locked(object):
 
 # Run a single test in a separate process
 class TestProcess(object):
+    server_sample_interval = 5 # seconds between counts of the servers the test is running
+    tail_length = 10 # lines of output kept in memory for the failure message
+
     def __init__(self, runner, id, test, dir, run_dir):
         self.runner = runner
         self.id = id
@@ -568,15 +673,21 @@ class TestProcess(object):
         self.run_dir = abspath(run_dir) if run_dir else None
         self.gracefull_kill = False
         self.terminate_thread = None
+        self.start_time = None
+        self.peak_servers = None
+        self.processes = None # utils.RunningProcesses of the test, kept so each scan only reads new processes
 
     def start(self):
         try:
+            self.start_time = time.time()
             self.runner.tell(TestRunner.STARTED, self.id, self)
             os.mkdir(self.dir)
             if self.run_dir:
                 os.mkdir(self.run_dir)
             with open(join(self.dir, "description"), 'w') as file:
                 file.write(str(self.test))
+            for stream in ('stdout', 'stderr'):
+                self.runner.logs.follow((self.id, stream), join(self.dir, stream))
 
             self.supervisor = threading.Thread(target=self.supervise, name="supervisor:" + self.name)
             self.supervisor.daemon = True
@@ -616,19 +727,33 @@ class TestProcess(object):
         with open(join(self.dir, "fail_message"), 'a') as file:
             file.write(message)
 
+    def tail_output(self, stream, count):
+        try:
+            return self.runner.logs.lines((self.id, stream), count)
+        except KeyError: # no longer followed
+            try:
+                return utils.tail_lines(join(self.dir, stream), count)
+            except (IOError, OSError):
+                return []
+
     def tail_error(self):
-        with open(join(self.dir, "stderr")) as f:
-            lines = f.read().split('\n')[-10:]
-        if len(lines) < 10:
-            with open(join(self.dir, "stdout")) as f:
-                lines = f.read().split('\n')[-len(lines):] + lines
+        lines = self.tail_output("stderr", self.tail_length)
+        if len(lines) < self.tail_length:
+            lines = self.tail_output("stdout", self.tail_length - len(lines)) + lines
         return '\n'.join(lines)
 
+    def forget_output(self):
+        for stream in ('stdout', 'stderr'):
+            self.runner.logs.forget((self.id, stream))
+
     def supervise(self):
         read_pipe, write_pipe = multiprocessing.Pipe(False)
         self.process = multiprocessing.Process(target=self.run, args=[write_pipe], name="subprocess:" + self.name)
         self.process.start()
-        self.process.join(self.timeout + 5)
+        deadline = time.time() + self.timeout + 5
+        while self.process.is_alive() and time.time() < deadline:
+            self.count_servers()
+            self.process.join(min(self.server_sample_interval, max(0, deadline - time.time())))
         if self.terminate_thread:
             self.terminate_thread.join()
         if self.gracefull_kill:
@@ -657,6 +782,17 @@ class TestProcess(object):
                         file.write('Failed')
             self.runner.tell(status, self.id, self)
 
+    def count_servers(self):
+        '''Track the most rethinkdb servers the test has had running at once'''
+        try:
+            if self.processes is None:
+                self.processes = utils.RunningProcesses(self.process.pid)
+            processes = self.processes.list()
+        except Exception:
+            return
+        servers = len([process for process in processes if os.path.basename(process.command.split()[0]).startswith('rethinkdb')])
+        self.peak_servers = max(self.peak_servers or 0, servers)
+
     def join(self):
         while self.supervisor.is_alive():
             self.supervisor.join(1)
@@ -928,7 +1064,7 @@ def load_test_results_as_tests(path):
     tests = TestTree()
     for dir in os.listdir(path):
         full_dir = join(path, dir)
-        if not os.path.isdir(full_dir):
+        if not os.path.isdir(full_dir) or dir == test_report.report_dir_name:
             continue
         names = list(reversed(dir.split('.')))
         parent = tests
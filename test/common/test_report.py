@@ -1,110 +1,185 @@
 # Copyright 2010-2016 RethinkDB, all rights reserved.
 
+'''Writes the HTML report of a test run. The report is built incrementally: each test gets a small fragment as soon
+as it is done, and the index page only lists the tests, loading a test's fragment when it is opened. Text files are
+only shown up to their last `inline_limit` bytes; larger ones are linked, along with a gzipped copy in the report.'''
 
-
-import json, os, re, subprocess
+import gzip, json, os, shutil, subprocess, threading, time
 
 import utils
 
-def format_tests(test_root, test_tree):
-  tests = []
-  for name, test in test_tree:
-      command_line = test.read_file('description')
-      failed = test.read_file('fail_message')
-      if failed is None:
+report_dir_name = 'report' # in the results directory, next to the tests' directories
+index_name = 'test_results.html'
+inline_limit = 64 * 1024
+index_interval = 5 # seconds between rewrites of the index while tests are still being added
+
+def check_output(command, shell=False):
+    process = subprocess.Popen(command, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output, _ = process.communicate()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return output.decode('utf-8', 'replace').strip()
+
+def write_atomically(path, contents):
+    with open(path + '.tmp', 'w') as f:
+        f.write(contents)
+    os.rename(path + '.tmp', path)
+
+def read_tail(path, size, limit=inline_limit):
+    with open(path, 'rb') as f:
+        if size > limit:
+            f.seek(size - limit)
+            f.readline() # start at a line boundary
+        return f.read().decode('utf-8', 'replace')
+
+def format_test(test_root, name, test):
+    '''Summarize a test for the index, and build its fragment: the files of the test, with the end of text files'''
+
+    if test.read_file('fail_message') is None:
         status = 'pass'
-      else:
+    elif test.read_file('killed') is not None:
+        status = 'killed'
+    else:
         status = 'fail'
+    id = name.replace('.', '-')
 
-      file_infos = []
-      for rel_path in test.list_files(text_only=False):
-          path = os.path.join(test_root, name, rel_path)
-          file_info = { 'name': os.path.join(name, rel_path) }
-          if utils.guess_is_text_file(path) and os.path.getsize(path) > 0:
-            file_info['contents'] = open(path, "rb").read()
-          file_infos.append(file_info)
+    files = []
+    for rel_path in sorted(test.list_files(text_only=False)):
+        path = os.path.join(test_root, name, rel_path)
+        size = os.path.getsize(path)
+        file_info = {'name': os.path.join(name, rel_path), 'size': size}
+        if size > 0 and utils.guess_is_text_file(path):
+            file_info['contents'] = read_tail(path, size)
+            if size > inline_limit:
+                file_info['truncated'] = True
+                compressed = os.path.join(report_dir_name, 'files', name, rel_path + '.gz')
+                os.makedirs(os.path.dirname(os.path.join(test_root, compressed)), exist_ok=True)
+                with open(path, 'rb') as source, gzip.open(os.path.join(test_root, compressed), 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                file_info['compressed'] = compressed
+        files.append(file_info)
 
-      tests.append({
+    summary = {
         'name': name,
-        'id': name.replace('.', '-'),
+        'id': id,
         'status': status,
-        'files': file_infos
-      })
-  return sorted(tests, key = lambda t: t['name'])
+        'fragment': os.path.join(report_dir_name, 'tests', id + '.js')
+    }
+    return summary, {'id': id, 'files': files}
 
-def generate_html(output_file, reportData):
-  file_out = open(output_file, 'w')
-  mustachePath = os.path.realpath(os.path.join(os.path.dirname(__file__), 'mustache', 'mustache.js'))
-  mustacheContent = open(mustachePath).read()
-  pageHTML = test_report_template % {"pagedata": json.dumps(reportData, separators=(',', ':')), 'mustacheContents': mustacheContent}
-  file_out.write(pageHTML)
+class Report(object):
+    '''An HTML report that tests are added to while they complete. `add_test` can be called from several threads.'''
 
-def check_output(command, shell=False):
-    process = subprocess.Popen(command, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    output, _ = process.communicate()
-    if process.returncode != 0:
-        raise subprocess.CalledProcessError(process.returncode, command)
-    return output
+    def __init__(self, test_root):
+        self.test_root = test_root
+        self.dir = os.path.join(test_root, report_dir_name)
+        self.tests = {}
+        self.lock = threading.Lock()
+        self.last_index = 0
+        self.info = None
+        os.makedirs(os.path.join(self.dir, 'tests'), exist_ok=True)
+        shutil.copy(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'mustache', 'mustache.js'), self.dir)
 
-def gen_report(test_root, tests):
-  buildbot = False
-  if "BUILD_NUMBER" in os.environ:
-    buildbot = {
-      'build_id': os.environ['JOB_NAME'] + ' ' + os.environ["BUILD_NUMBER"],
-      'build_link': os.environ['BUILD_URL']
+    def add_test(self, name, test):
+        summary, fragment = format_test(self.test_root, name, test)
+        write_atomically(os.path.join(self.test_root, summary['fragment']),
+            'reportFragment(%s);\n' % json.dumps(fragment, separators=(',', ':')))
+        with self.lock:
+            self.tests[name] = summary
+            if time.time() - self.last_index > index_interval:
+                self.write_index(complete=False)
+
+    def finish(self, tests=()):
+        '''Add the tests that have not been added yet, and write the final index'''
+        for name, test in tests:
+            if name not in self.tests:
+                self.add_test(name, test)
+        with self.lock:
+            self.write_index(complete=True)
+        print('Wrote test report to "%s"' % os.path.realpath(os.path.join(self.test_root, index_name)))
+
+    def write_index(self, complete):
+        if self.info is None:
+            self.info = build_info()
+        tests = sorted(self.tests.values(), key=lambda t: t['name'])
+        data = dict(self.info,
+            tests=tests,
+            passed=sum(1 for test in tests if test['status'] == 'pass'),
+            total=len(tests),
+            complete=complete)
+        write_atomically(os.path.join(self.test_root, index_name), test_report_template % {
+            'pagedata': json.dumps(data, separators=(',', ':')).replace('</', '<\\/'),
+            'reportdir': report_dir_name,
+            'refresh': '' if complete else '<meta http-equiv="refresh" content="%d">' % (index_interval * 2)
+        })
+        self.last_index = time.time()
+
+def build_info():
+    buildbot = False
+    if "BUILD_NUMBER" in os.environ:
+        buildbot = {
+            'build_id': os.environ['JOB_NAME'] + ' ' + os.environ["BUILD_NUMBER"],
+            'build_link': os.environ['BUILD_URL']
+        }
+
+    git_info = {
+        'branch': check_output(['git symbolic-ref HEAD 2>/dev/null || echo "HEAD"'], shell=True),
+        'commit': check_output(['git', 'rev-parse', 'HEAD']),
+        'message': check_output(['git', 'show', '-s', '--format=%B'])
     }
-  
-  git_info = {
-    'branch': check_output(['git symbolic-ref HEAD 2>/dev/null || echo "HEAD"'], shell=True),
-    'commit': check_output(['git', 'rev-parse', 'HEAD']),
-    'message': check_output(['git', 'show', '-s', '--format=%B'])
-  }
-
-  tests_param = format_tests(test_root, tests)
-  passed = sum(1 for test in tests_param if test['status'] == 'pass')
-  total = len(tests_param)
-
-  # TODO: use `rethinkdb --version' instead
-  rethinkdb_version = check_output([os.path.dirname(__file__) + "/../../scripts/gen-version.sh"])
-  
-  reportData = {
-    "buildbot": str(buildbot),
-    "tests": str(tests_param),
-    "rethinkdb_version": str(rethinkdb_version),
-    "git_info": str(git_info),
-    "passed_test_count": passed,
-    "total_test_count": total
-  }
-  
-  generate_html(test_root + "/test_results.html", reportData)
-  print('Wrote test report to "%s/test_results.html"' % os.path.realpath(test_root))
+
+    # TODO: use `rethinkdb --version' instead
+    rethinkdb_version = check_output([os.path.dirname(__file__) + "/../../scripts/gen-version.sh"])
+
+    return {
+        "buildbot": buildbot,
+        "rethinkdb_version": rethinkdb_version,
+        "git_info": git_info
+    }
+
+def gen_report(test_root, tests):
+    report = Report(test_root)
+    report.finish(tests)
 
 test_report_template = """
 <html>
   <head>
     <title>Test Report</title>
+    %(refresh)s
     <style>
         td {border:1px solid grey}
         .test { background: red }
         .test.pass { background: green }
+        .test.killed { background: orange }
     </style>
+    <script src="%(reportdir)s/mustache.js"></script>
     <script>
-%(mustacheContents)s
-    </script>
-    <script>
-        function toggleVisibility(targetId) {
+        pageData = %(pagedata)s;
+
+        // fragments are scripts rather than JSON, so they also load from file:// URLs
+        function reportFragment(fragment) {
+            var target = document.getElementById(fragment.id);
+            var template = document.getElementById("files-template").textContent;
+            target.firstElementChild.innerHTML = Mustache.to_html(template, fragment);
+        }
+
+        function toggleVisibility(targetId, fragment) {
             var target = document.getElementById(targetId);
             if (target != null) {
                 if (target.style.display == "none") {
                     target.style.display = null;
+                    if (!target.getAttribute("data-loaded")) {
+                        target.setAttribute("data-loaded", "true");
+                        var script = document.createElement("script");
+                        script.src = fragment;
+                        document.head.appendChild(script);
+                    }
                 } else {
                     target.style.display = "none";
                 }
             }
         }
-        
-        pageData = %(pagedata)s;
-        
+
         function displayData() {
             var template = document.getElementById("handlebars-template").textContent;
             document.body.innerHTML = Mustache.to_html(template, pageData);
@@ -112,7 +187,7 @@ test_report_template = """
     </script>
   </head>
   <body onload="displayData()">
-    This should be replaced by the conetent in a moment.
+    This should be replaced by the content in a moment.
     <script id="handlebars-template" type="text/x-handlebars-template">
         <h1>Rethinkdb {{ rethinkdb_version }}</h1>
         {{ #buildbot }}
@@ -122,27 +197,31 @@ test_report_template = """
         <p>Commit: <a href="https://github.com/rethinkdb/rethinkdb/commit/{{ git_info.commit }}">{{ git_info.commit }}</a>
         <p>Commit message:
           <pre>{{ git_info.message }}</pre>
-        <p>Passed {{ passed }} of  {{ total }} tests</p>
+        <p>Passed {{ passed }} of {{ total }} tests{{ ^complete }} so far, still running{{ /complete }}</p>
         <table style='width:100%%'>
           {{#tests}}
           <tr>
             <td>{{name}}</td>
             <td class="test {{ status }}">
-              <a href='#{{ id }}' onclick='toggleVisibility("{{ id }}")'>{{status}}</a>
+              <a href='#{{ id }}' onclick='toggleVisibility("{{ id }}", "{{ fragment }}")'>{{status}}</a>
             </td>
             <td width='100%%'></td></tr>
           <tr id='{{ id }}' style='display:none'>
-            <td colspan='4'>
-              {{ #files }}
-              <ul><li><a href="{{ name }}">{{ name }}</a></ul>
-              <div style='border: 1px solid black'>
-                <pre>{{ contents }}</pre>
-              </div>
-              {{ /files }}
-          </td></tr>
+            <td colspan='4'>Loading...</td></tr>
           {{ /tests }}
         </table>
     </script>
+    <script id="files-template" type="text/x-handlebars-template">
+        {{ #files }}
+        <ul><li><a href="{{ name }}">{{ name }}</a> ({{ size }} bytes{{ #compressed }}, <a href="{{ compressed }}">gzipped</a>{{ /compressed }})</ul>
+        {{ #contents }}
+        <div style='border: 1px solid black'>
+          {{ #truncated }}<p><i>Only the end of the file is shown.</i></p>{{ /truncated }}
+          <pre>{{ contents }}</pre>
+        </div>
+        {{ /contents }}
+        {{ /files }}
+    </script>
   </body>
 </html>
 """
@@ -3,7 +3,7 @@
 
 
 
-import atexit, collections, fcntl, os, pprint, platform, random, re, shutil, signal
+import atexit, collections, concurrent.futures, ctypes, ctypes.util, errno, fcntl, heapq, json, os, pprint, platform, random, re, selectors, shutil, signal
 import inspect
 import socket, string, subprocess, sys, tempfile, threading, time, warnings
 
@@ -408,6 +408,7 @@ class RunningProcesses:
             return 'Process<%s>' % self.__str__()
     
     psCommand = ['ps', '-u', str(os.getuid()), '-o', 'pid=,ppid=,pgid=,state=,command=', '-www']
+    procPath = '/proc'
     
     parentPid         = None
     parentProcess     = None # process
@@ -415,11 +416,14 @@ class RunningProcesses:
     processesByParent = None # pid -> set([process,...]}
     processesByGroup  = None # pgid -> set([process,...]}
     
+    __procCommands    = None # (pid, start time, command name) -> command, or None for other users' processes
+    
     def __init__(self, parentPid):
         
         self.processes = {}
         self.processesByParent = {}
         self.processesByGroup = {}
+        self.__procCommands = {}
         
         # -- validate input
     
@@ -434,25 +438,79 @@ class RunningProcesses:
         
         self.list()
     
-    def list(self):
-        # - reset known processes status to ''
-        for process in list(self.processes.values()):
-            process.status = ''
-        
-        # - get ouptut from `ps`
+    @classmethod
+    def useProc(cls):
+        return os.path.isfile(os.path.join(cls.procPath, 'self', 'stat'))
+    
+    @classmethod
+    def readProcStat(cls, pid):
+        '''Return (ppid, pgid, state, start time, command name) for a pid from /proc, or None if it is gone'''
+        try:
+            with open(os.path.join(cls.procPath, str(pid), 'stat'), 'rb') as statFile:
+                stat = statFile.read().decode('utf-8', 'replace')
+        except (IOError, OSError):
+            return None
+        # the command name is in parens, and might itself contain spaces or parens
+        name = stat[stat.find('(') + 1:stat.rfind(')')]
+        fields = stat[stat.rfind(')') + 2:].split()
+        return int(fields[1]), int(fields[2]), fields[0], fields[19], name
+    
+    @classmethod
+    def readProcCommand(cls, pid, name):
+        try:
+            with open(os.path.join(cls.procPath, str(pid), 'cmdline'), 'rb') as cmdlineFile:
+                command = cmdlineFile.read().rstrip(b'\0').replace(b'\0', b' ').decode('utf-8', 'replace')
+        except (IOError, OSError):
+            command = None
+        return command or '[%s]' % name # kernel threads and zombies have no command line
+    
+    def __procSnapshot(self):
+        '''All of our processes as (pid, ppid, pgid, status, command), read from /proc. Command lines are only read
+        the first time a process is seen, and again when its command name changes (an exec after it was seen).'''
+        uid = os.getuid()
+        seen = set()
+        for entry in os.listdir(self.procPath):
+            if not entry.isdigit():
+                continue
+            pid = int(entry)
+            stat = self.readProcStat(pid)
+            if stat is None:
+                continue
+            ppid, pgid, status, startTime, name = stat
+            identity = (pid, startTime, name)
+            seen.add(identity)
+            if identity not in self.__procCommands:
+                try:
+                    ours = os.stat(os.path.join(self.procPath, entry)).st_uid == uid
+                except OSError:
+                    continue
+                self.__procCommands[identity] = self.readProcCommand(pid, name) if ours else None
+            command = self.__procCommands[identity]
+            if command is not None:
+                yield pid, ppid, pgid, status, command
+        for identity in set(self.__procCommands).difference(seen):
+            del self.__procCommands[identity]
+    
+    def __psSnapshot(self):
         psProcess = subprocess.Popen(self.psCommand, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
         psOutput = psProcess.communicate()[0].decode('utf-8')
         #assert psProcess.returncode == 0, 'Bad output from ps process (%d): %s\n%s' % (psProcess.returncode, ' '.join(self.psCommand), psOutput)
-        
-        # - parse the list
         for line in psOutput.splitlines():
             try:
                 pid, ppid, pgid, status, command = line.split(None, 4)
-                pid = int(pid)
-                ppid = int(ppid)
-                pgid = int(pgid)
+                yield int(pid), int(ppid), int(pgid), status, command
             except ValueError: continue
-            
+    
+    def list(self):
+        # - reset known processes status to ''
+        for process in list(self.processes.values()):
+            process.status = ''
+        
+        # - get the current processes, from /proc when we have it and `ps` otherwise
+        snapshot = self.__procSnapshot() if self.useProc() else self.__psSnapshot()
+        
+        # - update the indexes
+        for pid, ppid, pgid, status, command in snapshot:
             if (pid, command) in self.processes:
                 thisProcess = self.processes[(pid, command)]
                 thisProcess.pgid = pgid
@@ -465,7 +523,8 @@ class RunningProcesses:
             if self.parentProcess is None and thisProcess.pid == self.parentPid:
                 self.parentProcess = thisProcess
             
-            # catalog by parent
+            # catalog by parent, keeping earlier parents so orphans are still found
+            thisProcess.ppid = ppid
             if thisProcess.ppid not in self.processesByParent:
                 self.processesByParent[thisProcess.ppid] = set()
             self.processesByParent[thisProcess.ppid].add(thisProcess)
@@ -514,6 +573,64 @@ class RunningProcesses:
             
         targetProcesses.reverse() # so children go before their parents
         return targetProcesses
+    
+    def wait(self, timeout):
+        '''Wait up to timeout seconds for the running processes to exit, returning the ones that are still running'''
+        deadline = time.time() + timeout
+        runningProcesses = self.list()
+        if runningProcesses and hasattr(os, 'pidfd_open'):
+            selector = selectors.DefaultSelector()
+            try:
+                for process in runningProcesses:
+                    try:
+                        selector.register(os.pidfd_open(process.pid), selectors.EVENT_READ)
+                    except OSError:
+                        pass # already gone
+                while selector.get_map() and time.time() < deadline:
+                    for key, _ in selector.select(deadline - time.time()):
+                        selector.unregister(key.fd)
+                        os.close(key.fd)
+            finally:
+                for key in list(selector.get_map().values()):
+                    os.close(key.fd)
+                selector.close()
+        else:
+            while runningProcesses and time.time() < deadline:
+                time.sleep(.1)
+                runningProcesses = self.list()
+        return self.list()
+
+def wait_for_exit(pid, timeout, popen=None):
+    '''Wait up to timeout seconds for a process to exit, returning True if it did. Waits on a pidfd when available.'''
+    deadline = time.time() + timeout
+    
+    def exited():
+        if popen is not None:
+            return popen.poll() is not None
+        try:
+            return os.waitpid(pid, os.WNOHANG) != (0, 0)
+        except OSError as e:
+            return e.errno == 10 # No such child
+    
+    if exited():
+        return True
+    if hasattr(os, 'pidfd_open'):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            return True # already gone
+        try:
+            with selectors.DefaultSelector() as selector:
+                selector.register(pidfd, selectors.EVENT_READ)
+                selector.select(max(0, deadline - time.time()))
+        finally:
+            os.close(pidfd)
+        return exited()
+    while time.time() < deadline:
+        time.sleep(0.1)
+        if exited():
+            return True
+    return False
 
 def kill_process_group(parent, timeout=20, sigkill_grace=2, only_warn=True):
     '''make sure that the given process group id is not running'''
@@ -593,30 +710,19 @@ def kill_process_group(parent, timeout=20, sigkill_grace=2, only_warn=True):
             
     
     # - wait for the processes to gracefully terminate
-    while time.time() < cleanDeadline:
-        if parentPopen:
-            if parentPopen.poll() is not None:
-                break
-        else:
-            try:
-                result = os.waitpid(parentPid, os.WNOHANG)
-                if result != (0, 0):
-                    break
-            except OSError as e:
-                if e.errno == 10: # No such child
-                    break
-        time.sleep(0.1)
+    if time.time() < cleanDeadline:
+        wait_for_exit(parentPid, cleanDeadline - time.time(), popen=parentPopen)
     
     # -- SIGINT all of the running processes
+    runningProcesses = processes.list()
     while time.time() < softDeadline:
-        time.sleep(0.1)
-        runningProcesses = processes.list()
         if len(runningProcesses) == 0:
             return # everything is done
         for runner in runningProcesses:
             try:
                 os.kill(runner.pid, signal.SIGINT)
             except OSError: pass # ToDo: figure out what to do here
+        runningProcesses = processes.wait(min(1, softDeadline - time.time())) # re-send, and pick up new children, every second
     
     # -- SIGKILL whatever is left - multiple SIGKILLs should not make a difference, but sometimes they do
     while True:
@@ -629,7 +735,7 @@ def kill_process_group(parent, timeout=20, sigkill_grace=2, only_warn=True):
             except OSError: pass # ToDo: figure out what to do here
     
         if time.time() < hardDeadline:
-            time.sleep(0.2)
+            processes.wait(min(0.2, hardDeadline - time.time()))
         else:
             break
     
@@ -649,6 +755,235 @@ def kill_process_group(parent, timeout=20, sigkill_grace=2, only_warn=True):
     else:
         return
 
+# -- log tailing
+
+def tail_lines(path, count=10, blockSize=8192):
+    '''The last `count` lines of a file, reading backwards from the end rather than the whole file'''
+    
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        while position > 0 and data.count(b'\n') <= count:
+            step = min(blockSize, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode('utf-8', 'replace').split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    return lines[-count:] if count else []
+
+class Inotify(object):
+    '''Minimal ctypes binding to Linux inotify, watching folders for files being created or written'''
+    
+    mask = 0x00000002 | 0x00000080 | 0x00000100 # IN_MODIFY | IN_MOVED_TO | IN_CREATE
+    
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, 'inotify_init1 failed: %s' % os.strerror(error))
+        self.watches = {} # path => [watch descriptor, reference count]
+    
+    def fileno(self):
+        return self.fd
+    
+    def watch(self, path):
+        if path in self.watches:
+            self.watches[path][1] += 1
+            return
+        descriptor = self._add_watch(self.fd, path.encode('utf-8'), self.mask)
+        if descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, 'inotify_add_watch failed for %s: %s' % (path, os.strerror(error)))
+        self.watches[path] = [descriptor, 1]
+    
+    def unwatch(self, path):
+        entry = self.watches.get(path)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self.watches[path]
+            self._rm_watch(self.fd, entry[0]) # harmlessly fails if the folder is already gone
+    
+    def drain(self):
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+    
+    def close(self):
+        os.close(self.fd)
+
+class _TailedLog(object):
+    '''State for one file followed by a LogTail'''
+    
+    def __init__(self, path, lines):
+        self.path = path
+        self.file = None
+        self.partial = b''
+        self.lines = collections.deque(maxlen=lines)
+        self.folder = None # watched with inotify
+    
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class LogTail(object):
+    '''Follows any number of log files from a single thread, keeping only the last `lines` lines of each in memory.
+    
+    Files are kept open and read from where the last read stopped, so nothing is read twice. The thread sleeps on a
+    selector over an inotify descriptor for the files' folders, falling back to polling every `pollInterval`
+    seconds where inotify is not available. Files do not need to exist yet when they are followed.'''
+    
+    pollInterval = 0.25
+    idleInterval = 1.0 # safety net even when everything is event-driven
+    maxLineLength = 64 * 1024 # longer lines are cut, so a runaway line can not take unbounded memory
+    
+    def __init__(self, lines=100):
+        self.maxLines = lines
+        self.lock = threading.Lock()
+        self.latest = None # (name, line) of the last complete line read from any file
+        self.__logs = {} # name => _TailedLog
+        self.__thread = None
+        self.__selector = None
+        self.__inotify = None
+        self.__wakeFds = None
+    
+    def follow(self, name, path):
+        '''Start following the file at `path` under `name`'''
+        with self.lock:
+            self.__forget(name)
+            if self.__thread is None:
+                self.__start()
+            log = _TailedLog(path, self.maxLines)
+            if self.__inotify is not None:
+                try:
+                    folder = os.path.dirname(os.path.realpath(path))
+                    self.__inotify.watch(folder)
+                    log.folder = folder
+                except OSError: pass
+            self.__logs[name] = log
+        self.__wake()
+    
+    def forget(self, name):
+        with self.lock:
+            self.__forget(name)
+    
+    def lines(self, name, count=None):
+        '''The last `count` lines of a followed file, including any unfinished last line. The file is read up to
+        its current end first, so this is up to date even between wakeups.'''
+        with self.lock:
+            log = self.__logs.get(name)
+            if log is None:
+                raise KeyError(name)
+            self.__scan(name, log)
+            lines = list(log.lines)
+            if log.partial:
+                lines.append(log.partial.decode('utf-8', 'replace'))
+        if count is not None:
+            lines = lines[-count:] if count else []
+        return lines
+    
+    # -- internals, called with the lock held
+    
+    def __start(self):
+        self.__selector = selectors.DefaultSelector()
+        self.__wakeFds = os.pipe()
+        for fd in self.__wakeFds:
+            os.set_blocking(fd, False)
+        self.__selector.register(self.__wakeFds[0], selectors.EVENT_READ)
+        self.__inotify = None
+        if platform.system() == 'Linux':
+            try:
+                self.__inotify = Inotify()
+                self.__selector.register(self.__inotify.fd, selectors.EVENT_READ)
+            except Exception:
+                self.__inotify = None
+        self.__thread = threading.Thread(target=self.__run, name='LogTail')
+        self.__thread.daemon = True
+        self.__thread.start()
+    
+    def __stop(self):
+        self.__selector.close()
+        for fd in self.__wakeFds:
+            os.close(fd)
+        if self.__inotify is not None:
+            self.__inotify.close()
+        self.__selector = self.__inotify = self.__wakeFds = self.__thread = None
+    
+    def __forget(self, name):
+        log = self.__logs.pop(name, None)
+        if log is None:
+            return
+        if log.folder is not None:
+            self.__inotify.unwatch(log.folder)
+        log.close()
+        if self.latest and self.latest[0] == name:
+            self.latest = None
+    
+    def __scan(self, name, log):
+        if log.file is None:
+            try:
+                log.file = open(log.path, 'rb')
+            except (IOError, OSError):
+                return
+        while True:
+            chunk = log.file.read(65536)
+            if not chunk:
+                break
+            lines = (log.partial + chunk).split(b'\n')
+            log.partial = lines.pop()[:self.maxLineLength]
+            if lines:
+                log.lines.extend(line[:self.maxLineLength].rstrip(b'\r').decode('utf-8', 'replace') for line in lines[-log.lines.maxlen:])
+                self.latest = (name, log.lines[-1])
+    
+    # --
+    
+    def __wake(self):
+        with self.lock:
+            if self.__wakeFds is not None:
+                try:
+                    os.write(self.__wakeFds[1], b'x')
+                except OSError: pass # the pipe is full, so a wakeup is already pending
+    
+    def __run(self):
+        while True:
+            with self.lock:
+                if not self.__logs:
+                    self.__stop()
+                    return
+                selector = self.__selector
+                polling = self.__inotify is None or any(log.folder is None for log in self.__logs.values())
+            
+            selector.select(self.pollInterval if polling else self.idleInterval)
+            
+            with self.lock:
+                if self.__wakeFds is None:
+                    return
+                try:
+                    while os.read(self.__wakeFds[0], 4096):
+                        pass
+                except OSError: pass
+                if self.__inotify is not None:
+                    self.__inotify.drain()
+                for name, log in list(self.__logs.items()):
+                    try:
+                        self.__scan(name, log)
+                    except Exception as e:
+                        warnings.warn('Error while tailing %s: %s' % (log.path, str(e)))
+                        self.__forget(name)
+
 def nonblocking_readline(source, seek=0):
     
     # - ensure we have a file
@@ -680,7 +1015,6 @@ def nonblocking_readline(source, seek=0):
     
     waitingLines = collections.deque()
     unprocessed = ''
-    lastRead = seek
     
     while True:
         
@@ -690,14 +1024,12 @@ def nonblocking_readline(source, seek=0):
             continue
         except IndexError: pass
         
-        # - try to read in a new chunk and split it
-        source.seek(lastRead)
-        chunk = source.read(1024)
+        # - try to read in a new chunk and split it, the file stays positioned after the last read
+        chunk = source.read(65536)
         
         if len(chunk) == 0:
             yield None
             continue
-        lastRead = source.tell()
         
         unprocessed += chunk
         
@@ -742,8 +1074,344 @@ def cleanupPathAtExit(path):
     if path not in pathsToClean:
         pathsToClean.append(path)
 
-def populateTable(conn, table, db=None, records=100, fieldName='id'):
-    '''Given a table (name or object) insert a number of records into it'''
+def clone_tree(source, dest):
+    '''Copy a directory tree, sharing the data blocks with the source where the filesystem supports it (btrfs, xfs, apfs).
+    Note: hardlinks are not an option for server data, as the server overwrites its files in place'''
+
+    assert os.path.isdir(source), 'clone_tree given a source that is not a directory: %s' % source
+    assert not os.path.exists(dest), 'clone_tree given a destination that already exists: %s' % dest
+
+    if platform.system() == 'Linux':
+        command = ['cp', '-a', '--reflink=auto', source, dest]
+    elif platform.system() == 'Darwin':
+        command = ['cp', '-c', '-R', '-p', source, dest]
+    else:
+        command = None
+
+    if command is not None:
+        with open(os.devnull, 'w') as devnull:
+            if subprocess.call(command, stdout=devnull, stderr=devnull) == 0:
+                return
+        if os.path.exists(dest):
+            shutil.rmtree(dest)
+    shutil.copytree(source, dest)
+
+class TestDurations(object):
+    '''Persistent record of how long each test took and how many servers it started, used to start the longest tests first'''
+    
+    smoothing = 0.5 # weight of the newest run in the running average
+    serverWeight = 0.1 # each server a test starts makes it this fraction more expensive when ordering tests
+    
+    path = None
+    durations = None # name => {'duration': seconds, 'servers': count}
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as historyFile:
+                self.durations = json.load(historyFile)
+            assert isinstance(self.durations, dict)
+        except Exception:
+            self.durations = {}
+    
+    def record(self, name, duration, servers=None):
+        with self.lock:
+            entry = self.durations.get(name)
+            if entry is None:
+                entry = self.durations[name] = {'duration': duration, 'servers': servers or 0}
+            else:
+                entry['duration'] = self.smoothing * duration + (1 - self.smoothing) * entry['duration']
+                if servers is not None:
+                    entry['servers'] = max(servers, entry.get('servers', 0))
+    
+    def save(self):
+        with self.lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            tempPath = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(tempPath, 'w') as historyFile:
+                json.dump(self.durations, historyFile, indent=1, sort_keys=True)
+            os.rename(tempPath, self.path)
+    
+    def __defaultDuration(self):
+        known = sorted(entry['duration'] for entry in self.durations.values())
+        return known[len(known) // 2] if known else 0
+    
+    def expected(self, name):
+        '''The expected duration of a test, or the median duration if it has not been seen'''
+        entry = self.durations.get(name)
+        return entry['duration'] if entry else self.__defaultDuration()
+    
+    def cost(self, name):
+        entry = self.durations.get(name)
+        return self.expected(name) * (1 + self.serverWeight * (entry.get('servers', 0) if entry else 0))
+    
+    def schedule(self, items, key=lambda item: item):
+        '''Order items so the most expensive tests go first, unseen tests take the median, and ties keep their order'''
+        return sorted(items, key=lambda item: -self.cost(key(item)))
+    
+    def estimate(self, names, workers=1):
+        '''Estimated wall-clock time to run the named tests in order on `workers` parallel slots, None without history'''
+        if not self.durations:
+            return None
+        slots = [0.0] * max(1, workers)
+        for name in names:
+            heapq.heapreplace(slots, slots[0] + self.expected(name))
+        return max(slots)
+    
+    def shard(self, items, index, count, key=lambda item: item):
+        '''The items in shard `index` (1-based) of `count`, balanced by expected duration. Every machine
+        given the same items and history picks the same split, without history this is round-robin by name.'''
+        if not 1 <= index <= count:
+            raise ValueError('shard index must be between 1 and %d, got: %r' % (count, index))
+        shards = [(0.0, 0, number) for number in range(1, count + 1)] # (expected duration, tests, shard number)
+        selected = []
+        for item in sorted(items, key=lambda item: (-self.expected(key(item)), key(item))):
+            load, tests, number = heapq.heappop(shards)
+            heapq.heappush(shards, (load + self.expected(key(item)), tests + 1, number))
+            if number == index:
+                selected.append(item)
+        return selected
+
+def parseShard(value):
+    '''Parse a `--shard` value of the form i/N into (i, N)'''
+    try:
+        index, count = [int(part) for part in value.split('/')]
+        assert 1 <= index <= count
+    except Exception:
+        raise ValueError('shard must be of the form i/N with 1 <= i <= N, got: %r' % value)
+    return index, count
+
+def cloneConnection(conn):
+    '''A new connection to the same server as `conn`, with the same default db, timeout and ssl options. The user
+    and password can not be read back from a connection, so this always connects as admin: code that connects as
+    another user must make its own connections instead.'''
+    kwargs = {'host':conn.host, 'port':conn.port, 'db':conn.db, 'timeout':conn.connect_timeout}
+    if getattr(conn, 'ssl', None):
+        kwargs['ssl'] = conn.ssl
+    return conn._r.connect(**kwargs)
+
+class BulkLoader(object):
+    '''Inserts documents start <= i < stop into a table from `workers` threads, each with its own connection, so that
+    that many batches are in flight at once.
+    
+    Documents come either from `document`, a Python function of i, or from `expression`, a ReQL function of i that
+    is evaluated on the server over `r.range` (the cheapest way to make a lot of simple documents). Batches start at
+    `batchSize` and are resized after each one: doubled while they take less than half of `targetLatency`, halved
+    when they take longer, within [minBatch, maxBatch].
+    
+    With `checkpointPath` the progress is saved every `checkpointInterval` seconds, and a later load with the same
+    path starts where that one left off. Batches that might already have been inserted are then sent with
+    conflict='replace', so the documents must be the same every time.'''
+    
+    checkpointInterval = 5
+    
+    def __init__(self, table, stop, connect, start=0, document=None, expression=None, conn=None, workers=4,
+                 batchSize=1000, minBatch=100, maxBatch=50000, targetLatency=0.5, durability='soft', conflict='error',
+                 checkpointPath=None, progressInterval=10, retryTime=0, quiet=False):
+        '''`connect` makes a new connection, and is called once per worker. `conn`, if given, is used by the first.'''
+        if document is not None and expression is not None:
+            raise ValueError('only one of document and expression can be given')
+        if document is None and expression is None:
+            document = lambda i: {'id':i}
+        if workers < 1:
+            raise ValueError('workers must be at least 1, got: %r' % workers)
+        
+        self.table = table
+        self.start = int(start)
+        self.stop = int(stop)
+        self.connect = connect
+        self.document = document
+        self.expression = expression
+        self.conn = conn
+        self.workers = workers
+        self.batchSize = max(minBatch, min(maxBatch, batchSize))
+        self.minBatch = minBatch
+        self.maxBatch = maxBatch
+        self.targetLatency = targetLatency
+        self.durability = durability
+        self.conflict = conflict
+        self.checkpointPath = checkpointPath
+        self.progressInterval = progressInterval
+        self.retryTime = retryTime
+        self.quiet = quiet
+        
+        self.lock = threading.Lock()
+        self.nextStart = self.start
+        self.done = self.start   # every document below this is in the table
+        self.sent = self.start   # no document at or above this has been sent, as of the last checkpoint
+        self.finished = {}       # start: end of the batches that completed above `done`
+        self.inserted = 0
+        self.batches = 0
+        self.error = None
+        self.lastCheckpoint = 0
+        
+        self.__loadCheckpoint()
+    
+    # -- checkpoints
+    
+    def __loadCheckpoint(self):
+        if self.checkpointPath is None or not os.path.exists(self.checkpointPath):
+            return
+        with open(self.checkpointPath) as f:
+            checkpoint = json.load(f)
+        if (checkpoint['start'], checkpoint['stop']) != (self.start, self.stop):
+            raise ValueError('Checkpoint %s is for documents %d to %d, not %d to %d' % (
+                self.checkpointPath, checkpoint['start'], checkpoint['stop'], self.start, self.stop))
+        self.nextStart = self.done = checkpoint['done']
+        self.sent = checkpoint['sent']
+    
+    def __saveCheckpoint(self):
+        '''Called with the lock held'''
+        if self.checkpointPath is None:
+            return
+        with open(self.checkpointPath + '.tmp', 'w') as f:
+            json.dump({'start':self.start, 'stop':self.stop, 'done':self.done, 'sent':max(self.sent, self.nextStart)}, f)
+        os.rename(self.checkpointPath + '.tmp', self.checkpointPath)
+        self.lastCheckpoint = time.time()
+    
+    # -- batches
+    
+    def __nextBatch(self):
+        with self.lock:
+            if self.error is not None or self.nextStart >= self.stop:
+                return None
+            start = self.nextStart
+            self.nextStart = min(start + self.batchSize, self.stop)
+            if self.nextStart > self.sent and self.checkpointPath is not None:
+                # - a checkpoint must cover everything that might be in the table before it is sent
+                self.sent = min(self.nextStart + self.batchSize * self.workers, self.stop)
+                self.__saveCheckpoint()
+            return start, self.nextStart
+    
+    def __finishBatch(self, start, end, latency):
+        with self.lock:
+            self.inserted += end - start
+            self.batches += 1
+            self.finished[start] = end
+            while self.done in self.finished:
+                self.done = self.finished.pop(self.done)
+            
+            if latency < self.targetLatency / 2:
+                self.batchSize = min(self.maxBatch, self.batchSize * 2)
+            elif latency > self.targetLatency:
+                self.batchSize = max(self.minBatch, self.batchSize // 2)
+            
+            if time.time() - self.lastCheckpoint > self.checkpointInterval:
+                self.__saveCheckpoint()
+    
+    def insertBatch(self, conn, start, end):
+        '''Insert one batch, retrying any ReqlError for up to `retryTime` seconds, and reconnecting when the
+        connection was lost. Returns the connection to use from now on.'''
+        r = conn._r
+        if self.expression is not None:
+            documents = r.range(start, end).map(self.expression)
+        else:
+            documents = [self.document(i) for i in range(start, end)]
+        conflict = self.conflict
+        if conflict == 'error' and start < self.sent:
+            conflict = 'replace' # this might have been inserted before the last checkpoint was written
+        
+        deadline = time.time() + self.retryTime
+        while True:
+            try:
+                if conn is None:
+                    conn = self.connect()
+                result = self.table.insert(documents, durability=self.durability, conflict=conflict).run(conn)
+                break
+            except r.ReqlError as e:
+                if time.time() > deadline:
+                    raise
+                if isinstance(e, r.ReqlDriverError) and conn is not None:
+                    # - the connection was dropped, e.g. by a server going away
+                    try:
+                        conn.close(noreply_wait=False)
+                    except Exception: pass
+                    conn = None
+                time.sleep(.1)
+                if conflict == 'error':
+                    conflict = 'replace' # part of the batch may have been written
+        
+        if result['errors']:
+            raise RuntimeError('Inserting documents %d to %d failed: %s' % (start, end, result.get('first_error')))
+        written = result['inserted'] + result.get('replaced', 0) + result.get('unchanged', 0)
+        if written != end - start:
+            raise RuntimeError('Inserting documents %d to %d only wrote %d: %r' % (start, end, written, result))
+        return conn
+    
+    def __worker(self, conn):
+        ownConnection = conn is None
+        try:
+            if ownConnection:
+                conn = self.connect()
+            while True:
+                batch = self.__nextBatch()
+                if batch is None:
+                    return
+                started = time.time()
+                newConn = self.insertBatch(conn, *batch)
+                if newConn is not conn:
+                    conn, ownConnection = newConn, True # the caller's connection was dropped, this one is ours
+                self.__finishBatch(batch[0], batch[1], time.time() - started)
+        except Exception as e:
+            with self.lock:
+                if self.error is None:
+                    self.error = e
+        finally:
+            if ownConnection and conn is not None:
+                try:
+                    conn.close(noreply_wait=False)
+                except Exception: pass
+    
+    # --
+    
+    def load(self):
+        '''Insert the documents, returning a summary with the number inserted, seconds taken and documents/second'''
+        resumedFrom = self.done
+        startTime = time.time()
+        workerCount = min(self.workers, max(1, (self.stop - self.nextStart + self.batchSize - 1) // self.batchSize))
+        threads = [threading.Thread(target=self.__worker, args=(self.conn if i == 0 else None,), name='BulkLoader-%d' % i) for i in range(workerCount)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        
+        lastProgress = time.time()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+                if not self.quiet and self.progressInterval and time.time() - lastProgress > self.progressInterval:
+                    self.printProgress(startTime)
+                    lastProgress = time.time()
+        
+        with self.lock:
+            self.__saveCheckpoint()
+        if self.error is not None:
+            raise self.error
+        
+        elapsed = time.time() - startTime
+        summary = {
+            'inserted':self.inserted,
+            'resumed_from':resumedFrom if resumedFrom != self.start else None,
+            'seconds':elapsed,
+            'rate':self.inserted / elapsed if elapsed else 0,
+            'batches':self.batches
+        }
+        if not self.quiet and self.progressInterval:
+            print_with_time('Inserted %d documents in %.2f seconds (%.0f/s, %d batches)' % (self.inserted, elapsed, summary['rate'], self.batches))
+        return summary
+    
+    def printProgress(self, startTime):
+        with self.lock:
+            inserted, done, batchSize = self.inserted, self.done, self.batchSize
+        elapsed = time.time() - startTime
+        print_with_time('Inserted %d of %d documents (%.0f/s, batches of %d)' % (
+            done - self.start, self.stop - self.start, inserted / elapsed if elapsed else 0, batchSize))
+
+def populateTable(conn, table, db=None, records=100, fieldName='id', workers=4, connect=None):
+    '''Given a table (name or object) insert a number of records into it. The extra workers use connections from
+    `connect`, by default copies of `conn` made by `cloneConnection`, so pass it when `conn` is not an admin one.'''
     
     # -- input validation/defaulting
     
@@ -763,13 +1431,17 @@ def populateTable(conn, table, db=None, records=100, fieldName='id'):
     
     # --
     
-    result = table.insert(conn._r.range(1, records + 1).map({fieldName:conn._r.row})).run(conn)
-    assert result['inserted'] == records, result
-    assert result['errors'] == 0, result
-    return result
+    if connect is None:
+        connect = lambda: cloneConnection(conn)
+    loader = BulkLoader(table, records + 1, connect, start=1, expression=lambda i: {fieldName:i},
+                        conn=conn, workers=workers, batchSize=10000, durability='hard', quiet=True)
+    summary = loader.load()
+    assert summary['inserted'] == records, summary
+    return {'inserted':summary['inserted'], 'errors':0}
 
-def getShardRanges(conn, table, db='test'):
-    '''Given a table and a connection return a list of tuples'''
+def _shardRanges(conn, table, db='test', mergeUnknown=False):
+    '''The ranges of a table's shards as (lower, upper, shard indexes). With mergeUnknown a split point that can not
+    be translated is dropped, so the range around it covers all of the shards it separates.'''
     
     # -- input validation/defaulting
     
@@ -793,36 +1465,218 @@ def getShardRanges(conn, table, db='test'):
     
     ranges = []
     lastPoint = conn._r.minval
-    for splitPoint in splitPointsRaw:
+    shards = [0]
+    for shard, splitPoint in enumerate(splitPointsRaw, start=1):
         # Decode if splitPoint is a byte string
         if isinstance(splitPoint, bytes):
             splitPoint = splitPoint.decode('utf-8')
         newPoint = None
-        if splitPoint.startswith('N'):
-            # - numbers
-            newPoint = float(splitPoint.split('#', 1)[1])
-        elif splitPoint.startswith('S'):
-            # - strings
-            newPoint = str(splitPoint[1:])
-        elif splitPoint.startswith('P'):
-            raise NotImplementedError('Object split points are not currently supported')
-        else:
-            raise NotImplementedError('Got a type of range that is not known: %s' % repr(splitPoint))
+        try:
+            if splitPoint.startswith('N'):
+                # - numbers
+                newPoint = float(splitPoint.split('#', 1)[1])
+            elif splitPoint.startswith('S'):
+                # - strings
+                newPoint = str(splitPoint[1:])
+            elif splitPoint.startswith('P'):
+                raise NotImplementedError('Object split points are not currently supported')
+            else:
+                raise NotImplementedError('Got a type of range that is not known: %s' % repr(splitPoint))
+        except NotImplementedError:
+            if not mergeUnknown:
+                raise
+            shards.append(shard)
+            continue
         
-        ranges.append((lastPoint, newPoint))
+        ranges.append((lastPoint, newPoint, shards))
         lastPoint = newPoint
+        shards = [shard]
     
-    # - default if no split points
-    
-    if not ranges:
-        ranges.append((conn._r.minval, conn._r.maxval))
-    else:
-        ranges.append((lastPoint, conn._r.maxval))
+    ranges.append((lastPoint, conn._r.maxval, shards))
     
     # -- return value
     
     return ranges
 
+def getShardRanges(conn, table, db='test', mergeUnknown=False):
+    '''Given a table and a connection return a list of tuples'''
+    return [(lower, upper) for lower, upper, _ in _shardRanges(conn, table, db=db, mergeUnknown=mergeUnknown)]
+
+# -- replica verification
+
+_checksumModulus = (2 ** 32, 2 ** 48) # one part per uuid slice below, small enough that sums stay exact
+
+def rowChecksums(r, selection):
+    '''A ReQL expression for (count, hash, hash) of the documents in `selection`, summed per document so the order
+    they are read in does not matter. Computed on the server, so only three numbers come back for any range.'''
+    hexValues = r.expr(dict((digit, value) for value, digit in enumerate('0123456789abcdef')))
+    
+    def toNumber(hexString):
+        return hexString.split('').fold(0, lambda acc, digit: acc.mul(16).add(hexValues[digit]))
+    
+    def digest(row):
+        # the first 8 and last 12 hex digits of a version 5 uuid are all hash, the rest has version bits
+        return r.uuid(row.to_json_string()).do(lambda h: [1, toNumber(h.slice(0, 8)), toNumber(h.slice(24, 36))])
+    
+    return selection.map(digest).reduce(lambda a, b: [
+        a[0].add(b[0]),
+        a[1].add(b[1]).mod(_checksumModulus[0]),
+        a[2].add(b[2]).mod(_checksumModulus[1])
+    ]).default([0, 0, 0])
+
+class _ConnectionPool(object):
+    '''Connections to each server, handed out to one thread at a time'''
+    
+    def __init__(self, r, servers):
+        self.r = r
+        self.servers = servers
+        self.idle = dict((name, []) for name in servers)
+        self.lock = threading.Lock()
+    
+    def get(self, name):
+        with self.lock:
+            if self.idle[name]:
+                return self.idle[name].pop()
+        host, port = self.servers[name]
+        return self.r.connect(host=host, port=port)
+    
+    def put(self, name, conn):
+        with self.lock:
+            self.idle[name].append(conn)
+    
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    try:
+                        conn.close(noreply_wait=False)
+                    except Exception: pass
+            self.idle = dict((name, []) for name in self.servers)
+
+class ReplicaVerifier(object):
+    '''Compares every replica of a table, shard range by shard range.
+    
+    Each (range, replica) pair is checksummed on its own server, with `readMode` ('outdated' reads the server's local
+    copy), by a pool of `workers` threads. Only ranges whose checksums differ are looked at further: they are split in
+    half by key until they hold at most `drillDownRows` documents, and then the keys themselves are compared.'''
+    
+    def __init__(self, conn, table, servers, db='test', readMode='outdated', workers=8, drillDownRows=1000, maxKeys=100):
+        '''`servers` are the servers to read through, each with a `name`, `host` and `driver_port` (e.g. a
+        driver.Cluster). Only servers that hold a replica of a range are compared for it.'''
+        self.conn = conn
+        self.r = conn._r
+        self.tableName = str(table)
+        self.dbName = str(db)
+        self.readMode = readMode
+        self.workers = workers
+        self.drillDownRows = drillDownRows
+        self.maxKeys = maxKeys
+        self.servers = dict((server.name, (server.host, server.driver_port)) for server in servers)
+        self.pool = _ConnectionPool(self.r, self.servers)
+        self.primaryKey = self.r.db(self.dbName).table(self.tableName).info()['primary_key'].run(conn)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exitType, value, traceback):
+        self.pool.close()
+    
+    def table(self):
+        return self.r.db(self.dbName).table(self.tableName, read_mode=self.readMode)
+    
+    def query(self, server, query):
+        conn = self.pool.get(server)
+        try:
+            result = query.run(conn)
+        except Exception:
+            try:
+                conn.close(noreply_wait=False)
+            except Exception: pass
+            raise
+        self.pool.put(server, conn)
+        return result
+    
+    def checksum(self, server, lower, upper):
+        return tuple(self.query(server, rowChecksums(self.r, self.table().between(lower, upper))))
+    
+    def keyHashes(self, server, lower, upper):
+        '''{JSON of the key: uuid of the document} for a range, keyed by JSON so that array keys can be used'''
+        rows = self.query(server, self.table().between(lower, upper).map(
+            lambda row: [row[self.primaryKey], self.r.uuid(row.to_json_string())]).coerce_to('array'))
+        return dict((json.dumps(key, sort_keys=True), digest) for key, digest in rows)
+    
+    def midpoint(self, server, lower, upper, count):
+        '''A key that splits the range roughly in half on `server`'''
+        return self.query(server, self.table().between(lower, upper, index=self.primaryKey)
+            .order_by(index=self.primaryKey).skip(count // 2).nth(0)[self.primaryKey])
+    
+    def rangeReplicas(self):
+        '''The ranges of the table, with the servers that hold all of the shards each covers'''
+        shards = self.r.db(self.dbName).table(self.tableName).config()['shards'].run(self.conn)
+        ranges = []
+        for lower, upper, indexes in _shardRanges(self.conn, self.tableName, db=self.dbName, mergeUnknown=True):
+            replicas = set.intersection(*[set(shards[i]['replicas']) for i in indexes])
+            ranges.append((lower, upper, sorted(name for name in replicas if name in self.servers)))
+        return ranges
+    
+    def verify(self):
+        '''Returns a list with an entry for each range that differs between replicas, empty when they all agree'''
+        
+        # -- checksum every range on every replica
+        
+        ranges = [(lower, upper, replicas) for lower, upper, replicas in self.rangeReplicas() if len(replicas) > 1]
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = dict(((i, server), executor.submit(self.checksum, server, lower, upper))
+                           for i, (lower, upper, replicas) in enumerate(ranges) for server in replicas)
+            
+            # -- drill down into the ranges that differ
+            
+            drillDowns = []
+            for i, (lower, upper, replicas) in enumerate(ranges):
+                checksums = dict((server, futures[(i, server)].result()) for server in replicas)
+                if len(set(checksums.values())) > 1:
+                    drillDowns.append(executor.submit(self.drillDown, lower, upper, checksums))
+            return [future.result() for future in drillDowns]
+        finally:
+            executor.shutdown()
+    
+    def drillDown(self, lower, upper, checksums):
+        '''Narrow a range with differing `checksums` down to the keys that differ'''
+        servers = sorted(checksums)
+        pending = [(lower, upper, checksums)]
+        keys = {}
+        while pending and len(keys) < self.maxKeys:
+            subLower, subUpper, subChecksums = pending.pop()
+            largest = max(count for count, _, _ in subChecksums.values())
+            middle = None
+            if largest > self.drillDownRows:
+                fullest = max(servers, key=lambda server: subChecksums[server][0])
+                middle = self.midpoint(fullest, subLower, subUpper, largest)
+            if middle is None or middle == subLower:
+                # - small enough (or no way to split it): compare the keys
+                hashes = dict((server, self.keyHashes(server, subLower, subUpper)) for server in servers)
+                for key in sorted(set().union(*hashes.values())):
+                    values = dict((server, hashes[server].get(key)) for server in servers)
+                    if len(set(values.values())) > 1:
+                        keys[key] = values
+                continue
+            for half in ((subLower, middle), (middle, subUpper)):
+                halfChecksums = dict((server, self.checksum(server, *half)) for server in servers)
+                if len(set(halfChecksums.values())) > 1:
+                    pending.append(half + (halfChecksums,))
+        return {
+            'range': (lower, upper),
+            'checksums': checksums,
+            'keys': [(json.loads(key), keys[key]) for key in sorted(keys)[:self.maxKeys]], # (key, {server: hash or None})
+            'complete': not pending
+        }
+
+def verifyReplicas(conn, table, servers, db='test', **kwargs):
+    '''Compare the replicas of a table, see `ReplicaVerifier`. Returns the ranges that differ, empty if none do.'''
+    with ReplicaVerifier(conn, table, servers, db=db, **kwargs) as verifier:
+        return verifier.verify()
+
 class NextWithTimeout(threading.Thread):
     '''Constantly tries to fetch the next item on a changefeed.'''
     
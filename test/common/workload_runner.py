@@ -1,12 +1,14 @@
 # Copyright 2010-2015 RethinkDB, all rights reserved.
 
+import contextlib
+import json
 import os
 import signal
 import subprocess
 import sys
 import time
 
-import utils, vcoptparse
+import availability, stats_sampler, utils, vcoptparse
 
 
 class RDBPorts:
@@ -24,6 +26,10 @@ class RDBPorts:
         env["DB_NAME"] = self.db_name
         env["TABLE_NAME"] = self.table_name
 
+    def stats_sampler(self):
+        '''A sampler for the server stats while a workload runs, written to the current directory'''
+        return stats_sampler.StatsSampler([(self.host, self.rdb_port)], stats_sampler.unique_path('workload_stats.json'))
+
 
 def normalize_ports(ports, db_name=None, table_name=None):
     if isinstance(ports, RDBPorts):
@@ -56,6 +62,8 @@ def run(command_line, ports, timeout, db_name=None, table_name=None):
     )
     start_time = time.time()
     end_time = start_time + timeout
+    sampler = ports.stats_sampler()
+    sampler.start()
 
     try:
         while time.time() < end_time:
@@ -75,6 +83,7 @@ def run(command_line, ports, timeout, db_name=None, table_name=None):
             sys.exit(result)
         sys.stderr.write(f"\nWorkload timed out after {timeout} seconds ({command_line})\n")
     finally:
+        sampler.stop()
         try:
             os.killpg(proc.pid, signal.SIGTERM)
         except OSError:
@@ -87,6 +96,8 @@ class ContinuousWorkload:
         self.command_line = command_line
         self.ports = normalize_ports(ports, db_name, table_name)
         self.running = False
+        self.sampler = None
+        self.events_path = None
 
     def __enter__(self):
         return self
@@ -97,6 +108,9 @@ class ContinuousWorkload:
         utils.print_with_time(f"Starting workload {self.command_line!r}...")
         new_environ = os.environ.copy()
         self.ports.add_to_environ(new_environ)
+        self.events_path = os.path.abspath(stats_sampler.unique_path('workload_events.bin'))
+        open(self.events_path, 'wb').close() # claim the name before the next workload looks for one
+        new_environ[availability.events_env] = self.events_path
         self.proc = subprocess.Popen(
             self.command_line,
             shell=True,
@@ -104,8 +118,16 @@ class ContinuousWorkload:
             preexec_fn=os.setpgrp
         )
         self.running = True
+        self.sampler = self.ports.stats_sampler()
+        self.sampler.start()
         self.check()
 
+    def events(self):
+        '''The (start, latency, ok) of every operation the workload has reported so far'''
+        if self.events_path is None:
+            return []
+        return availability.read_events(self.events_path)
+
     def check(self):
         if not self.running:
             raise RuntimeError("Workload is not running.")
@@ -114,8 +136,14 @@ class ContinuousWorkload:
             self.running = False
             raise RuntimeError(f"Workload {self.command_line!r} stopped prematurely with error code {result}")
 
+    def stop_sampler(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+
     def stop(self):
         self.check()
+        self.stop_sampler()
         utils.print_with_time(f"Stopping {self.command_line!r}...")
         os.killpg(self.proc.pid, signal.SIGINT)
         shutdown_grace_period = 10
@@ -138,6 +166,7 @@ class ContinuousWorkload:
         )
 
     def __exit__(self, exc=None, ty=None, tb=None):
+        self.stop_sampler()
         if self.running:
             try:
                 os.killpg(self.proc.pid, signal.SIGTERM)
@@ -168,6 +197,7 @@ class SplitOrContinuousWorkload:
     def __init__(self, opts, ports, db_name=None, table_name=None):
         self.opts = opts
         self.ports = normalize_ports(ports, db_name, table_name)
+        self.windows = []
 
     def __enter__(self):
         self.continuous_workloads = [
@@ -196,6 +226,32 @@ class SplitOrContinuousWorkload:
         for cwl in self.continuous_workloads:
             cwl.check()
 
+    @contextlib.contextmanager
+    def reconfiguration(self, label):
+        '''Mark the enclosed steps as a reconfiguration, to report how available the table was while they ran'''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.windows.append((label, start, time.time()))
+
+    def report_availability(self, output_path='availability.json'):
+        '''Analyze the marked reconfigurations against the operations of each continuous workload'''
+        if not self.windows:
+            return []
+        report = []
+        for cwl in self.continuous_workloads:
+            events = cwl.events()
+            if not events:
+                continue
+            results = availability.analyze(events, self.windows)
+            for result in results:
+                utils.print_with_time(f"{cwl.command_line!r}: {availability.format_result(result)}")
+            report.append({'workload': cwl.command_line, 'operations': len(events), 'windows': results})
+        with open(stats_sampler.unique_path(output_path), 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
+
     def run_between(self):
         self.check()
         assert "workload-between" in self.opts, "pass allow_between=True to prepare_option_parser_for_split_or_continuous_workload()"
@@ -209,6 +265,7 @@ class SplitOrContinuousWorkload:
             self._spin_continuous_workloads(self.opts["extra-after"])
             for cwl in self.continuous_workloads:
                 cwl.stop()
+            self.report_availability()
         if self.opts["workload-after"] is not None:
             run(self.opts["workload-after"], self.ports, self.opts["timeout-after"])
 
@@ -40,39 +40,11 @@ with rdb_workload_common.make_table_and_connection(opts) as (table, conn):
         
         # - insert keys
         
-        currentBatch = []
+        utils.BulkLoader(table, len(keys), lambda: utils.cloneConnection(conn), document=lambda i: {'id': keys[i], 'val': keys[i]},
+                         conn=conn, batchSize=batchSize, retryTime=errorToleranceSecs if opts["tolerate_errors"] else 0).load()
         
-        for key in keys:
-            deadline = time.time() + errorToleranceSecs
-            lastError = None
-            response = None
-            
-            # - collect a batch
-            currentBatch.append(key)
-            
-            # - process the batch
-            if len(currentBatch) >= batchSize:
-                while time.time() < deadline:
-                    try:
-                        response = table.insert([{'id': x, 'val': x} for x in currentBatch], durability="soft").run(conn)
-                        break
-                    except conn._r.ReqlError as e:
-                        if opts["tolerate_errors"]:
-                            lastError = e
-                            time.sleep(.1)
-                        else:
-                            raise
-                else:
-                    if lastError:
-                        raise lastError
-            
-                assert response['inserted'] == len(currentBatch), 'Batch insert failed: %r' % response
-                
-                if keys_file:
-                    keys_file.write(''.join(['%r\n' % x for x in currentBatch]))
-                
-                utils.print_with_time('\tWrote keys %r to %r... %d records' % (currentBatch[0], currentBatch[-1], len(currentBatch)))
-                currentBatch = []
+        if keys_file:
+            keys_file.write(''.join(['%r\n' % x for x in keys]))
         
         # - clean up
         
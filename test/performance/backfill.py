@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# Copyright 2010-2016 RethinkDB, all rights reserved.
+
+'''Measure how fast a new replica is backfilled.
+
+For every combination of shard count, document size, replica count and foreground write load, a table is filled
+on the first `replicas - 1` servers of a cluster, then one more server is added to every shard's replicas. The time
+from that reconfiguration to `all_replicas_ready` is the backfill time, reported along with the docs/s and MB/s it
+implies. MB/s counts the JSON size of the documents, so it does not depend on storage overhead.
+
+Every configuration is run `--repeat` times and recorded in the results store as one key, with the backfill times as
+its durations, so `results_store.py check` flags backfills that got slower.'''
+
+import argparse, itertools, json, multiprocessing, os, random, subprocess, sys, time
+
+import concurrency, results_store
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, 'common')))
+import driver, stats_sampler, utils
+
+r = utils.import_python_driver()
+
+db_name = 'test'
+table_name = 'backfill'
+insert_chunk_size = 1000
+writer_timeout = 60 # seconds a writer may take to connect, or to report once told to stop
+
+def parse_list(value):
+    return [int(x) for x in value.split(',') if x]
+
+def make_doc(i, doc_size):
+    return {"id": i, "value": 0, "padding": "x" * doc_size}
+
+def _writer(host, port, num_rows, ops_per_sec, start_event, exit_event, result_queue):
+    '''Foreground load during the backfill: updates to random documents, at a fixed rate. Puts "ready" once
+    connected, then its results when `exit_event` is set, or {"error": message} if it fails at any point.'''
+    ops = errors = 0
+    try:
+        with r.connect(host=host, port=port) as conn:
+            tbl = r.db(db_name).table(table_name)
+            result_queue.put("ready")
+            start_event.wait()
+            start = time.time()
+            while not exit_event.is_set():
+                due = start + ops / ops_per_sec
+                if due > time.time():
+                    time.sleep(min(due - time.time(), 0.1))
+                    continue
+                try:
+                    tbl.get(random.randrange(num_rows)).update({"value": r.row["value"] + 1}, durability="soft").run(conn)
+                except r.ReqlError:
+                    errors += 1
+                ops += 1
+            result_queue.put({"ops": ops, "errors": errors, "elapsed": time.time() - start})
+    except Exception as e:
+        result_queue.put({"error": str(e)})
+
+class WriteLoad(object):
+
+    def __init__(self, server, num_rows, ops_per_sec, writers):
+        self.start_event = multiprocessing.Event()
+        self.exit_event = multiprocessing.Event()
+        self.result_queue = multiprocessing.Queue()
+        self.procs = []
+        if ops_per_sec:
+            self.procs = [
+                multiprocessing.Process(target=_writer, args=(
+                    server.host, server.driver_port, num_rows, float(ops_per_sec) / writers,
+                    self.start_event, self.exit_event, self.result_queue))
+                for _ in range(writers)
+            ]
+
+    def __enter__(self):
+        for proc in self.procs:
+            proc.start()
+        for _ in self.procs:
+            message = concurrency.get_message(self.result_queue, self.procs, writer_timeout, kind="writer")
+            if message != "ready":
+                raise RuntimeError("A writer failed to start: %s" % message["error"])
+        self.start_event.set()
+        return self
+
+    def stop(self):
+        '''Stop the writers, returning their total (ops, errors, ops/s)'''
+        self.exit_event.set()
+        ops = errors = 0
+        rate = 0.0
+        for _ in self.procs:
+            result = concurrency.get_message(self.result_queue, self.procs, writer_timeout, kind="writer")
+            if "error" in result:
+                raise RuntimeError("A writer failed: %s" % result["error"])
+            ops += result["ops"]
+            errors += result["errors"]
+            rate += result["ops"] / result["elapsed"] if result["elapsed"] else 0
+        return ops, errors, rate
+
+    def __exit__(self, exitType, value, traceback):
+        self.exit_event.set()
+        for proc in self.procs:
+            proc.join(5)
+            if proc.is_alive():
+                proc.terminate()
+
+def create_table(conn, servers, shards):
+    if table_name in r.db(db_name).table_list().run(conn):
+        r.db(db_name).table_drop(table_name).run(conn)
+    r.db("rethinkdb").table("table_config").insert({
+        "name": table_name, "db": db_name,
+        "shards": [{"primary_replica": servers[0].name, "replicas": [server.name for server in servers]}] * shards
+    }).run(conn)
+    tbl = r.db(db_name).table(table_name)
+    tbl.wait(wait_for="all_replicas_ready").run(conn)
+    return tbl
+
+def fill_table(conn, tbl, num_rows, doc_size):
+    for start in range(0, num_rows, insert_chunk_size):
+        end = min(start + insert_chunk_size, num_rows)
+        res = tbl.insert([make_doc(i, doc_size) for i in range(start, end)], durability="soft").run(conn)
+        assert res["inserted"] == end - start, res
+    tbl.sync().run(conn)
+
+def run_backfill(cluster, conn, options, shards, doc_size, replicas, write_load):
+    '''Fill a table on `replicas - 1` servers, add the last server and time the backfill to it.
+    Returns the backfill time in seconds, and the foreground (ops, errors, ops/s)'''
+    sources, target = cluster[:replicas - 1], cluster[replicas - 1]
+
+    tbl = create_table(conn, sources, shards)
+    fill_table(conn, tbl, options.num_rows, doc_size)
+
+    with WriteLoad(sources[0], options.num_rows, write_load, options.writers) as load:
+        start = time.time()
+        tbl.config().update({
+            "shards": [{"primary_replica": sources[0].name, "replicas": [server.name for server in sources + [target]]}] * shards
+        }).run(conn)
+        tbl.wait(wait_for="all_replicas_ready", timeout=options.timeout).run(conn)
+        elapsed = time.time() - start
+        foreground = load.stop()
+
+    r.db(db_name).table_drop(table_name).run(conn)
+    return elapsed, foreground
+
+def summarize(durations, doc_bytes, num_rows):
+    durations = sorted(durations)
+    average = sum(durations) / len(durations)
+    return {
+        "average": average,
+        "min": durations[0],
+        "max": durations[-1],
+        "first_centile": durations[0],
+        "last_centile": durations[-1],
+        "docs_per_sec": num_rows / average,
+        "mb_per_sec": num_rows * doc_bytes / average / (1024 * 1024)
+    }
+
+def main():
+    argparser = argparse.ArgumentParser(description='Measure backfill throughput to a new replica')
+    argparser.add_argument('data_dir', nargs='?', default='./', help='where to put the server data directories')
+    argparser.add_argument('--num-rows', type=int, default=50000, help='documents in the table (default: %(default)s)')
+    argparser.add_argument('--shards', type=parse_list, default=[16], metavar='N,...', help='shard counts (default: 16)')
+    argparser.add_argument('--doc-sizes', type=parse_list, default=[100], metavar='BYTES,...', help='padding per document (default: 100)')
+    argparser.add_argument('--replicas', type=parse_list, default=[2], metavar='N,...',
+                           help='replicas once the backfill is done, including the new one (default: 2)')
+    argparser.add_argument('--write-loads', type=parse_list, default=[0], metavar='OPS,...',
+                           help='foreground updates per second during the backfill (default: 0)')
+    argparser.add_argument('--writers', type=int, default=4, help='client processes sharing the write load (default: %(default)s)')
+    argparser.add_argument('--repeat', type=int, default=3, help='backfills per configuration (default: %(default)s)')
+    argparser.add_argument('--timeout', type=int, default=1200, help='longest a single backfill may take (default: %(default)s)')
+    argparser.add_argument('--results-db', default=results_store.default_path, help='results store (default: %(default)s)')
+    argparser.add_argument('--no-record', action='store_true', help='do not add the run to the results store')
+    options = argparser.parse_args()
+
+    if min(options.replicas) < 2:
+        argparser.error('--replicas must be at least 2, one existing replica and the new one')
+    configurations = list(itertools.product(options.shards, options.doc_sizes, options.replicas, options.write_loads))
+    records = []
+
+    utils.print_with_time("Starting a cluster of %d servers" % max(options.replicas))
+    with driver.Cluster(initial_servers=max(options.replicas), output_folder=options.data_dir) as cluster:
+        conn = r.connect(host=cluster[0].host, port=cluster[0].driver_port)
+        if db_name not in r.db_list().run(conn):
+            r.db_create(db_name).run(conn)
+
+        print("%6s %8s %8s %8s %10s %12s %10s %12s" % ("shards", "doc size", "replicas", "writes/s", "seconds", "docs/s", "MB/s", "fg writes/s"))
+        for shards, doc_size, replicas, write_load in configurations:
+            tag = "backfill-s%d-r%d-w%d" % (shards, replicas, write_load)
+            durations = []
+            with stats_sampler.StatsSampler.for_cluster(cluster, os.path.join(cluster.output_folder, tag + '-d%d_stats.json' % doc_size)):
+                for _ in range(options.repeat):
+                    elapsed, (ops, errors, rate) = run_backfill(cluster, conn, options, shards, doc_size, replicas, write_load)
+                    durations.append(elapsed)
+                    summary = summarize([elapsed], len(json.dumps(make_doc(0, doc_size))), options.num_rows)
+                    print("%6d %8d %8d %8d %10.2f %12.0f %10.2f %12.0f%s" % (
+                        shards, doc_size, replicas, write_load, elapsed, summary["docs_per_sec"], summary["mb_per_sec"], rate,
+                        " (%d errors)" % errors if errors else ""))
+                    sys.stdout.flush()
+            records.append({
+                "tag": tag,
+                "cache": "",
+                "doc_size": str(doc_size),
+                "summary": summarize(durations, len(json.dumps(make_doc(0, doc_size))), options.num_rows),
+                "durations": durations
+            })
+
+    if not options.no_record:
+        git_hash = subprocess.Popen(['git', 'log', '-n 1', '--pretty=format:%H'], stdout=subprocess.PIPE).communicate()[0].decode('utf-8').strip()
+        store = results_store.ResultsStore(options.results_db)
+        try:
+            run_id = store.add_run(git_hash, records, suite="backfill")
+        finally:
+            store.close()
+        print("Recorded as run %d in %s" % (run_id, options.results_db))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# Copyright 2010-2016 RethinkDB, all rights reserved.
+
+'''Run a query from many concurrent clients and measure throughput against latency.
+
+Each client is a separate process with its own connection, so the measurement is
+not limited by the driver's CPU use in a single interpreter. Clients record their
+latencies into histograms that are merged once every client is done.'''
+
+import multiprocessing, os, queue, random, sys, time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, 'common')))
+import histogram, utils
+
+r = utils.import_python_driver()
+
+# A concurrency level is saturated when doubling (or more) the clients raises throughput by less than this
+saturation_gain = 0.1
+
+# Raw latencies kept per level, sampled from every client in proportion to its query count, for the results store
+sample_limit = 10000
+
+# Seconds a client may take to connect, or to report after the end of its run, before the level is failed
+client_timeout = 60
+
+def _client(port, query, table, max_i, offset, duration, sample_size, start_event, result_queue):
+    latencies = histogram.LatencyHistogram()
+    samples = [] # reservoir sample of the latencies
+    errors = 0
+    try:
+        connection = r.connect(host="localhost", port=port)
+    except Exception as e:
+        result_queue.put({"error": str(e)})
+        return
+    result_queue.put("ready")
+    start_event.wait()
+
+    i = offset
+    start = time.time()
+    deadline = start + duration
+    fatal = None
+    try:
+        with connection:
+            while time.time() < deadline:
+                start_query = time.time()
+                try:
+                    cursor = eval(query, {"r": r}, {"table": table, "i": i}).run(connection)
+                    if isinstance(cursor, r.net.Cursor):
+                        list(cursor)
+                        cursor.close()
+                except Exception:
+                    errors += 1
+                latency = time.time() - start_query
+                latencies.record(latency)
+                if len(samples) < sample_size:
+                    samples.append(latency)
+                else:
+                    slot = random.randrange(latencies.count)
+                    if slot < sample_size:
+                        samples[slot] = latency
+
+                if table is not None:
+                    i = 0 if i >= len(table["ids"]) - max_i else i + 1
+    except Exception as e:
+        fatal = str(e)
+    result_queue.put({"elapsed": time.time() - start, "histogram": latencies.snapshot(), "samples": samples,
+                      "errors": errors, "fatal": fatal})
+
+def get_message(result_queue, procs, timeout, kind="client"):
+    '''The next message from one of `procs`, raising RuntimeError if one of them died without sending it or none
+    came within `timeout` seconds. Also used for backfill.py's writers, `kind` names the processes in errors.'''
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return result_queue.get(timeout=1)
+        except queue.Empty:
+            pass
+        dead = [proc for proc in procs if proc.exitcode not in (None, 0)]
+        if dead:
+            raise RuntimeError("%s %s exited with code %s without reporting" % (kind.capitalize(), dead[0].name, dead[0].exitcode))
+        if time.time() > deadline:
+            raise RuntimeError("No %s reported within %d seconds" % (kind, timeout))
+
+def merge_samples(messages, limit=sample_limit):
+    '''Combine the clients' latency samples, each client contributing in proportion to its query count'''
+    total = sum(message["histogram"]["count"] for message in messages)
+    merged = []
+    for message in messages:
+        share = int(round(limit * message["histogram"]["count"] / float(total))) if total else 0
+        samples = message["samples"]
+        merged.extend(random.sample(samples, min(share, len(samples))))
+    return merged
+
+def run_level(port, query, table, max_i, clients, duration):
+    '''Run `query` from `clients` concurrent clients for `duration` seconds.
+    Returns a summary with the aggregate throughput, latency percentiles, error count and a sample of the raw
+    latencies in `durations`. Raises RuntimeError if a client fails or stops reporting.'''
+    start_event = multiprocessing.Event()
+    result_queue = multiprocessing.Queue()
+    num_ids = len(table["ids"]) - max_i if table is not None else 0
+    procs = [
+        multiprocessing.Process(target=_client, args=(
+            port, query, table, max_i, (n * num_ids // clients) if num_ids > 0 else 0, duration,
+            max(100, sample_limit // clients), start_event, result_queue
+        ))
+        for n in range(clients)
+    ]
+    for proc in procs:
+        proc.start()
+    try:
+        for _ in procs:
+            message = get_message(result_queue, procs, client_timeout)
+            if message != "ready":
+                raise RuntimeError("Client failed to connect: %s" % message.get("error"))
+        start_event.set()
+
+        latencies = histogram.LatencyHistogram()
+        throughput = 0.0
+        errors = 0
+        messages = []
+        for _ in procs:
+            message = get_message(result_queue, procs, duration + client_timeout)
+            if message.get("fatal"):
+                raise RuntimeError("Client failed: %s" % message["fatal"])
+            messages.append(message)
+            latencies.merge_snapshot(message["histogram"])
+            if message["elapsed"] > 0:
+                throughput += message["histogram"]["count"] / message["elapsed"]
+            errors += message["errors"]
+    finally:
+        for proc in procs:
+            proc.join(5)
+            if proc.is_alive():
+                proc.terminate()
+
+    percentiles = latencies.percentiles((1, 50, 99))
+    return {
+        "clients": clients,
+        "throughput": throughput,
+        "count": latencies.count,
+        "errors": errors,
+        # same fields as the serial results, so `util.compare` can read these too
+        "average": 1. / throughput if throughput else float('inf'),
+        "min": latencies.min,
+        "max": latencies.max,
+        "first_centile": percentiles[1],
+        "median": percentiles[50],
+        "last_centile": percentiles[99],
+        "durations": merge_samples(messages)
+    }
+
+def saturation_point(curve):
+    '''The first level in a throughput curve (list of summaries, by increasing clients) after which
+    adding clients stops improving throughput by at least `saturation_gain`'''
+    for current, following in zip(curve, curve[1:]):
+        if following["throughput"] < current["throughput"] * (1 + saturation_gain):
+            return current
+    return curve[-1] if curve else None
+
+def print_curve(name, curve):
+    print("%s:" % name)
+    print("    %8s %12s %12s %12s %12s %8s" % ("clients", "queries/s", "p1 (ms)", "p50 (ms)", "p99 (ms)", "errors"))
+    for level in curve:
+        print("    %8d %12.2f %12.3f %12.3f %12.3f %8d" % (
+            level["clients"], level["throughput"], level["first_centile"] * 1000, level["median"] * 1000, level["last_centile"] * 1000, level["errors"]))
+    saturated = saturation_point(curve)
+    if saturated is not None:
+        print("    saturates at %d clients, %.2f queries/s" % (saturated["clients"], saturated["throughput"]))
+    sys.stdout.flush()
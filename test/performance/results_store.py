@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# Copyright 2010-2016 RethinkDB, all rights reserved.
+
+'''Persistent store of performance results, and a regression gate on top of it.
+
+Every run of test.py is recorded in a SQLite file together with the raw per-query
+durations, keyed by git hash, query tag, cache setting and document size. Runs
+belong to a suite (the benchmark that produced them, e.g. `queries` or
+`backfill`), and are only compared with runs of the same suite. The `check`
+command compares a candidate run against a baseline with bootstrap confidence
+intervals on the mean and on latency percentiles, and exits non-zero when any
+of them got significantly worse.'''
+
+import argparse, array, json, os, random, sqlite3, sys, time
+
+schema_version = 1
+
+default_path = 'results.sqlite'
+
+default_suite = 'queries' # test.py
+
+# metric name -> function of a sorted list of durations
+def _percentile(p):
+    return lambda durations: durations[min(len(durations) - 1, int(len(durations) * p / 100.))]
+metrics = {
+    'mean': lambda durations: sum(durations) / len(durations),
+    'p50': _percentile(50),
+    'p99': _percentile(99)
+}
+
+class SchemaVersionError(Exception):
+    pass
+
+class ResultsStore(object):
+
+    def __init__(self, path=default_path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                git_hash TEXT NOT NULL,
+                recorded_at REAL NOT NULL,
+                schema_version INTEGER NOT NULL,
+                suite TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                run_id INTEGER NOT NULL REFERENCES runs(id),
+                tag TEXT NOT NULL,
+                cache TEXT NOT NULL,
+                doc_size TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                durations BLOB NOT NULL,
+                PRIMARY KEY (run_id, tag, cache, doc_size)
+            );
+        ''')
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is None:
+            self.conn.execute("INSERT INTO meta VALUES ('schema_version', ?)", (str(schema_version),))
+            self.conn.commit()
+        elif int(row[0]) != schema_version:
+            raise SchemaVersionError('%s has schema version %s, this script handles version %d' % (path, row[0], schema_version))
+
+    def close(self):
+        self.conn.close()
+
+    def add_run(self, git_hash, records, suite=default_suite):
+        '''Store a run. `records` is a list of dicts with `tag`, `cache`, `doc_size`, `summary` and `durations`.
+        Records with the same key (the same query run twice) are stored as one, with the durations of both and the
+        summary of the first.'''
+        merged = {}
+        for record in records:
+            key = (record['tag'], record['cache'] or '', record['doc_size'] or '')
+            if key in merged:
+                merged[key]['durations'] = sorted(merged[key]['durations'] + list(record['durations']))
+            else:
+                merged[key] = {'summary': record['summary'], 'durations': list(record['durations'])}
+        with self.conn:
+            run_id = self.conn.execute(
+                'INSERT INTO runs (git_hash, recorded_at, schema_version, suite) VALUES (?, ?, ?, ?)',
+                (git_hash, time.time(), schema_version, suite)
+            ).lastrowid
+            self.conn.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)', [
+                (run_id, tag, cache, doc_size, json.dumps(record['summary']), array.array('d', record['durations']).tobytes())
+                for (tag, cache, doc_size), record in merged.items()
+            ])
+        return run_id
+
+    def runs(self):
+        return self.conn.execute('SELECT id, git_hash, recorded_at, suite FROM runs ORDER BY id').fetchall()
+
+    def suite(self, run_id):
+        row = self.conn.execute('SELECT suite FROM runs WHERE id = ?', (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def find_run(self, git_hash=None, before=None, suite=None):
+        '''The id of the latest run of `git_hash` (or of any commit), older than run `before` and of `suite` if given'''
+        query, args = 'SELECT id FROM runs WHERE 1', []
+        if suite is not None:
+            query += ' AND suite = ?'
+            args.append(suite)
+        if git_hash is not None:
+            query += ' AND git_hash LIKE ?'
+            args.append(git_hash + '%')
+        if before is not None:
+            query += ' AND id < ?'
+            args.append(before)
+        row = self.conn.execute(query + ' ORDER BY id DESC LIMIT 1', args).fetchone()
+        return row[0] if row else None
+
+    def durations(self, run_id):
+        '''{(tag, cache, doc_size): sorted durations} for one run'''
+        found = {}
+        for tag, cache, doc_size, blob in self.conn.execute('SELECT tag, cache, doc_size, durations FROM results WHERE run_id = ?', (run_id,)):
+            values = array.array('d')
+            values.frombytes(blob)
+            found[(tag, cache, doc_size)] = sorted(values)
+        return found
+
+    def history(self, tag):
+        return [
+            (git_hash, recorded_at, cache, doc_size, json.loads(summary))
+            for git_hash, recorded_at, cache, doc_size, summary in self.conn.execute('''
+                SELECT runs.git_hash, runs.recorded_at, results.cache, results.doc_size, results.summary
+                FROM results JOIN runs ON runs.id = results.run_id
+                WHERE results.tag = ? ORDER BY runs.id''', (tag,))
+        ]
+
+def bootstrap_ratio(baseline, candidate, metric, resamples=200, confidence=0.95, rng=random):
+    '''Confidence interval for metric(candidate) / metric(baseline), both lists of durations'''
+    ratios = []
+    for _ in range(resamples):
+        base = metric(sorted(rng.choices(baseline, k=len(baseline))))
+        cand = metric(sorted(rng.choices(candidate, k=len(candidate))))
+        ratios.append(cand / base if base else float('inf'))
+    ratios.sort()
+    tail = (1 - confidence) / 2
+    return ratios[int(tail * (resamples - 1))], ratios[int((1 - tail) * (resamples - 1))]
+
+def compare_runs(baseline, candidate, threshold=0.05, resamples=200, confidence=0.95, seed=0):
+    '''Compare two {key: durations} sets. Returns a list of (key, metric, point ratio, (low, high), status),
+    where status is "regression" when the whole confidence interval lies above 1 + threshold,
+    "improvement" when it lies below 1 - threshold, and "unchanged" otherwise.'''
+    rng = random.Random(seed)
+    report = []
+    for key in sorted(set(baseline) & set(candidate)):
+        if not baseline[key] or not candidate[key]:
+            continue
+        for name in sorted(metrics):
+            metric = metrics[name]
+            base = metric(baseline[key])
+            ratio = metric(candidate[key]) / base if base else float('inf')
+            low, high = bootstrap_ratio(baseline[key], candidate[key], metric, resamples=resamples, confidence=confidence, rng=rng)
+            if low > 1 + threshold:
+                status = 'regression'
+            elif high < 1 - threshold:
+                status = 'improvement'
+            else:
+                status = 'unchanged'
+            report.append((key, name, ratio, (low, high), status))
+    return report
+
+# == command line
+
+def check(store, options):
+    candidate = store.find_run(options.candidate, suite=options.suite)
+    if candidate is None:
+        sys.exit('No run found for candidate %s' % (options.candidate or '(latest)'))
+    suite = store.suite(candidate)
+    baseline = store.find_run(options.baseline, before=None if options.baseline else candidate, suite=suite)
+    if baseline is None:
+        sys.exit('No %s run found for baseline %s' % (suite, options.baseline or '(previous)'))
+
+    baseline_durations, candidate_durations = store.durations(baseline), store.durations(candidate)
+    if not set(baseline_durations) & set(candidate_durations):
+        sys.exit('Runs %d and %d have no queries in common, nothing to compare' % (candidate, baseline))
+    report = compare_runs(baseline_durations, candidate_durations,
+                          threshold=options.threshold, resamples=options.resamples, confidence=options.confidence)
+    regressions = 0
+    for (tag, cache, doc_size), name, ratio, (low, high), status in report:
+        if status == 'regression':
+            regressions += 1
+        if status != 'unchanged' or options.verbose:
+            print('%-12s %-40s %-10s %-6s %-5s x%.3f [%.3f, %.3f]' % (status, tag, cache, doc_size, name, ratio, low, high))
+    print('Compared %s run %d against run %d: %d regression(s) in %d comparisons' % (suite, candidate, baseline, regressions, len(report)))
+    return 1 if regressions else 0
+
+def history(store, options):
+    for git_hash, recorded_at, cache, doc_size, summary in store.history(options.tag):
+        print('%s %s %-10s %-6s avg %.6f first centile %.6f last centile %.6f' % (
+            time.strftime('%y.%m.%d-%H:%M:%S', time.localtime(recorded_at)), git_hash[:10], cache, doc_size,
+            summary['average'], summary['first_centile'], summary['last_centile']))
+    return 0
+
+def main(args=None):
+    argparser = argparse.ArgumentParser(description='Query the stored performance results')
+    argparser.add_argument('--db', default=default_path, help='results database (default: %(default)s)')
+    subparsers = argparser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    check_parser = subparsers.add_parser('check', help='exit non-zero if the candidate run regressed against the baseline')
+    check_parser.add_argument('--suite', default=None, help='only consider runs of this suite, e.g. queries or backfill (default: the suite of the candidate)')
+    check_parser.add_argument('--candidate', default=None, help='git hash (or prefix) of the candidate run (default: latest run)')
+    check_parser.add_argument('--baseline', default=None, help='git hash (or prefix) of the baseline run (default: the run before the candidate)')
+    check_parser.add_argument('--threshold', type=float, default=0.05, help='smallest relative change to report (default: %(default)s)')
+    check_parser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the intervals (default: %(default)s)')
+    check_parser.add_argument('--resamples', type=int, default=200, help='bootstrap resamples per comparison (default: %(default)s)')
+    check_parser.add_argument('--verbose', action='store_true', help='also print the comparisons that did not change')
+    check_parser.set_defaults(func=check)
+
+    history_parser = subparsers.add_parser('history', help='print the stored summaries of one query key')
+    history_parser.add_argument('tag')
+    history_parser.set_defaults(func=history)
+
+    options = argparser.parse_args(args)
+    if not os.path.exists(options.db):
+        sys.exit('No results database at %s' % options.db)
+    store = ResultsStore(options.db)
+    try:
+        return options.func(store, options)
+    finally:
+        store.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,6 +3,7 @@
 
 
 
+import argparse
 import sys
 import time
 import json
@@ -10,11 +11,12 @@ import os
 import math
 import subprocess
 
-from util import gen_doc, gen_num_docs, compare
+from util import gen_docs, gen_num_docs, compare
 from queries import constant_queries, table_queries, write_queries, delete_queries
+import concurrency, results_store
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, 'common')))
-import driver, utils
+import driver, stats_sampler, utils
 
 r = utils.import_python_driver()
 
@@ -47,12 +49,22 @@ tables = [
 time_per_query = 60 # 1 minute max per query
 executions_per_query = 1000 # 1000 executions max per query
 
+# Read and constant queries can additionally be run from several concurrent clients at once,
+# each with its own connection, for this many seconds per concurrency level
+concurrency_levels = []
+time_per_concurrency_level = 10
+
+# Seed for the generated documents, so every run inserts the same data
+doc_seed = 0
+
 # Global variables -- so we don't have to pass them around
 results = {} # Save the time per query (average, min, max etc.)
+records = [] # The raw durations per query, for the results store
 connection = None
+server_port = None
 
 def run_tests(build=None, data_dir='./'):
-    global connection, servers_settings
+    global connection, server_port, servers_settings
     
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
@@ -73,24 +85,48 @@ def run_tests(build=None, data_dir='./'):
         sys.stdout.flush()
         with driver.Process(name=os.path.join(data_dir, settings["name"]), executable_path=executable_path, extra_options=['--cache-size', str(settings["cache_size"])]) as server:
             
-            print(" Done.\nConnecting...", end=' ')
-            sys.stdout.flush()
+            # server side counters for the whole run, next to the server's data
+            with stats_sampler.StatsSampler([(server.host, server.driver_port)], os.path.join(data_dir, settings["name"] + '_stats.json')):
+                print(" Done.\nConnecting...", end=' ')
+                sys.stdout.flush()
 
-            connection = r.connect(host="localhost", port=server.driver_port)
-            print(" Done.")
-            sys.stdout.flush()
+                connection = r.connect(host="localhost", port=server.driver_port)
+                server_port = server.driver_port
+                print(" Done.")
+                sys.stdout.flush()
 
-            init_tables(connection)
+                init_tables(connection)
 
-            # Tests
-            execute_read_write_queries(settings["name"])
+                # Tests
+                execute_read_write_queries(settings["name"])
 
-            if i == 0:
-                execute_constant_queries()
-            i = i + 1
+                if i == 0:
+                    execute_constant_queries()
+                i = i + 1
 
     save_compare_results()
 
+def record_result(tag, table, cache, durations, average):
+    """Save the summary of a query's durations in `results`, and the durations themselves in `records`"""
+    global results, records
+
+    durations.sort()
+    key = tag if table is None else tag + "-" + table["name"] + "-" + cache
+    results[key] = {
+        "average": average,
+        "min": durations[0],
+        "max": durations[len(durations) - 1],
+        "first_centile": durations[int(math.floor(len(durations) / 100. * 1))],
+        "last_centile": durations[int(math.floor(len(durations) / 100. * 99))]
+    }
+    records.append({
+        "tag": tag,
+        "cache": cache,
+        "doc_size": None if table is None else table["size_doc"],
+        "summary": results[key],
+        "durations": durations
+    })
+
 def init_tables(connection):
     """Create the tables we are going to use"""
     global tables
@@ -126,12 +162,9 @@ def execute_read_write_queries(suffix):
     print("Running inserts...", end=' ')
     sys.stdout.flush()
     for table in tables:
-        docs = []
         num_writes = gen_num_docs(table["size_doc"])
-        for i in range(num_writes):
-            docs.append(gen_doc(table["size_doc"], i))
+        docs = gen_docs(table["size_doc"], num_writes, seed=doc_seed)
 
-        
         i = 0
 
         durations = []
@@ -145,14 +178,7 @@ def execute_read_write_queries(suffix):
                 table["ids"].append(result["generated_keys"][0])
             i += 1
 
-        durations.sort()
-        results["single-inserts-" + table["name"] + "-" + suffix] = {
-            "average": (time.time() - start) / i,
-            "min": durations[0],
-            "max": durations[len(durations) - 1],
-            "first_centile": durations[int(math.floor(len(durations) / 100. * 1))],
-            "last_centile": durations[int(math.floor(len(durations) / 100. * 99))]
-        }
+        record_result("single-inserts", table, suffix, durations, (time.time() - start) / i)
 
         # Save it to know how many batch inserts we did
         single_inserts = i
@@ -178,13 +204,7 @@ def execute_read_write_queries(suffix):
                 table["ids"] += result["generated_keys"]
         
         if num_writes - single_inserts != 0:
-            results["batch-inserts-" + table["name"] + "-" + suffix] = {
-                "average": (end - start) / (count_batch_insert * size_batch),
-                "min": durations[0],
-                "max": durations[len(durations) - 1],
-                "first_centile": durations[int(math.floor(len(durations) / 100. * 1))],
-                "last_centile": durations[int(math.floor(len(durations) / 100. * 99))]
-            }
+            record_result("batch-inserts", table, suffix, durations, (end - start) / (count_batch_insert * size_batch))
         
         table["ids"].sort()
     
@@ -197,11 +217,6 @@ def execute_read_write_queries(suffix):
     sys.stdout.flush()
     for table in tables:
         for p in range(len(write_queries)):
-            docs = []
-            num_writes = gen_num_docs(table["size_doc"])
-            for i in range(num_writes):
-                docs.append(gen_doc(table["size_doc"], i))
-
             i = 0
 
             durations = []
@@ -212,14 +227,7 @@ def execute_read_write_queries(suffix):
                 durations.append(time.time() - start_query)
                 i += 1
 
-            durations.sort()
-            results[write_queries[p]["tag"] + "-" + table["name"] + "-" + suffix] = {
-                "average": (time.time() - start) / i,
-                "min": durations[0],
-                "max": durations[len(durations) - 1],
-                "first_centile": durations[int(math.floor(len(durations) / 100. * 1))],
-                "last_centile": durations[int(math.floor(len(durations) / 100. * 99))]
-            }
+            record_result(write_queries[p]["tag"], table, suffix, durations, (time.time() - start) / i)
 
             i -= 1 # We need i in write_queries[p]["clean"] (to revert only the document we updated)
             # Clean the update
@@ -263,20 +271,22 @@ def execute_read_write_queries(suffix):
                 durations.append(time.time() - start_query)
                 count += 1
 
-            durations.sort()
-            results[table_queries[p]["tag"] + "-" + table["name"] + "-" + suffix] = {
-                "average": (time.time() - start) / count,
-                "min": durations[0],
-                "max": durations[len(durations) - 1],
-                "first_centile": durations[int(math.floor(len(durations) / 100. * 1))],
-                "last_centile": durations[int(math.floor(len(durations) / 100. * 99))]
-            }
+            record_result(table_queries[p]["tag"], table, suffix, durations, (time.time() - start) / count)
 
 
     print(" Done.")
     sys.stdout.flush()
 
 
+    # Execute the read queries from concurrent clients, before the deletes remove the documents
+    if concurrency_levels:
+        print("Running concurrent reads...")
+        sys.stdout.flush()
+        for table in tables:
+            for query in table_queries:
+                execute_concurrently(query["query"], query["tag"], table, suffix, query.get("imax", 0) + 1)
+
+
     # Execute the delete queries
     print("Running delete...", end =' ')
     sys.stdout.flush()
@@ -295,19 +305,42 @@ def execute_read_write_queries(suffix):
 
                 i += 1
 
-            durations.sort()
-            results[delete_queries[p]["tag"] + "-" + table["name"] + "-" + suffix] = {
-                "average": (time.time() - start) / i,
-                "min": durations[0],
-                "max": durations[len(durations) - 1],
-                "first_centile": durations[int(math.floor(len(durations) / 100. * 1))],
-                "last_centile": durations[int(math.floor(len(durations) / 100. * 99))]
-            }
+            record_result(delete_queries[p]["tag"], table, suffix, durations, (time.time() - start) / i)
 
 
     print(" Done.")
     sys.stdout.flush()
 
+def execute_concurrently(query, tag, table, suffix, max_i=1):
+    """Run a query at every concurrency level, and save the resulting throughput/latency curve"""
+    global results, records, server_port, concurrency_levels, time_per_concurrency_level
+
+    curve = []
+    for clients in concurrency_levels:
+        try:
+            level = concurrency.run_level(server_port, query, table, max_i, clients, time_per_concurrency_level)
+        except RuntimeError as e:
+            print("%s failed with %d clients: %s" % (tag, clients, str(e)))
+            sys.stdout.flush()
+            continue
+        durations = level.pop("durations")
+        curve.append(level)
+        if level["count"] == 0:
+            continue
+        if table is None:
+            results[tag + "-c" + str(clients)] = level
+        else:
+            results[tag + "-" + table["name"] + "-" + suffix + "-c" + str(clients)] = level
+        if durations:
+            records.append({
+                "tag": tag + "-c" + str(clients),
+                "cache": suffix,
+                "doc_size": None if table is None else table["size_doc"],
+                "summary": level,
+                "durations": sorted(durations)
+            })
+    concurrency.print_curve(tag if table is None else tag + "-" + table["name"] + "-" + suffix, curve)
+
 def execute_constant_queries():
     global results
 
@@ -339,37 +372,33 @@ def execute_constant_queries():
             
             count += 1
         
-        durations.sort()
         if type(constant_queries[p]) == type(""):
-            results[constant_queries[p]] = {
-                "average": (time.time() - start) / count,
-                "min": durations[0],
-                "max": durations[len(durations) - 1],
-                "first_centile": durations[int(math.floor(len(durations) / 100. * 1))],
-                "last_centile": durations[int(math.floor(len(durations) / 100. * 99))]
-            }
+            record_result(constant_queries[p], None, None, durations, (time.time() - start) / count)
         else:
-            results[constant_queries[p]["tag"]] = {
-                "average": (time.time() - start) / count,
-                "min": durations[0],
-                "max": durations[len(durations) - 1],
-                "first_centile": durations[int(math.floor(len(durations) / 100. * 1))],
-                "last_centile": durations[int(math.floor(len(durations) / 100. * 99))]
-            }
+            record_result(constant_queries[p]["tag"], None, None, durations, (time.time() - start) / count)
 
     print(" Done.")
     sys.stdout.flush()
 
+    if concurrency_levels:
+        print("Running concurrent constant queries...")
+        sys.stdout.flush()
+        for query in constant_queries:
+            if type(query) == type(""):
+                execute_concurrently(query, query, None, None)
+            else:
+                execute_concurrently(query["query"], query["tag"], None, None)
+
 def stop_cluster(cluster):
     """Stop the cluster"""
     cluster.check_and_stop()
 
 def save_compare_results():
     """Save the current results, and if previous results are available, generate an HTML page with the differences"""
-    global results, str_date
+    global results, records, str_date
 
-    commit = out = subprocess.Popen(['git', 'log', '-n 1', '--pretty=format:"%H"'], stdout=subprocess.PIPE).communicate()[0]
-    results["hash"] = commit
+    commit = subprocess.Popen(['git', 'log', '-n 1', '--pretty=format:%H'], stdout=subprocess.PIPE).communicate()[0]
+    results["hash"] = commit.decode('utf-8').strip()
 
     # Save results
     if not os.path.exists("results"):
@@ -382,6 +411,13 @@ def save_compare_results():
     f.write(str_res)
     f.close()
 
+    # Record the run, with its raw durations, in the results store
+    store = results_store.ResultsStore(results_store.default_path)
+    try:
+        store.add_run(results["hash"], records, suite=results_store.default_suite)
+    finally:
+        store.close()
+
     # Read all the previous results stored in results/
     file_paths = []
     for root, directories, files in os.walk("results/"):
@@ -409,7 +445,13 @@ def main(data_dir):
     run_tests(data_dir=data_dir)
 
 if __name__ == "__main__":
-    data_dir = './'
-    if len(sys.argv) > 1:
-        data_dir = sys.argv[1]
-    main(data_dir)
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('data_dir', nargs='?', default='./', help='where to put the server data directories')
+    argparser.add_argument('--concurrency', default='', metavar='LEVELS',
+                           help='also run the read and constant queries at these comma-separated numbers of concurrent clients, e.g. 1,8,64,256')
+    argparser.add_argument('--concurrency-duration', type=float, default=time_per_concurrency_level, metavar='SECONDS',
+                           help='how long to run each query at each concurrency level (default: %(default)s)')
+    args = argparser.parse_args()
+    concurrency_levels = sorted(int(level) for level in args.concurrency.split(',') if level)
+    time_per_concurrency_level = args.concurrency_duration
+    main(args.data_dir)
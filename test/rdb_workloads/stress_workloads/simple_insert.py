@@ -13,13 +13,18 @@ class Workload:
         self.db = options["db"]
         self.table = options["table"]
 
-    def run(self, conn):
-
+    def query(self):
         doc = {'str': 'X' * random.randint(1, 200)}
+        return r.db(self.db).table(self.table).insert(doc)
 
-        write_result = r.db(self.db).table(self.table).insert(doc).run(conn)
-
+    def check(self, write_result):
         if write_result['inserted'] != 1:
             return {"errors": ["Insert failed: " + str(write_result)]}
 
         return {}
+
+    def run(self, conn):
+        return self.check(self.query().run(conn))
+
+    async def run_async(self, conn):
+        return self.check(await self.query().run(conn))
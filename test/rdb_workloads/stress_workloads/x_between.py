@@ -11,12 +11,18 @@ class Workload:
         self.table = options["table"]
         self.time_dist = x_stress_util.TimeDistribution(os.getenv("X_END_DATE"), os.getenv("X_DATE_INTERVAL"))
 
-    def run(self, conn):
+    def query(self):
         (start_date, end_date) = self.time_dist.get()
 
         time_1 = r.time(start_date.year, start_date.month, start_date.day, 'Z')
         time_2 = r.time(end_date.year, end_date.month, end_date.day, 'Z')
 
-        cursor = r.db(self.db).table(self.table).between(time_1, time_2, index="datetime").count().run(conn)
+        return r.db(self.db).table(self.table).between(time_1, time_2, index="datetime").count()
+
+    def run(self, conn):
+        self.query().run(conn)
+        return {}
 
+    async def run_async(self, conn):
+        await self.query().run(conn)
         return {}
@@ -16,3 +16,9 @@ class Workload:
         with r.connect(host[0], host[1]) as conn:
             pass
         return {}
+
+    async def run_async(self, conn):
+        host = random.choice(self.hosts)
+        conn = await r.connect(host[0], host[1])
+        await conn.close()
+        return {}
@@ -11,11 +11,19 @@ class Workload:
         self.table = options["table"]
         self.cid_dist = x_stress_util.Pareto(1000)
 
-    def run(self, conn):
+    def query(self):
         cid = "customer%03d" % self.cid_dist.get()
-        cursor = r.db(self.db).table(self.table).get_all(cid, index="customer_id").group("type").count().run(conn)
+        return r.db(self.db).table(self.table).get_all(cid, index="customer_id").group("type").count()
+
+    def run(self, conn):
+        cursor = self.query().run(conn)
 
         for row in cursor:
             pass
 
         return {}
+
+    async def run_async(self, conn):
+        # grouped results come back as a single object, so there is no cursor to drain
+        await self.query().run(conn)
+        return {}
@@ -13,10 +13,7 @@ class Workload:
         self.typ_dist = x_stress_util.Pareto(10)
         self.time_dist = x_stress_util.TimeDistribution(os.getenv("X_END_DATE"), os.getenv("X_DATE_INTERVAL"))
 
-    def run(self, conn):
-        (start_date, end_date) = self.time_dist.get()
-
-    def run(self, conn):
+    def query(self):
         cid = "customer%03d" % self.cid_dist.get()
         typ = "type%d" % self.typ_dist.get()
 
@@ -24,10 +21,15 @@ class Workload:
         time_1 = r.time(start_date.year, start_date.month, start_date.day, 'Z')
         time_2 = r.time(end_date.year, end_date.month, end_date.day, 'Z')
 
-        res = r.db(self.db).table(self.table).between([cid, time_1], [cid, time_2], index="compound") \
-                                             .filter(lambda row: row["type"].eq(typ)) \
-                                             .map(lambda row: row["arr"].reduce(lambda acc,val: acc + val).default(0)) \
-                                             .reduce(lambda acc,val: acc + val).default(0) \
-                                             .run(conn)
+        return r.db(self.db).table(self.table).between([cid, time_1], [cid, time_2], index="compound") \
+                                              .filter(lambda row: row["type"].eq(typ)) \
+                                              .map(lambda row: row["arr"].reduce(lambda acc,val: acc + val).default(0)) \
+                                              .reduce(lambda acc,val: acc + val).default(0)
+
+    def run(self, conn):
+        self.query().run(conn)
+        return {}
 
+    async def run_async(self, conn):
+        await self.query().run(conn)
         return {}
@@ -1,5 +1,5 @@
 #!/usr/bin/env python
-import md5, sys, os, errno, x_stress_util
+import hashlib, sys, os, errno, x_stress_util
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, 'common')))
 import utils
@@ -47,14 +47,23 @@ class Workload:
         else:
             self.count += 1
 
-    def run(self, conn):
+    def query(self):
         self.update_max_key()
 
         original_key = self.key_dist.get()
-        key = md5.new(str(original_key)).hexdigest()
-        rql_res = r.db(self.db).table(self.table).get(key).run(conn)
+        key = hashlib.md5(str(original_key).encode()).hexdigest()
+        return original_key, r.db(self.db).table(self.table).get(key)
 
+    def check(self, original_key, rql_res):
         if rql_res is None:
             return {"errors": ["key not found: %d" % original_key]}
 
         return {}
+
+    def run(self, conn):
+        original_key, query = self.query()
+        return self.check(original_key, query.run(conn))
+
+    async def run_async(self, conn):
+        original_key, query = self.query()
+        return self.check(original_key, await query.run(conn))
@@ -1,9 +1,9 @@
 #!/usr/bin/env python
-import md5, sys, os, random, string, x_stress_util
+import hashlib, sys, os, random, x_stress_util
 import multiprocessing
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, 'common')))
-import utils
+import doc_generator, utils
 r = utils.import_python_driver()
 
 class Workload:
@@ -48,6 +48,9 @@ class Workload:
         else:
             self.key_file = None
 
+        self.generator = None
+        self.generator_pid = None
+
     def update_max_key(self, new_key):
         if new_key % 200 == 0:
             if self.key_file is not None:
@@ -55,46 +58,73 @@ class Workload:
                 new_max_key = x_stress_util.perform_ignore_interrupt(lambda: self.key_file.write("%d\n" % new_key))
                 x_stress_util.perform_ignore_interrupt(lambda: self.key_file.flush())
 
-    def get_key(self):
+    def get_keys(self, count):
         self.max_key.acquire()
         try:
-            new_key = self.max_key.value + 1
-            self.max_key.value = new_key
+            first_key = self.max_key.value + 1
+            self.max_key.value += count
         finally:
             self.max_key.release()
-        self.update_max_key(new_key)
-        return new_key
-
-    def generate_nested(self, levels):
+        last_key = first_key + count - 1
+        if last_key // 200 != (first_key - 1) // 200:
+            self.update_max_key(last_key - last_key % 200)
+        return range(first_key, last_key + 1)
+
+    def doc_generator(self):
+        # The workload is constructed before the clients fork, so each client process seeds its
+        # own generator from its global random state, which the stress controller seeds per client.
+        if self.generator_pid != os.getpid():
+            self.generator = doc_generator.DocGenerator(seed=random.random())
+            self.generator_pid = os.getpid()
+        return self.generator
+
+    def generate_nested(self, levels, strings):
         nested = {}
-        nested["foo"] = "".join(random.choice(string.ascii_letters + string.digits) for i in range(10))
-        nested["bar"] = "".join(random.choice(string.ascii_letters + string.digits) for i in range(10))
+        nested["foo"] = next(strings)
+        nested["bar"] = next(strings)
 
         if levels > 0:
-            nested["nested"] = self.generate_nested(levels - 1)
-            nested["nested2"] = self.generate_nested(levels - 1)
-            nested["nested3"] = self.generate_nested(levels - 1)
+            nested["nested"] = self.generate_nested(levels - 1, strings)
+            nested["nested2"] = self.generate_nested(levels - 1, strings)
+            nested["nested3"] = self.generate_nested(levels - 1, strings)
 
         return nested
 
-    def generate_row(self):
-        row = {}
-        row["id"] = md5.new(str(self.get_key())).hexdigest()
-        row["customer_id"] = "customer%03d" % self.cid_dist.get()
-        row["type"] = "type%d" % self.typ_dist.get()
-        row["datetime"] = r.now()
-        row["nested"] = self.generate_nested(2)
-        row["arr"] = [random.randint(0, 100000) for i in range(86)]
-        row["arr2"] = ["".join(random.sample(string.ascii_letters + string.digits, 2)) for i in range(86)]
-        row["flat"] = "".join(random.choice(string.ascii_letters + string.digits) for i in range(463))
-        return row
-
-    def run(self, conn):
-        row_data = [self.generate_row() for i in range(self.batch_size)]
-        rql_res = r.db(self.db).table(self.table).insert(row_data).run(conn)
-
+    def generate_rows(self, count):
+        # all of the random content for the batch is generated up front, then sliced up per row
+        generator = self.doc_generator()
+        nested_strings = iter(generator.strings(count * 26, 10))
+        arr = generator.ints(count * 86, 0, 100000)
+        arr2 = generator.strings(count * 86, 2)
+        flat = generator.strings(count, 463)
+
+        rows = []
+        for i, key in enumerate(self.get_keys(count)):
+            row = {}
+            row["id"] = hashlib.md5(str(key).encode()).hexdigest()
+            row["customer_id"] = "customer%03d" % self.cid_dist.get()
+            row["type"] = "type%d" % self.typ_dist.get()
+            row["datetime"] = r.now()
+            row["nested"] = self.generate_nested(2, nested_strings)
+            row["arr"] = arr[i * 86:(i + 1) * 86]
+            row["arr2"] = arr2[i * 86:(i + 1) * 86]
+            row["flat"] = flat[i]
+            rows.append(row)
+        return rows
+
+    def query(self):
+        row_data = self.generate_rows(self.batch_size)
+        return r.db(self.db).table(self.table).insert(row_data)
+
+    def check(self, rql_res):
         result = {}
         if rql_res["errors"] > 0:
             result["errors"] = [rql_res["first_error"]]
 
         return result
+
+    def run(self, conn):
+        return self.check(self.query().run(conn))
+
+    async def run_async(self, conn):
+        return self.check(await self.query().run(conn))
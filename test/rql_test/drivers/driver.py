@@ -1,6 +1,6 @@
 
 
-import atexit, copy, inspect, itertools, os, pprint, re, sys, time, warnings
+import atexit, collections, copy, inspect, itertools, os, pprint, re, sys, time, warnings
 from datetime import datetime, tzinfo, timedelta # used by time tests
 
 stashedPath = copy.copy(sys.path)
@@ -192,6 +192,39 @@ class Uuid(Regex):
     def __repr__(self):
         return "uuid()"
 
+def canonicalKey(value, ordered=True):
+    '''Return a hashable key such that two values with the same key always pass `compare`, or None if the value needs
+    `compare` itself: fuzzy matchers (Anything, Regex, Err, options), NaN, and any type not handled here.'''
+    
+    if value is None:
+        return ('none',)
+    if isinstance(value, (int, float)): # note: this includes bool, and 1 == 1.0 == True both here and in compare
+        return None if value != value else ('number', value)
+    if isinstance(value, str):
+        return ('str', value)
+    if isinstance(value, bytes):
+        return ('bytes', value)
+    if isinstance(value, dict):
+        items = []
+        for key, item in value.items():
+            itemKey = canonicalKey(item, ordered=ordered)
+            if itemKey is None:
+                return None
+            items.append((key, itemKey))
+        return ('dict', frozenset(items))
+    if isinstance(value, (list, tuple)):
+        items = []
+        for item in value:
+            itemKey = canonicalKey(item, ordered=ordered)
+            if itemKey is None:
+                return None
+            items.append(itemKey)
+        if ordered:
+            return ('list', tuple(items))
+        else:
+            return ('bag', frozenset(collections.Counter(items).items()))
+    return None
+
 def compare(expected, result, options=None):
     '''Compare the two items by the rules we have, returning either True, or a message about why it failed'''
     # -- merge options
@@ -317,7 +350,29 @@ def compare(expected, result, options=None):
         # - unordered
         else:
             haystack = list(result)
-            for needle in expected:
+            needles = list(expected)
+            
+            # - fast path: pair up exactly comparable values by their canonical keys, unless numbers only need to be
+            #   within a precision of each other
+            strawsByKey = {}
+            for i, straw in enumerate(haystack if not options['precision'] else []):
+                key = canonicalKey(straw, ordered=False)
+                if key is not None:
+                    strawsByKey.setdefault(key, collections.deque()).append(i)
+            if strawsByKey:
+                unmatched = []
+                matched = set()
+                for needle in needles:
+                    key = canonicalKey(needle, ordered=False)
+                    if key is not None and strawsByKey.get(key):
+                        matched.add(strawsByKey[key].popleft())
+                    else:
+                        unmatched.append(needle)
+                needles = unmatched
+                haystack = [straw for i, straw in enumerate(haystack) if i not in matched]
+            
+            # - slow path: everything else is matched by compare
+            for needle in needles:
                 for straw in haystack:
                     if compare(needle, straw, options=options):
                         break
@@ -97,6 +97,34 @@ class PythonTestDriverTest(unittest.TestCase):
         self.compareFalse(bag([1,3]), [1,2,3])
         self.compareFalse(bag([3,1]), [1,2,3])
         
+        # repeated values
+        self.compare(bag([1,2,1]), [1,1,2])
+        self.compareFalse(bag([1,2,1]), [1,2,2])
+        
+        # numbers of different types
+        self.compare(bag([1,2.0]), [2,1.0])
+        
+        # nested items, which are also compared unordered
+        self.compare(bag([{'a':[1,2]}, {'b':None}]), [{'b':None}, {'a':[2,1]}])
+        self.compareFalse(bag([{'a':[1,2]}, {'b':None}]), [{'b':None}, {'a':[2,2]}])
+        
+        # mixed with fuzzy matchers
+        self.compare(bag([uuid(), 1]), [1, '12345678-1234-1234-1234-123456789012'])
+        self.compare(bag([partial({'a':1}), {'a':1}]), [{'a':1}, {'a':1, 'b':2}])
+        self.compareFalse(bag([uuid(), 1]), [1, 2])
+        
+        # numbers within a precision, which can not be paired up by value
+        self.compare(bag([1.0, 1.4]), [1.4, 1.8], {'precision':0.5})
+        self.compareFalse(bag([1.0, 1.4]), [1.4, 2.0], {'precision':0.5})
+        
+        # large
+        self.compare(bag(list(range(5000))), list(reversed(range(5000))))
+        self.compareFalse(bag(list(range(5000))), list(range(1, 5001)))
+        
+        # failure messages
+        self.assertEqual(compare(bag([1,2]), [1,3]), 'missing expected item: 2')
+        self.assertEqual(compare(bag([1]), [3,1,2]), 'extra items returned: [3, 2]')
+        
         # empty array
         self.compare(bag([]), [])
     
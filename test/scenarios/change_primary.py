@@ -37,8 +37,9 @@ class ChangePrimary(rdb_unittest.RdbTestCase):
             utils.print_with_time("Demoting primary")
             shardConfig = self.table.config()['shards'].run(self.conn)
             shardConfig[0]['primary_replica'] = beta.name
-            self.table.config().update({'shards': shardConfig}).run(self.conn)
-            self.table.wait(wait_for='all_replicas_ready').run(self.conn)
+            with workload.reconfiguration("demote primary"):
+                self.table.config().update({'shards': shardConfig}).run(self.conn)
+                self.table.wait(wait_for='all_replicas_ready').run(self.conn)
             self.checkCluster()
             
             utils.print_with_time("Running after workload")
@@ -49,28 +49,29 @@ class FailoverToSecondary(rdb_unittest.RdbTestCase):
             self.assertEqual(issues, [], 'The server recorded the following issues after the run_before:\n%s' % pformat(issues))
             
             print_with_time("Shutting down the primary")
-            primary.close()
-            
-            print_with_time("Checking that the table_availability issue shows up")
-            deadline = time.time() + 5
-            last_error = None
-            while time.time() < deadline:
+            with workload.reconfiguration("fail over to secondary"):
+                primary.close()
+                
+                print_with_time("Checking that the table_availability issue shows up")
+                deadline = time.time() + 5
+                last_error = None
+                while time.time() < deadline:
+                    try:
+                        issues = list(self.r.db('rethinkdb').table('current_issues').filter({'type':'table_availability', 'info':{'db':dbName, 'table':tableName}}).run(stableConn))
+                        self.assertEqual(len(issues), 1, 'The server did not record the single issue for the killed server:\n%s' % pformat(issues))
+                        break
+                    except Exception as e:
+                        last_error = e
+                        time.sleep(.2)
+                else:
+                    raise last_error
+                
+                print_with_time("Waiting for the table to become available again")
+                timeout = 30
                 try:
-                    issues = list(self.r.db('rethinkdb').table('current_issues').filter({'type':'table_availability', 'info':{'db':dbName, 'table':tableName}}).run(stableConn))
-                    self.assertEqual(len(issues), 1, 'The server did not record the single issue for the killed server:\n%s' % pformat(issues))
-                    break
-                except Exception as e:
-                    last_error = e
-                    time.sleep(.2)
-            else:
-                raise last_error
-            
-            print_with_time("Waiting for the table to become available again")
-            timeout = 30
-            try:
-                self.table.wait(wait_for='ready_for_writes', timeout=timeout).run(stableConn)
-            except self.r.ReqlRuntimeError as e:
-                raise AssertionError('Table did not become available after %d seconds.' % timeout)
+                    self.table.wait(wait_for='ready_for_writes', timeout=timeout).run(stableConn)
+                except self.r.ReqlRuntimeError as e:
+                    raise AssertionError('Table did not become available after %d seconds.' % timeout)
             
             print_with_time("Running workload after")
             workload.run_after()
@@ -89,12 +89,13 @@ with driver.Cluster(output_folder='.', initial_servers=numReplicas + 1, console_
             utils.print_with_time("Changing the number of secondaries from %d to %d" % (current, current + s))
             current += s
             
-            assert r.db(dbName).table(tableName).config() \
-                .update({'shards':[
-                    {'primary_replica':primary.name,
-                     'replicas':[primary.name] + [x.name for x in replicaPool[:current]]}
-                ]}).run(conn)['errors'] == 0
-            r.db(dbName).wait(wait_for="all_replicas_ready").run(conn) # ToDo: add timeout when avalible
+            with workload.reconfiguration("%d secondaries" % current):
+                assert r.db(dbName).table(tableName).config() \
+                    .update({'shards':[
+                        {'primary_replica':primary.name,
+                         'replicas':[primary.name] + [x.name for x in replicaPool[:current]]}
+                    ]}).run(conn)['errors'] == 0
+                r.db(dbName).wait(wait_for="all_replicas_ready").run(conn) # ToDo: add timeout when avalible
             
             cluster.check()
             res = list(r.db('rethinkdb').table('current_issues').filter(r.row["type"] != "memory_error").run(conn))
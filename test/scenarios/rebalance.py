@@ -59,8 +59,9 @@ class Rebalance(rdb_unittest.RdbTestCase):
             for currentShards in opts["sequence"]:
                 
                 utils.print_with_time("Sharding table to %d shards" % currentShards)
-                self.table.reconfigure(shards=currentShards, replicas=opts["num-nodes"]).run(self.conn)
-                self.table.wait(wait_for='all_replicas_ready').run(self.conn)
+                with workload.reconfiguration("%d shards" % currentShards):
+                    self.table.reconfigure(shards=currentShards, replicas=opts["num-nodes"]).run(self.conn)
+                    self.table.wait(wait_for='all_replicas_ready').run(self.conn)
                 self.checkCluster()
             
             utils.print_with_time("Running workload after")